@@ -85,6 +85,27 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Local memory is per process; point this at Redis/Memcached when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'exam-seat-plan',
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    }
+}
+
+# Seconds a public roll lookup stays cached (entries are also dropped on every allocation change)
+SEAT_LOOKUP_CACHE_TIMEOUT = 60 * 60
+
+# Seconds a room snapshot (seat grid) stays cached; keys carry the room's allocation version
+ROOM_SNAPSHOT_CACHE_TIMEOUT = 60 * 60 * 24
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -121,5 +142,31 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Generated files (cached PDFs, exports)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Seat plan / attendance PDF renderer: 'html' (xhtml2pdf templates) or 'canvas' (direct ReportLab drawing).
+# Views accept ?backend= to override it per request.
+PDF_BACKEND = 'html'
+
+# Master plan: rolls of a class in one room are listed as one range while each is less than this
+# far from the previous one. The plan is stored precomputed; run `manage.py rebuild_master_plan`
+# after changing it. Exports accept ?gap= to compress with another value on the fly.
+MASTER_PLAN_RANGE_GAP = 100
+
+# Allocation previews can be saved for this long (seconds), as long as the room is unchanged
+ALLOCATION_PREVIEW_MAX_AGE = 60 * 60
+
+# Seconds the anti_cheat_max allocator may spend improving one room's placement
+# (it stops earlier once every seat or student is used)
+ANTI_CHEAT_TIME_BUDGET = 0.5
+
+# A worker bumps its running job's heartbeat every JOB_HEARTBEAT_INTERVAL seconds;
+# a job whose heartbeat is older than JOB_STALE_AFTER has lost its worker and is
+# queued again by the next worker to look for work (None disables it)
+JOB_HEARTBEAT_INTERVAL = 60
+JOB_STALE_AFTER = 5 * 60
+
 # Redirect to Admin Login if @staff_member_required fails
 LOGIN_URL = '/admin/login/'
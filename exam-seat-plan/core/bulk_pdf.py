@@ -0,0 +1,107 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.utils.text import slugify
+
+from .pdf_cache import get_cached_pdf, room_fingerprint, store_pdf
+from .pdf_views import (
+    attendance_html, html_to_pdf, pdf_cache_key, render_attendance_pdf, render_room_pdf,
+    room_allocations, room_pdf_html,
+)
+from .streaming import ZipStream
+
+
+def _timed(render, *args):
+    # Runs in a worker process for the html backend
+    start = time.perf_counter()
+    pdf = render(*args)
+    return pdf, time.perf_counter() - start
+
+
+def iter_room_pdf_zip(rooms, report, workers=None, backend='html'):
+    """
+    Yields a ZIP archive (as byte chunks) with every room's seat plan and
+    attendance sheet. HTML is built here (it needs the DB); xhtml2pdf runs in
+    a process pool sized to the CPU count. Members are written in completion
+    order, so a slow room never holds up the others. PDFs already in the PDF
+    cache are reused; fresh renders are stored there.
+
+    With backend='canvas' the documents are drawn directly with ReportLab.
+    That is quick enough to do inline, so no pool is started.
+
+    `report` is filled with one dict per document:
+    {'room', 'document', 'seconds', 'cached', 'error'}.
+    A plain-text copy is added to the archive as report.txt.
+    """
+    archive = ZipStream()
+    executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count()) if backend == 'html' else None
+    pending = {}
+    try:
+        for room in rooms:
+            folder = f'{room.id:03d}-{slugify(room.name) or "room"}'
+            fingerprint = room_fingerprint(room)
+            allocations = room_allocations(room)
+
+            if backend == 'html':
+                jobs = [('seat_plan', room_pdf_html)]
+                attendance = lambda r: attendance_html(r, allocations)
+            else:
+                jobs = [('seat_plan', lambda r: render_room_pdf(r, backend))]
+                attendance = lambda r: render_attendance_pdf(r, allocations, backend)
+            if allocations.exists():
+                jobs.append(('attendance', attendance))
+            else:
+                report.append({'room': room.name, 'document': 'attendance', 'seconds': 0, 'cached': False,
+                               'error': 'No students allocated'})
+
+            for document, build in jobs:
+                name = f'{folder}/{document}.pdf'
+                key = pdf_cache_key('room' if document == 'seat_plan' else 'attendance', room.id, backend)
+                pdf = get_cached_pdf(key, fingerprint)
+                if pdf is not None:
+                    report.append({'room': room.name, 'document': document, 'seconds': 0, 'cached': True, 'error': None})
+                    yield archive.add(name, pdf)
+                    continue
+                if executor is None:
+                    yield from _add_rendered(archive, report, (room, document, key, fingerprint, name),
+                                             lambda: _timed(build, room))
+                    continue
+                future = executor.submit(_timed, html_to_pdf, build(room))
+                pending[future] = (room, document, key, fingerprint, name)
+
+        for future in as_completed(pending):
+            yield from _add_rendered(archive, report, pending[future], future.result)
+
+        yield archive.add('report.txt', format_report(report))
+        yield archive.close()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _add_rendered(archive, report, member, result):
+    """Stores and archives one rendered document; result() returns (pdf, seconds)."""
+    room, document, key, fingerprint, name = member
+    entry = {'room': room.name, 'document': document, 'seconds': 0, 'cached': False, 'error': None}
+    try:
+        pdf, seconds = result()
+        entry['seconds'] = round(seconds, 3)
+    except Exception as e:
+        # One broken room must not sink the whole archive
+        pdf = None
+        entry['error'] = f'Render failed: {e.__class__.__name__}'
+    if pdf is None:
+        entry['error'] = entry['error'] or 'Render failed'
+    else:
+        store_pdf(key, fingerprint, pdf)
+        yield archive.add(name, pdf)
+    report.append(entry)
+
+
+def format_report(report):
+    lines = [f"{'room':<30} {'document':<12} {'seconds':>8}  status"]
+    for entry in report:
+        status = entry['error'] or ('cached' if entry['cached'] else 'rendered')
+        lines.append(f"{entry['room'][:30]:<30} {entry['document']:<12} {entry['seconds']:>8.3f}  {status}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,220 @@
+import hashlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .master_plan import master_plan_groups, refresh_master_plan
+from .models import PlanVersion, Room, Seat, SeatAllocation
+
+SEAT_LOOKUP_TIMEOUT = getattr(settings, 'SEAT_LOOKUP_CACHE_TIMEOUT', 60 * 60)
+# Above this many rolls, invalidating key by key costs more than starting over
+SEAT_LOOKUP_BULK_INVALIDATE = 5000
+
+_GENERATION_KEY = 'seat-lookup:generation'
+_HITS_KEY = 'seat-lookup:hits'
+_MISSES_KEY = 'seat-lookup:misses'
+_NOT_ALLOCATED = {}
+
+
+def _generation():
+    generation = cache.get(_GENERATION_KEY)
+    if generation is None:
+        cache.add(_GENERATION_KEY, 1, None)
+        generation = cache.get(_GENERATION_KEY, 1)
+    return generation
+
+
+def _lookup_key(roll, generation):
+    # Rolls come straight from the search box, hash them into a safe cache key
+    digest = hashlib.md5(roll.encode('utf-8')).hexdigest()
+    return f'seat-lookup:{generation}:{digest}'
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def lookup_seat(roll):
+    """
+    Returns {'roll_number', 'room_name', 'room_id', 'row', 'col', 'department', 'semester'}
+    for an allocated roll, or None. Hits (including cached "not allocated") are
+    served from the cache without touching the database.
+    """
+    key = _lookup_key(roll, _generation())
+    entry = cache.get(key)
+    if entry is not None:
+        _count(_HITS_KEY)
+        return entry or None
+
+    _count(_MISSES_KEY)
+    row = SeatAllocation.objects.filter(student__roll_number=roll, seat__isnull=False).values_list(
+        'seat__room__name', 'seat__room_id', 'seat__row', 'seat__col',
+        'student__department__code', 'student__semester__number',
+    ).first()
+
+    entry = _NOT_ALLOCATED
+    if row:
+        room_name, room_id, seat_row, seat_col, department, semester = row
+        entry = {
+            'roll_number': roll,
+            'room_name': room_name,
+            'room_id': room_id,
+            'row': seat_row,
+            'col': seat_col,
+            'department': department,
+            'semester': semester,
+        }
+    cache.set(key, entry, SEAT_LOOKUP_TIMEOUT)
+    return entry or None
+
+
+def invalidate_seat_lookups(rolls):
+    """
+    Drops cached lookups for `rolls` (any iterable of roll strings, e.g. RollIntervals).
+    Runs immediately and again on commit, so a lookup racing the write
+    transaction cannot leave a stale entry behind.
+    """
+    rolls = rolls if hasattr(rolls, '__len__') else list(rolls)
+    if not rolls:
+        return
+
+    def invalidate():
+        if len(rolls) > SEAT_LOOKUP_BULK_INVALIDATE:
+            # Orphan every cached lookup at once; old entries simply expire
+            _generation()
+            try:
+                cache.incr(_GENERATION_KEY)
+            except ValueError:
+                pass
+            return
+        generation = _generation()
+        cache.delete_many([_lookup_key(roll, generation) for roll in rolls])
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def seat_lookup_stats():
+    hits = cache.get(_HITS_KEY, 0)
+    misses = cache.get(_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
+
+
+def _count_subquery(seats):
+    counted = seats.order_by().values('room_id').annotate(n=Count('id')).values('n')
+    return Coalesce(Subquery(counted), 0)
+
+
+def room_counters():
+    """Room.update() kwargs that recount total/active/occupied seats in the same UPDATE."""
+    seats = Seat.objects.filter(room=OuterRef('pk'))
+    return {
+        'total_seats': _count_subquery(seats),
+        'active_seats': _count_subquery(seats.filter(is_active=True)),
+        'occupied_seats': _count_subquery(seats.filter(allocation__isnull=False)),
+    }
+
+
+def refresh_room_counters(room_ids=None):
+    """Recounts the seat counters of `room_ids` (every room if None) in one query."""
+    rooms = Room.objects.all() if room_ids is None else Room.objects.filter(id__in=room_ids)
+    return rooms.update(**room_counters())
+
+
+def allocation_changed(room_ids=(), rolls=(), groups=()):
+    """
+    Records a write to the seat plan. Call it inside the write's transaction,
+    after the write: bumps the version of every room in `room_ids` and the
+    global plan version (so ETags change in every worker at commit), recounts
+    those rooms' seat counters and drops cached lookups of `rolls`.
+
+    Writes that seat or unseat students (any `rolls` or `groups` given) also
+    rebuild the master plan ranges of the classes listed in or seated in
+    those rooms, plus `groups` ((semester_id, department_id) pairs). Layout-only
+    writes pass room_ids alone and leave the master plan as it is.
+    """
+    changed_at = timezone.now()
+    room_ids = set(room_ids)
+    with transaction.atomic():
+        if room_ids:
+            Room.objects.filter(id__in=room_ids).update(
+                allocation_version=F('allocation_version') + 1, allocation_changed_at=changed_at,
+                **room_counters()
+            )
+        if rolls or groups:
+            refresh_master_plan(set(groups) | (master_plan_groups(room_ids) if room_ids else set()))
+        if not PlanVersion.objects.filter(pk=1).update(version=F('version') + 1, changed_at=changed_at):
+            PlanVersion.objects.create(pk=1, version=2, changed_at=changed_at)
+    invalidate_seat_lookups(rolls)
+
+
+@contextmanager
+def students_changed(students):
+    """
+    allocation_changed around an edit or delete of a Student queryset:
+    their rolls and rooms are read on entry, the change is recorded on exit.
+
+        with transaction.atomic(), students_changed(students):
+            students.delete()
+    """
+    rows = list(students.values_list('roll_number', 'seatallocation__seat__room_id', 'semester_id', 'department_id'))
+    yield
+    allocation_changed(
+        room_ids={room_id for _, room_id, *_ in rows if room_id},
+        rolls=[roll for roll, *_ in rows],
+        # A deleted room takes its plan entries with it; its classes' ranges elsewhere still need a rebuild
+        groups={(sem, dept) for _, room_id, sem, dept in rows if room_id},
+    )
+
+
+def room_version(room_id):
+    """(allocation_version, allocation_changed_at) of a room, or None if it does not exist."""
+    return Room.objects.filter(id=room_id).values_list('allocation_version', 'allocation_changed_at').first()
+
+
+def plan_version():
+    """(version, changed_at) of the whole plan."""
+    plan = PlanVersion.current()
+    return plan.version, plan.changed_at
+
+
+# Conditional GET helpers for django.views.decorators.http.condition. The
+# version row is fetched once per request and shared by the ETag and
+# Last-Modified callbacks.
+
+def _memo(request, key, fetch):
+    memo = request.__dict__.setdefault('_plan_versions', {})
+    if key not in memo:
+        memo[key] = fetch()
+    return memo[key]
+
+
+def room_etag(request, room_id, *args, **kwargs):
+    version = _memo(request, ('room', room_id), lambda: room_version(room_id))
+    return f'room-{room_id}-v{version[0]}' if version else None
+
+
+def room_last_modified(request, room_id, *args, **kwargs):
+    version = _memo(request, ('room', room_id), lambda: room_version(room_id))
+    return version[1] if version else None
+
+
+def plan_etag(request, *args, **kwargs):
+    return f'plan-v{_memo(request, "plan", plan_version)[0]}'
+
+
+def plan_last_modified(request, *args, **kwargs):
+    return _memo(request, 'plan', plan_version)[1]
@@ -0,0 +1,157 @@
+"""
+Exam plan files for headless bulk allocation (`manage.py allocate_plan`).
+
+A plan is a JSON object:
+
+    {
+      "algorithm": "anti_cheat",
+      "departments": [{"code": "CSE", "name": "Computer Science"}],
+      "semesters": [{"number": 1, "name": "1st Semester"}],
+      "rooms": ["A-101", {"name": "A-102", "layout": "2#.4#*8"}, {"name": "Hall", "rows": 20, "cols": 10}],
+      "batches": [{"department": "CSE", "semester": 1, "rolls": "1001-1120, -1007"}]
+    }
+
+Rooms are filled in the order listed. A room given as a plain name must
+already exist; one given with a layout (core.layout text) or rows/cols is
+created when no room has that name. Departments and semesters are likewise
+only created when missing, so one file can set up a fresh database and run
+the exam on it. Roll strings use the same syntax as the allocation form.
+"""
+import json
+from collections import defaultdict
+
+from .layout import SeatBitmap, decode_layout, encode_layout
+from .models import Department, Room, Semester
+from .services import create_rooms_from_layout
+from .utils import ALGORITHMS, parse_roll_intervals
+
+
+class PlanError(ValueError):
+    pass
+
+
+def _room_spec(index, spec):
+    if isinstance(spec, str):
+        return spec.strip(), None
+    if not isinstance(spec, dict) or not str(spec.get('name') or '').strip():
+        raise PlanError(f'rooms[{index}]: expected a name or {{"name", "layout" | "rows", "cols"}}')
+    name = str(spec['name']).strip()
+    try:
+        if spec.get('layout'):
+            layout = decode_layout(spec['layout'])
+        elif spec.get('rows') or spec.get('cols'):
+            layout = SeatBitmap.full(int(spec['rows']), int(spec['cols']))
+        else:
+            layout = None
+    except (KeyError, TypeError, ValueError) as e:
+        raise PlanError(f'rooms[{index}] ({name}): bad layout: {e}')
+    if layout is not None and not (layout.rows > 0 and layout.cols > 0):
+        raise PlanError(f'rooms[{index}] ({name}): rows and cols must be positive')
+    return name, layout
+
+
+def parse_plan(text):
+    """
+    Validates plan JSON without touching the database. Returns a dict with
+    'algorithm', 'departments' {code: name}, 'semesters' {number: name},
+    'rooms' [(name, SeatBitmap or None)] and 'batches' [(code, number, RollIntervals)].
+    Raises PlanError.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise PlanError(f'Not valid JSON: {e}')
+    if not isinstance(data, dict):
+        raise PlanError('The plan must be a JSON object')
+
+    algorithm = data.get('algorithm', 'linear_vertical')
+    if algorithm not in ALGORITHMS:
+        raise PlanError(f'Unknown algorithm {algorithm!r}; use one of: {", ".join(ALGORITHMS)}')
+
+    try:
+        departments = {str(d['code']).strip(): d.get('name') or d['code'] for d in data.get('departments') or []}
+        semesters = {int(s['number']): s.get('name') or f"Semester {s['number']}" for s in data.get('semesters') or []}
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise PlanError('departments need a "code" and semesters a "number"')
+
+    rooms = [_room_spec(i, spec) for i, spec in enumerate(data.get('rooms') or [])]
+    names = [name for name, _ in rooms]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise PlanError(f'Rooms listed twice: {", ".join(duplicates)}')
+
+    batches = []
+    for i, spec in enumerate(data.get('batches') or []):
+        try:
+            code, number = str(spec['department']).strip(), int(spec['semester'])
+            rolls = parse_roll_intervals(str(spec.get('rolls') or ''))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise PlanError(f'batches[{i}]: needs "department", "semester" and "rolls" ({e})')
+        if not rolls:
+            raise PlanError(f'batches[{i}] ({code} sem {number}): no rolls')
+        batches.append((code, number, rolls))
+
+    if not rooms or not batches:
+        raise PlanError('The plan needs at least one room and one batch')
+    return {
+        'algorithm': algorithm, 'departments': departments, 'semesters': semesters,
+        'rooms': rooms, 'batches': batches,
+    }
+
+
+def resolve_plan(plan):
+    """
+    Loads the plan's departments, semesters and rooms (one query each),
+    creating the missing ones the plan defines. Returns (rooms in plan order,
+    [(Department, Semester, RollIntervals)], {'departments', 'semesters', 'rooms'}
+    counts created). Raises PlanError for names it can neither find nor create.
+    Call it inside a transaction.
+    """
+    created = {'departments': 0, 'semesters': 0, 'rooms': 0}
+
+    departments = {d.code: d for d in Department.objects.filter(code__in=plan['departments'].keys() | {
+        code for code, _, _ in plan['batches']})}
+    for code, name in plan['departments'].items():
+        if code not in departments:
+            departments[code] = Department.objects.create(code=code, name=name)
+            created['departments'] += 1
+
+    semesters = {s.number: s for s in Semester.objects.filter(number__in=plan['semesters'].keys() | {
+        number for _, number, _ in plan['batches']})}
+    for number, name in plan['semesters'].items():
+        if number not in semesters:
+            semesters[number] = Semester.objects.create(number=number, name=name)
+            created['semesters'] += 1
+
+    unknown = sorted({f'department {code}' for code, _, _ in plan['batches'] if code not in departments}
+                     | {f'semester {number}' for _, number, _ in plan['batches'] if number not in semesters})
+    if unknown:
+        raise PlanError(f'Not in the database or the plan: {", ".join(unknown)}')
+
+    names = [name for name, _ in plan['rooms']]
+    existing = defaultdict(list)
+    for room in Room.objects.filter(name__in=names):
+        existing[room.name].append(room)
+    ambiguous = sorted(name for name, found in existing.items() if len(found) > 1)
+    if ambiguous:
+        raise PlanError(f'Several rooms share the name: {", ".join(ambiguous)}')
+    missing = [name for name, layout in plan['rooms'] if name not in existing and layout is None]
+    if missing:
+        raise PlanError(f'Unknown rooms (give a layout or rows/cols to create them): {", ".join(missing)}')
+
+    # Rooms of one layout are created together (their seats go in as a few bulk inserts)
+    to_create = defaultdict(list)
+    layouts = {}
+    for name, layout in plan['rooms']:
+        if name not in existing:
+            key = (layout.rows, layout.cols, encode_layout(layout))
+            layouts[key] = layout
+            to_create[key].append(name)
+    for key, room_names in to_create.items():
+        for room in create_rooms_from_layout(room_names, layouts[key]):
+            existing[room.name].append(room)
+            created['rooms'] += 1
+
+    rooms = [existing[name][0] for name in names]
+    batches = [(departments[code], semesters[number], rolls) for code, number, rolls in plan['batches']]
+    return rooms, batches, created
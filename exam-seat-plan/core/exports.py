@@ -0,0 +1,145 @@
+"""
+Machine-readable exports of the full allocation (CSV and XLSX).
+
+Rows are read with values_list().iterator() and written out a block at a
+time, so an export of 100k+ allocations streams with flat memory, whether to
+a StreamingHttpResponse or to a file (`manage.py export_allocations`). The
+XLSX writer produces a minimal SpreadsheetML workbook by hand (inline
+strings, one sheet) through ZipStream; openpyxl is not needed.
+"""
+import csv
+import io
+from xml.sax.saxutils import escape
+
+from .models import SeatAllocation
+from .streaming import ZipStream
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+EXPORT_ORDERS = {
+    'seat': ('seat__room__name', 'seat__room_id', 'seat__row', 'seat__col'),
+    'roll': ('student__roll_prefix', 'student__roll_num', 'student__roll_number'),
+}
+EXPORT_HEADER = ['roll_number', 'department', 'department_name', 'semester', 'semester_name', 'room', 'row', 'col']
+EXPORT_CHUNK_SIZE = 2000
+# Rows per yielded block; one block is the unit of memory and of network writes
+_BLOCK_ROWS = 500
+
+
+def allocation_rows(room_ids=None, department_id=None, semester_id=None, order='seat'):
+    """
+    Streams one tuple per seated student, columns as EXPORT_HEADER, filtered
+    by rooms/department/semester and ordered by seat (room, row, col) or by roll.
+    """
+    allocations = SeatAllocation.objects.filter(seat__isnull=False)
+    if room_ids:
+        allocations = allocations.filter(seat__room_id__in=room_ids)
+    if department_id:
+        allocations = allocations.filter(student__department_id=department_id)
+    if semester_id:
+        allocations = allocations.filter(student__semester_id=semester_id)
+    return allocations.order_by(*EXPORT_ORDERS[order]).values_list(
+        'student__roll_number', 'student__department__code', 'student__department__name',
+        'student__semester__number', 'student__semester__name',
+        'seat__room__name', 'seat__row', 'seat__col',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _blocks(rows, size=_BLOCK_ROWS):
+    block = []
+    for row in rows:
+        block.append(row)
+        if len(block) >= size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def iter_csv(rows, header=EXPORT_HEADER):
+    """UTF-8 CSV as byte blocks, header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue().encode('utf-8')
+    for block in _blocks(rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(block)
+        yield buffer.getvalue().encode('utf-8')
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def _xlsx_cell(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    if value is None:
+        return '<c/>'
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def _sheet_xml(rows, header):
+    yield (_SHEET_HEAD + '<row>' + ''.join(map(_xlsx_cell, header)) + '</row>').encode('utf-8')
+    for block in _blocks(rows):
+        yield ''.join('<row>' + ''.join(map(_xlsx_cell, row)) + '</row>' for row in block).encode('utf-8')
+    yield _SHEET_TAIL.encode('utf-8')
+
+
+def iter_xlsx(rows, header=EXPORT_HEADER, sheet_name='Allocations'):
+    """Single-sheet XLSX workbook as byte chunks; the sheet is deflated as it streams."""
+    archive = ZipStream()
+    yield archive.add('[Content_Types].xml', _CONTENT_TYPES)
+    yield archive.add('_rels/.rels', _ROOT_RELS)
+    yield archive.add('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name, {'"': '&quot;'})))
+    yield archive.add('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+    yield from archive.add_stream('xl/worksheets/sheet1.xml', _sheet_xml(rows, header))
+    yield archive.close()
+
+
+def iter_export(rows, export_format):
+    return iter_xlsx(rows) if export_format == 'xlsx' else iter_csv(rows)
+
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
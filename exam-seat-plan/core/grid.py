@@ -0,0 +1,161 @@
+"""
+Room snapshots: one compact, cached picture of a room's seats and occupants.
+
+The room pages, allocate_view and the seat plan PDF all draw the same
+rows x cols grid. A snapshot is built from a single values_list query into
+flat arrays indexed by (row - 1) * cols + (col - 1) and cached under the
+room's allocation_version, so every write through caching.allocation_changed
+moves readers on to a fresh snapshot and no Seat objects are materialized
+on a page view. Rooms nobody is seated in (one EXISTS query) are drawn from
+the packed layout bitmap alone, without reading the Seat table.
+"""
+import hashlib
+from array import array
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .layout import SeatBitmap
+from .models import Seat, SeatAllocation
+
+ROOM_SNAPSHOT_TIMEOUT = getattr(settings, 'ROOM_SNAPSHOT_CACHE_TIMEOUT', 60 * 60 * 24)
+
+# What templates and the PDF renderers see for one seat
+SeatCell = namedtuple('SeatCell', [
+    'row', 'col', 'seat_id', 'is_active',
+    'allocation_id', 'student_id', 'roll_number',
+    'department_id', 'department_code', 'department_name',
+    'semester_id', 'semester_number', 'semester_name',
+])
+
+_NO_GROUP = (None, '', '', None, '', '')
+
+# RoomSnapshot.seats values
+NO_SEAT, INACTIVE, ACTIVE = 0, 1, 2
+
+
+class RoomSnapshot:
+    """
+    Seats of one room as flat arrays. seats[i] is NO_SEAT (a gap), INACTIVE or
+    ACTIVE; seat_ids[i] is 0 when unknown (snapshots drawn from the layout
+    bitmap) and allocation_ids[i] == 0 marks an empty seat. groups holds one
+    (dept id, code, name, sem id, number, name) tuple per class present;
+    group_index[i] points into it (-1 for empty seats).
+    """
+
+    def __init__(self, rows, cols, version):
+        size = rows * cols
+        self.rows = rows
+        self.cols = cols
+        self.version = version
+        self.seat_ids = array('q', bytes(8 * size))
+        self.seats = bytearray(size)
+        self.allocation_ids = array('q', bytes(8 * size))
+        self.student_ids = array('q', bytes(8 * size))
+        self.rolls = [''] * size
+        self.group_index = array('l', [-1]) * size
+        self.groups = []
+        self.digest = ''
+
+    @classmethod
+    def build(cls, room):
+        layout = SeatBitmap.for_room(room)
+        # Asked of the database: the room's occupied_seats may predate the latest write
+        if layout is not None and not SeatAllocation.objects.filter(seat__room=room).exists():
+            return cls.from_layout(room, layout)
+
+        snapshot = cls(room.rows, room.cols, room.allocation_version)
+        groups = {}
+        seats = Seat.objects.filter(room=room, row__lte=room.rows, col__lte=room.cols).values_list(
+            'id', 'row', 'col', 'is_active',
+            'allocation__id', 'allocation__student_id', 'allocation__student__roll_number',
+            'allocation__student__department_id', 'allocation__student__department__code',
+            'allocation__student__department__name',
+            'allocation__student__semester_id', 'allocation__student__semester__number',
+            'allocation__student__semester__name',
+        )
+        for seat_id, row, col, is_active, allocation_id, student_id, roll, *group in seats.iterator(chunk_size=2000):
+            i = (row - 1) * room.cols + (col - 1)
+            snapshot.seat_ids[i] = seat_id
+            snapshot.seats[i] = ACTIVE if is_active else INACTIVE
+            if allocation_id:
+                snapshot.allocation_ids[i] = allocation_id
+                snapshot.student_ids[i] = student_id
+                snapshot.rolls[i] = roll
+                group = tuple(group)
+                if group not in groups:
+                    groups[group] = len(snapshot.groups)
+                    snapshot.groups.append(group)
+                snapshot.group_index[i] = groups[group]
+        snapshot.digest = snapshot._hash()
+        return snapshot
+
+    @classmethod
+    def from_layout(cls, room, layout):
+        """Snapshot of an empty room: every cell is a seat, active as the bitmap says."""
+        snapshot = cls(room.rows, room.cols, room.allocation_version)
+        snapshot.seats[:] = bytes([INACTIVE]) * len(snapshot.seats)
+        for row, col in layout.active_cells():
+            snapshot.seats[(row - 1) * room.cols + (col - 1)] = ACTIVE
+        snapshot.digest = snapshot._hash()
+        return snapshot
+
+    def _hash(self):
+        # Seat ids are left out: the same picture hashes the same however it was built
+        digest = hashlib.sha1(f'{self.rows}x{self.cols}'.encode('utf-8'))
+        digest.update(bytes(self.seats))
+        digest.update('\n'.join(self.rolls).encode('utf-8'))
+        for i in range(len(self.rolls)):
+            if self.group_index[i] >= 0:
+                digest.update(repr(self.groups[self.group_index[i]]).encode('utf-8'))
+        return digest.hexdigest()
+
+    def cell(self, row, col):
+        """SeatCell at 1-based (row, col), or None for a gap."""
+        i = (row - 1) * self.cols + (col - 1)
+        if self.seats[i] == NO_SEAT:
+            return None
+        group = self.groups[self.group_index[i]] if self.group_index[i] >= 0 else _NO_GROUP
+        return SeatCell(
+            row, col, self.seat_ids[i] or None, self.seats[i] == ACTIVE,
+            self.allocation_ids[i] or None, self.student_ids[i] or None, self.rolls[i],
+            *group,
+        )
+
+    def grid(self):
+        """rows x cols list of SeatCell (None for a gap), ready for the templates."""
+        return [[self.cell(r, c) for c in range(1, self.cols + 1)] for r in range(1, self.rows + 1)]
+
+    def occupied(self):
+        """SeatCells of every allocated seat in seat order (row, then col)."""
+        for i, allocation_id in enumerate(self.allocation_ids):
+            if allocation_id:
+                yield self.cell(i // self.cols + 1, i % self.cols + 1)
+
+    @property
+    def seat_count(self):
+        return len(self.seats) - self.seats.count(NO_SEAT)
+
+    @property
+    def allocated_count(self):
+        return sum(1 for allocation_id in self.allocation_ids if allocation_id)
+
+
+def _snapshot_key(room):
+    # changed_at keeps keys unique even if a reset database hands out the same id/version again
+    changed_at = room.allocation_changed_at.timestamp()
+    return f'room-snapshot:{room.id}:v{room.allocation_version}:{changed_at}:{room.rows}x{room.cols}'
+
+
+def room_snapshot(room):
+    """
+    Cached RoomSnapshot of `room`. `room` must be fresh enough to carry the
+    current allocation_version/allocation_changed_at (re-fetch it after writing in the same request).
+    """
+    key = _snapshot_key(room)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = RoomSnapshot.build(room)
+        cache.set(key, snapshot, ROOM_SNAPSHOT_TIMEOUT)
+    return snapshot
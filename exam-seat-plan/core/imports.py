@@ -0,0 +1,240 @@
+"""
+Bulk student import from the registrar's CSV/XLSX lists.
+
+The file is read row by row (csv.reader over the open file; for XLSX an
+iterparse over the sheet inside the zip), Department codes and Semester
+numbers are resolved from maps loaded once, and students are upserted in
+fixed-size chunks, each chunk in its own transaction. A bad row never stops
+the import: it is counted and, up to MAX_REPORTED_ERRORS, reported with its
+line number.
+
+A header row is required; the allocation export (core/exports.py) can be
+imported as it is.
+"""
+import csv
+import io
+import os
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from django.db import transaction
+
+from .caching import students_changed
+from .models import Department, Semester, Student
+from .services import UPSERT_CHUNK_SIZE, upsert_student_chunk
+
+IMPORT_FORMATS = ('csv', 'xlsx')
+# Bad rows kept for the report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+HEADER_ALIASES = {
+    'roll_number': {'roll_number', 'roll', 'roll_no', 'roll no', 'roll number', 'roll no.'},
+    'department': {'department', 'dept', 'department_code', 'dept_code', 'department code'},
+    'semester': {'semester', 'sem', 'semester_number', 'semester no', 'semester number'},
+}
+
+_SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_CELL_COLUMN = re.compile(r'[A-Z]+')
+
+
+def import_format(filename):
+    """'csv' or 'xlsx' from a file name, or None."""
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    return extension if extension in IMPORT_FORMATS else None
+
+
+class CsvRows:
+    """(line number, [cell strings]) of a CSV file, streamed; `fraction` is how far it has read."""
+
+    def __init__(self, path):
+        self.path = path
+        self._size = os.path.getsize(path) or 1
+        self._raw = None
+
+    def __iter__(self):
+        with open(self.path, 'rb') as raw:
+            self._raw = raw
+            text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+            for line, row in enumerate(csv.reader(text), start=1):
+                yield line, row
+
+    @property
+    def fraction(self):
+        return self._raw.tell() / self._size if self._raw and not self._raw.closed else 1.0
+
+
+class XlsxRows:
+    """
+    (row number, [cell strings]) of the first worksheet of an XLSX file,
+    parsed incrementally. Only the shared string table is held in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._member = None
+        self._size = 1
+
+    def __iter__(self):
+        with zipfile.ZipFile(self.path) as workbook:
+            sheets = sorted(n for n in workbook.namelist() if re.fullmatch(r'xl/worksheets/sheet\d+\.xml', n))
+            if not sheets:
+                raise ValueError('The workbook has no worksheet')
+            sheet = 'xl/worksheets/sheet1.xml' if 'xl/worksheets/sheet1.xml' in sheets else sheets[0]
+            shared = self._shared_strings(workbook)
+            self._size = workbook.getinfo(sheet).file_size or 1
+            with workbook.open(sheet) as member:
+                self._member = member
+                yield from self._rows(member, shared)
+
+    @property
+    def fraction(self):
+        return self._member.tell() / self._size if self._member and not self._member.closed else 1.0
+
+    @staticmethod
+    def _shared_strings(workbook):
+        if 'xl/sharedStrings.xml' not in workbook.namelist():
+            return []
+        strings = []
+        with workbook.open('xl/sharedStrings.xml') as member:
+            for _, elem in iterparse(member):
+                if elem.tag == f'{_SHEET_NS}si':
+                    strings.append(''.join(t.text or '' for t in elem.iter(f'{_SHEET_NS}t')))
+                    elem.clear()
+        return strings
+
+    @staticmethod
+    def _rows(member, shared):
+        number = 0
+        for _, elem in iterparse(member):
+            if elem.tag != f'{_SHEET_NS}row':
+                continue
+            number = int(elem.get('r') or number + 1)
+            cells = []
+            for cell in elem.iter(f'{_SHEET_NS}c'):
+                ref = _CELL_COLUMN.match(cell.get('r') or '')
+                if ref:
+                    index = 0
+                    for letter in ref.group():
+                        index = index * 26 + ord(letter) - 64
+                    cells.extend([''] * (index - 1 - len(cells)))
+                cells.append(XlsxRows._value(cell, shared))
+            elem.clear()
+            yield number, cells
+
+    @staticmethod
+    def _value(cell, shared):
+        kind = cell.get('t')
+        if kind == 'inlineStr':
+            return ''.join(t.text or '' for t in cell.iter(f'{_SHEET_NS}t'))
+        value = cell.findtext(f'{_SHEET_NS}v') or ''
+        if kind == 's':
+            return shared[int(value)] if value else ''
+        if kind in (None, 'n') and value.endswith('.0'):
+            # Rolls typed as numbers come back as floats ("1001.0")
+            return value[:-2]
+        return value
+
+
+def open_rows(path, fmt=None):
+    fmt = fmt or import_format(path)
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f'Unsupported file type; use one of: {", ".join(IMPORT_FORMATS)}')
+    return XlsxRows(path) if fmt == 'xlsx' else CsvRows(path)
+
+
+def _header_columns(header):
+    names = [cell.strip().lower() for cell in header]
+    columns = {}
+    for field, aliases in HEADER_ALIASES.items():
+        for index, name in enumerate(names):
+            if name in aliases:
+                columns[field] = index
+                break
+    missing = [field for field in HEADER_ALIASES if field not in columns]
+    if missing:
+        raise ValueError(f'Missing column(s): {", ".join(missing)} (header row: {", ".join(header)})')
+    return columns
+
+
+def _semester_number(text):
+    number = float(text)
+    if not number.is_integer():
+        raise ValueError
+    return int(number)
+
+
+def import_students(rows, chunk_size=UPSERT_CHUNK_SIZE, progress=None):
+    """
+    Upserts students from `rows` (CsvRows/XlsxRows or any iterable of
+    (line, cells)), the first non-empty row being the header. Every chunk of
+    `chunk_size` good rows is committed on its own, recorded through
+    students_changed so moved students' rooms and master plan follow.
+    `progress(report, fraction)` is called after each chunk.
+
+    Returns {'rows', 'created', 'updated', 'unchanged', 'bad_rows', 'errors': [[line, message]]}.
+    Raises ValueError if the header lacks a roll/department/semester column.
+    """
+    departments = dict(Department.objects.values_list('code', 'id'))
+    semesters = dict(Semester.objects.values_list('number', 'id'))
+    report = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'bad_rows': 0, 'errors': []}
+
+    def bad(line, message):
+        report['bad_rows'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append([line, message])
+
+    def flush(chunk):
+        before = report['created'] + report['updated']
+        allocated = Student.objects.filter(roll_number__in=list(chunk), seatallocation__isnull=False)
+        with transaction.atomic(), students_changed(allocated):
+            upsert_student_chunk(chunk, report)
+        report['unchanged'] += len(chunk) - (report['created'] + report['updated'] - before)
+        if progress:
+            progress(report, getattr(rows, 'fraction', None))
+
+    columns = None
+    chunk = {}
+    for line, cells in rows:
+        if not any(cell.strip() for cell in cells):
+            continue
+        if columns is None:
+            columns = _header_columns(cells)
+            continue
+
+        report['rows'] += 1
+        get = lambda field: cells[columns[field]].strip() if columns[field] < len(cells) else ''
+        roll, code, semester = get('roll_number'), get('department'), get('semester')
+        if not roll:
+            bad(line, 'missing roll number')
+        elif len(roll) > Student._meta.get_field('roll_number').max_length:
+            bad(line, f'roll number {roll!r} is too long')
+        elif code not in departments:
+            bad(line, f'unknown department {code!r}')
+        else:
+            try:
+                semester_id = semesters[_semester_number(semester)]
+            except (KeyError, ValueError, OverflowError):
+                bad(line, f'unknown semester {semester!r}')
+                continue
+            chunk[roll] = (departments[code], semester_id)
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = {}
+
+    if columns is None:
+        raise ValueError('The file is empty')
+    if chunk:
+        flush(chunk)
+    return report
+
+
+def iter_error_csv(report):
+    """The bad-row report as CSV bytes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['line', 'error'])
+    writer.writerows(report['errors'])
+    if report['bad_rows'] > len(report['errors']):
+        writer.writerow(['', f"... and {report['bad_rows'] - len(report['errors'])} more"])
+    yield buffer.getvalue().encode('utf-8')
@@ -0,0 +1,295 @@
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Job
+
+JOB_DIR = Path(getattr(settings, 'JOB_DIR', Path(settings.MEDIA_ROOT) / 'jobs'))
+# A running job's worker bumps heartbeat_at this often (seconds) ...
+JOB_HEARTBEAT_INTERVAL = getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 60)
+# ... and a job whose heartbeat is older than this is assumed to have lost its worker (None: never requeue)
+JOB_STALE_AFTER = getattr(settings, 'JOB_STALE_AFTER', 5 * 60)
+
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """Registers `fn(job, ctx)` as the handler for jobs of `kind`. Its return value is stored as job.result."""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(kind, **params):
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    return Job.objects.create(kind=kind, params=params)
+
+
+def accepted_response(job):
+    """202 response handed back by views that queued work instead of doing it."""
+    return JsonResponse({
+        'status': 'queued',
+        'job_id': job.id,
+        'status_url': reverse('job_status', args=[job.id]),
+        'download_url': reverse('job_download', args=[job.id]),
+    }, status=202)
+
+
+def _claimed(job):
+    # The job's row, as long as this claim is still the one running it
+    return Job.objects.filter(id=job.id, status=Job.RUNNING, claim=job.claim)
+
+
+class JobContext:
+    def __init__(self, job):
+        self.job = job
+
+    def progress(self, percent, message=''):
+        _claimed(self.job).update(
+            progress=max(0, min(100, int(percent))), message=message[:255], heartbeat_at=timezone.now(),
+        )
+
+    def save_artifact(self, filename, data):
+        """Stores the finished file; `data` is bytes or an iterable of byte chunks."""
+        path = JOB_DIR / str(self.job.id) / filename
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as out:
+            if isinstance(data, bytes):
+                out.write(data)
+            else:
+                for chunk in data:
+                    out.write(chunk)
+        self.job.result_file = str(path.relative_to(Path(settings.MEDIA_ROOT)))
+        _claimed(self.job).update(result_file=self.job.result_file)
+        return path
+
+
+def artifact_path(job):
+    return Path(settings.MEDIA_ROOT) / job.result_file if job.result_file else None
+
+
+def requeue_stale(stale_after=None):
+    """
+    Puts running jobs whose heartbeat is more than `stale_after` seconds old
+    (default JOB_STALE_AFTER) back in the queue: their worker died without
+    marking them done or failed. Returns how many were requeued.
+    """
+    stale_after = JOB_STALE_AFTER if stale_after is None else stale_after
+    if stale_after is None:
+        return 0
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff).update(
+        status=Job.QUEUED, started_at=None, heartbeat_at=None, claim='', progress=0,
+        message='Requeued: the worker stopped responding',
+    )
+
+
+def claim_next():
+    """
+    Atomically moves the oldest queued job to running, after requeueing stale
+    running jobs. Safe with several workers, no row locks needed.
+    """
+    requeue_stale()
+    candidates = Job.objects.filter(status=Job.QUEUED).order_by('created_at').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        now = timezone.now()
+        claim = uuid.uuid4().hex
+        if Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=now, heartbeat_at=now, claim=claim,
+        ):
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def _heartbeat(job, stop):
+    # Keeps the claim alive while a handler runs without reporting progress
+    try:
+        while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+            _claimed(job).update(heartbeat_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def run_job(job):
+    """
+    Runs a claimed job and records its outcome, unless the job was requeued
+    (and possibly claimed by another worker) in the meantime.
+    """
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(job, stop), daemon=True)
+    beat.start()
+    try:
+        result = HANDLERS[job.kind](job, JobContext(job))
+    except Exception:
+        _claimed(job).update(
+            status=Job.FAILED, error=traceback.format_exc(), finished_at=timezone.now()
+        )
+    else:
+        _claimed(job).update(
+            status=Job.DONE, progress=100, result=result, finished_at=timezone.now()
+        )
+    finally:
+        stop.set()
+        beat.join()
+
+
+def work(poll_interval=1.0, once=False):
+    """Worker loop: runs queued jobs forever, or until the queue is empty when `once`."""
+    while True:
+        close_old_connections()
+        job = claim_next()
+        if job is not None:
+            run_job(job)
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
+
+
+# Handlers
+
+@job_handler('master_pdf')
+def master_pdf_job(job, ctx):
+    from .pdf_views import master_plan_fingerprint, render_master_plan_pdf
+    from .pdf_cache import cached_pdf
+
+    ctx.progress(10, 'Rendering master plan')
+    pdf = cached_pdf('master', master_plan_fingerprint(), render_master_plan_pdf)
+    if pdf is None:
+        raise RuntimeError('PDF render failed')
+    ctx.save_artifact('master_plan.pdf', pdf)
+
+
+@job_handler('room_pdf')
+def room_pdf_job(job, ctx):
+    from .models import Room
+    from .pdf_cache import cached_pdf, room_fingerprint
+    from .pdf_views import pdf_cache_key, render_room_pdf
+
+    room = Room.objects.get(id=job.params['room_id'])
+    backend = job.params.get('backend', 'html')
+    ctx.progress(10, f'Rendering {room.name}')
+    pdf = cached_pdf(pdf_cache_key('room', room.id, backend), room_fingerprint(room),
+                     lambda: render_room_pdf(room, backend))
+    if pdf is None:
+        raise RuntimeError('PDF render failed')
+    ctx.save_artifact(f'seat_plan_{room.id}.pdf', pdf)
+
+
+@job_handler('attendance_pdf')
+def attendance_pdf_job(job, ctx):
+    from .models import Room
+    from .pdf_cache import cached_pdf, room_fingerprint
+    from .pdf_views import pdf_cache_key, render_attendance_pdf, room_allocations
+
+    room = Room.objects.get(id=job.params['room_id'])
+    allocations = room_allocations(room)
+    if not allocations.exists():
+        raise RuntimeError('No students allocated to this room.')
+    backend = job.params.get('backend', 'html')
+    ctx.progress(10, f'Rendering {room.name}')
+    pdf = cached_pdf(pdf_cache_key('attendance', room.id, backend), room_fingerprint(room),
+                     lambda: render_attendance_pdf(room, allocations, backend))
+    if pdf is None:
+        raise RuntimeError('PDF render failed')
+    ctx.save_artifact(f'attendance_{room.id}.pdf', pdf)
+
+
+@job_handler('room_pdfs_zip')
+def room_pdfs_zip_job(job, ctx):
+    from .bulk_pdf import iter_room_pdf_zip
+    from .models import Room
+
+    rooms = Room.objects.order_by('name')
+    if job.params.get('room_ids'):
+        rooms = rooms.filter(id__in=job.params['room_ids'])
+    expected = max(1, 2 * rooms.count())
+    report = []
+
+    def chunks():
+        for chunk in iter_room_pdf_zip(rooms, report, backend=job.params.get('backend', 'html')):
+            ctx.progress(95 * len(report) / expected, f'{len(report)} of {expected} documents')
+            yield chunk
+
+    ctx.save_artifact('room_pdfs.zip', chunks())
+    return {'documents': report}
+
+
+@job_handler('allocate_batch')
+def allocate_batch_job(job, ctx):
+    from .models import Department, Room, Semester
+    from .services import allocate_batch
+    from .utils import parse_roll_intervals
+
+    params = job.params
+    room = Room.objects.get(id=params['room_id'])
+    rolls = parse_roll_intervals(params.get('student_data', ''))
+    ctx.progress(5, f'Allocating {len(rolls)} students')
+    stats = {}
+    new_allocations, unallocated = allocate_batch(
+        room,
+        Department.objects.get(id=params['department_id']),
+        Semester.objects.get(id=params['semester_id']),
+        rolls,
+        params.get('algorithm', 'linear'),
+        stats=stats,
+    )
+    result = {'allocated': len(new_allocations), 'unplaced_count': len(unallocated), 'unplaced': str(unallocated)}
+    if stats:
+        result['greedy'] = stats['greedy']
+    return result
+
+
+@job_handler('allocate_exam')
+def allocate_exam_job(job, ctx):
+    from .models import Department, Room, Semester
+    from .services import allocate_exam_batches
+    from .utils import parse_roll_intervals
+
+    params = job.params
+    rooms_by_id = Room.objects.in_bulk(params['room_ids'])
+    rooms = [rooms_by_id[rid] for rid in params['room_ids'] if rid in rooms_by_id]
+    departments = Department.objects.in_bulk([b['department_id'] for b in params['batches']])
+    semesters = Semester.objects.in_bulk([b['semester_id'] for b in params['batches']])
+    batches = [
+        (departments[b['department_id']], semesters[b['semester_id']], parse_roll_intervals(b.get('student_data', '')))
+        for b in params['batches']
+    ]
+    ctx.progress(5, f'Allocating {len(batches)} batches into {len(rooms)} rooms')
+    result = allocate_exam_batches(rooms, batches, params.get('algorithm', 'linear'))
+    return {
+        'rooms': result['rooms'],
+        'allocated': result['allocated'],
+        'unplaced_count': len(result['unplaced']),
+        'unplaced': str(result['unplaced']),
+    }
+
+
+@job_handler('import_students')
+def import_students_job(job, ctx):
+    from .imports import import_students, iter_error_csv, open_rows
+
+    path = Path(job.params['path'])
+    try:
+        rows = open_rows(str(path), job.params.get('format'))
+
+        def progress(report, fraction):
+            ctx.progress(99 * (fraction or 0), f"{report['rows']} rows read, {report['bad_rows']} bad")
+
+        report = import_students(rows, progress=progress)
+    finally:
+        path.unlink(missing_ok=True)
+    if report['bad_rows']:
+        ctx.save_artifact('import_errors.csv', iter_error_csv(report))
+    return report
@@ -0,0 +1,170 @@
+"""
+Packed seat layouts: Room.layout holds one bit per cell (row-major, 1 = an
+active seat), so layout-only work (resizing, drawing an empty room, counting
+capacity) never has to read the room's Seat rows.
+
+The bitmap is written in the same transaction as every layout change
+(room_create, room_edit, toggle_seat, set_seat_layout). A room whose bitmap
+does not match its size (created before the column existed, or seats written
+directly) is simply read from the Seat table; rebuild_room_layouts() or
+`manage.py rebuild_room_layouts` fills it in.
+"""
+import re
+from collections import defaultdict
+
+from .models import Room, Seat
+
+
+class SeatBitmap:
+    """rows x cols bits; cells are 1-based (row, col)."""
+
+    __slots__ = ('rows', 'cols', 'bits')
+
+    def __init__(self, rows, cols, data=None):
+        self.rows = rows
+        self.cols = cols
+        size = (rows * cols + 7) // 8
+        self.bits = bytearray(data) if data is not None else bytearray(size)
+
+    @classmethod
+    def full(cls, rows, cols):
+        bitmap = cls(rows, cols)
+        bitmap.bits[:] = b'\xff' * len(bitmap.bits)
+        tail = rows * cols % 8
+        if tail:
+            bitmap.bits[-1] = (1 << tail) - 1
+        return bitmap
+
+    @classmethod
+    def from_cells(cls, rows, cols, cells):
+        bitmap = cls(rows, cols)
+        for row, col in cells:
+            bitmap.set(row, col, True)
+        return bitmap
+
+    @classmethod
+    def for_room(cls, room):
+        """The room's stored bitmap, or None if it is missing or out of date with rows/cols."""
+        data = bytes(room.layout or b'')
+        if len(data) != (room.rows * room.cols + 7) // 8 or not room.rows * room.cols:
+            return None
+        return cls(room.rows, room.cols, data)
+
+    def _index(self, row, col):
+        if not (1 <= row <= self.rows and 1 <= col <= self.cols):
+            raise IndexError(f'R{row}C{col} is outside a {self.rows}x{self.cols} layout')
+        return (row - 1) * self.cols + (col - 1)
+
+    def __getitem__(self, cell):
+        i = self._index(*cell)
+        return bool(self.bits[i >> 3] >> (i & 7) & 1)
+
+    def set(self, row, col, active):
+        i = self._index(row, col)
+        if active:
+            self.bits[i >> 3] |= 1 << (i & 7)
+        else:
+            self.bits[i >> 3] &= ~(1 << (i & 7)) & 0xff
+
+    def resized(self, rows, cols):
+        """Copy at a new size; cells that survive keep their flag, new cells are active."""
+        bitmap = SeatBitmap.full(rows, cols)
+        for row in range(1, min(rows, self.rows) + 1):
+            for col in range(1, min(cols, self.cols) + 1):
+                if not self[row, col]:
+                    bitmap.set(row, col, False)
+        return bitmap
+
+    def active_cells(self):
+        """(row, col) of every active seat, row-major."""
+        for byte_index, byte in enumerate(self.bits):
+            while byte:
+                low = byte & -byte
+                i = byte_index * 8 + low.bit_length() - 1
+                byte ^= low
+                yield i // self.cols + 1, i % self.cols + 1
+
+    def count(self):
+        return sum(bin(byte).count('1') for byte in self.bits)
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+
+# Compact text: rows separated by '/', each row run-length encoded with '#'
+# (active seat) and '.' (no seat / walkway), e.g. "2#.3#" == "##.###". A
+# trailing "*n" repeats a row n times: "6#*10/.5#" is ten full rows of six
+# followed by one row with the first seat missing.
+_RUN = re.compile(r'(\d*)([#.])')
+
+
+def encode_layout(bitmap):
+    rows = []
+    for row in range(1, bitmap.rows + 1):
+        line = ''.join('#' if bitmap[row, col] else '.' for col in range(1, bitmap.cols + 1))
+        encoded = ''.join(
+            (str(len(run.group())) if len(run.group()) > 1 else '') + run.group()[0]
+            for run in re.finditer(r'#+|\.+', line)
+        )
+        if rows and rows[-1][0] == encoded:
+            rows[-1][1] += 1
+        else:
+            rows.append([encoded, 1])
+    return '/'.join(encoded if count == 1 else f'{encoded}*{count}' for encoded, count in rows)
+
+
+def decode_layout(text):
+    """SeatBitmap from encode_layout() text; raises ValueError on malformed input."""
+    lines = []
+    for part in text.strip().split('/'):
+        encoded, _, repeat = part.strip().partition('*')
+        if not re.fullmatch(r'(?:\d*[#.])+', encoded):
+            raise ValueError(f'Bad layout row: {part!r}')
+        line = ''.join(char * int(count or 1) for count, char in _RUN.findall(encoded))
+        lines.extend([line] * int(repeat or 1))
+    cols = len(lines[0]) if lines else 0
+    if not cols or any(len(line) != cols for line in lines):
+        raise ValueError('Every layout row must have the same number of seats')
+    return SeatBitmap.from_cells(len(lines), cols, [
+        (r, c) for r, line in enumerate(lines, start=1) for c, char in enumerate(line, start=1) if char == '#'
+    ])
+
+
+def layouts_from_seats(rooms):
+    """{room.id: SeatBitmap} computed from the Seat table for `rooms`, in one query."""
+    active = defaultdict(list)
+    seats = Seat.objects.filter(room__in=rooms, is_active=True).order_by().values_list('room_id', 'row', 'col')
+    for room_id, row, col in seats.iterator(chunk_size=5000):
+        active[room_id].append((row, col))
+    return {
+        room.id: SeatBitmap.from_cells(
+            room.rows, room.cols, [(r, c) for r, c in active[room.id] if r <= room.rows and c <= room.cols]
+        )
+        for room in rooms
+    }
+
+
+def rebuild_room_layouts(room_ids=None):
+    """
+    Recomputes Room.layout from the Seat table (one query for the seats, one
+    bulk update). Returns the number of rooms written.
+    """
+    rooms = Room.objects.all() if room_ids is None else Room.objects.filter(id__in=room_ids)
+    rooms = list(rooms.only('id', 'rows', 'cols'))
+    layouts = layouts_from_seats(rooms)
+    for room in rooms:
+        room.layout = layouts[room.id].to_bytes()
+    Room.objects.bulk_update(rooms, ['layout'], batch_size=500)
+    return len(rooms)
+
+
+def save_room_layout(room, bitmap=None):
+    """
+    Stores `bitmap` as the room's layout, or recomputes it from the Seat table
+    when None (the room had no usable bitmap to update). Call it inside the
+    transaction that changed the seats.
+    """
+    if bitmap is None:
+        bitmap = layouts_from_seats([room])[room.id]
+    room.layout = bitmap.to_bytes()
+    Room.objects.filter(id=room.id).update(layout=room.layout)
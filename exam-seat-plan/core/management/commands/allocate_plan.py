@@ -0,0 +1,79 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.exam_plan import PlanError, parse_plan, resolve_plan
+from core.services import PhaseTimer, allocate_exam_batches
+from core.utils import ALGORITHMS
+
+
+class Command(BaseCommand):
+    help = (
+        'Allocate a whole exam from a plan file (rooms, batches, algorithm; see core/exam_plan.py) '
+        'and print the time spent in each phase.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan', help='Plan JSON file ("-" for stdin)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Run every phase but the write and roll everything back')
+        parser.add_argument('--algorithm', choices=ALGORITHMS, help='Override the algorithm given in the plan')
+
+    def handle(self, *args, **options):
+        timer = PhaseTimer()
+        started = time.perf_counter()
+
+        with timer('parse'):
+            source = sys.stdin if options['plan'] == '-' else open(options['plan'], encoding='utf-8')
+            with source:
+                text = source.read()
+            try:
+                plan = parse_plan(text)
+            except PlanError as e:
+                raise CommandError(f'Bad plan: {e}')
+            if options['algorithm']:
+                plan['algorithm'] = options['algorithm']
+
+        with transaction.atomic():
+            with timer('setup'):
+                try:
+                    rooms, batches, created = resolve_plan(plan)
+                except PlanError as e:
+                    raise CommandError(str(e))
+            result = allocate_exam_batches(
+                rooms, batches, plan['algorithm'], timer=timer, dry_run=options['dry_run'],
+            )
+            if options['dry_run']:
+                transaction.set_rollback(True)
+
+        if options['verbosity'] > 1:
+            for room in result['rooms']:
+                self.stdout.write(f"  {room['name']}: {room['allocated']} seated, {room['free']} free")
+        made = ', '.join(f'{count} {kind}' for kind, count in created.items() if count)
+        if made:
+            self.stdout.write(f"Created {made}{' (rolled back)' if options['dry_run'] else ''}.")
+
+        self.stdout.write('Phase timings:')
+        for phase, seconds in timer.phases.items():
+            self.stdout.write(f'  {phase:<10} {seconds:8.3f}s')
+        self.stdout.write(f"  {'total':<10} {time.perf_counter() - started:8.3f}s")
+
+        summary = (
+            f"{result['allocated']} students in {len(rooms)} rooms ({plan['algorithm']}), "
+            f"{len(result['unplaced'])} unplaced"
+        )
+        if result['unplaced']:
+            summary += f": {result['unplaced']}"
+        if any('greedy' in room for room in result['rooms']):
+            seats = sum(room['allocated'] + room['free'] for room in result['rooms'])
+            greedy = sum(room.get('greedy', room['allocated']) for room in result['rooms'])
+            self.stdout.write(
+                f"Fill rate {result['allocated'] / seats:.1%} of free seats "
+                f"(greedy anti_cheat on the same rooms and students: {greedy / seats:.1%})"
+            )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run, nothing written: would seat {summary}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Seated {summary}'))
@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import Room, Seat, Student
+from core.utils import (
+    allocate_greedy_anti_cheat, allocate_grid_anti_cheat, allocate_optimized_anti_cheat, interleave_by_group,
+)
+
+ROOM_SIZES = [(10, 10), (20, 10), (30, 12), (40, 12), (60, 20)]
+# Class sizes of the mixed rooms in the fill-rate table, as shares of the room's seats
+MIXES = [(0.6, 0.4), (0.7, 0.2, 0.1), (0.75, 0.15, 0.1), (0.5, 0.3, 0.2, 0.1)]
+
+
+def build_room(rows, cols):
+    """Unsaved Room/Seat objects in the column-major order allocate_seats uses."""
+    room = Room(id=1, name=f'Bench {rows}x{cols}', rows=rows, cols=cols)
+    seats = [
+        Seat(id=(r - 1) * cols + c, room=room, row=r, col=c)
+        for c in range(1, cols + 1) for r in range(1, rows + 1)
+    ]
+    return room, seats
+
+
+def build_students(count, groups):
+    students = [
+        Student(id=i, roll_number=str(100000 + i), department_id=1 + i % groups, semester_id=1)
+        for i in range(count)
+    ]
+    return interleave_by_group(students)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the anti-cheat allocators on in-memory rooms: seats placed per second, then the fill '
+        'rate of anti_cheat_max against the greedy anti_cheat in mixed rooms.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=1,
+                            help='Number of (Department, Semester) groups (allocate_view submits one at a time)')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per size, best time is reported')
+        parser.add_argument('--budget', type=float, default=None,
+                            help='anti_cheat_max time budget per room in seconds (default: ANTI_CHEAT_TIME_BUDGET)')
+
+    def handle(self, *args, **options):
+        groups = options['groups']
+        repeat = options['repeat']
+
+        self.stdout.write(f"{'room':>8} {'seats':>6} {'placed':>7} {'greedy seats/s':>16} {'grid seats/s':>14} {'speedup':>8}")
+        for rows, cols in ROOM_SIZES:
+            room, seats = build_room(rows, cols)
+            # More students than seats so the room fills up and Strict Mode skips kick in
+            students = build_students(len(seats) * 2, groups)
+
+            greedy_time, greedy = self._best_of(repeat, allocate_greedy_anti_cheat, room, seats, students)
+            grid_time, grid = self._best_of(repeat, allocate_grid_anti_cheat, room, seats, students)
+
+            same = [(a.seat.id, a.student.id) for a in greedy] == [(a.seat.id, a.student.id) for a in grid]
+            if not same:
+                self.stderr.write(f'{rows}x{cols}: allocators disagree!')
+
+            placed = len(grid)
+            self.stdout.write(
+                f"{f'{rows}x{cols}':>8} {len(seats):>6} {placed:>7} "
+                f"{placed / greedy_time:>16,.0f} {placed / grid_time:>14,.0f} {greedy_time / grid_time:>7.1f}x"
+            )
+
+        self.stdout.write('')
+        self.stdout.write(f"{'room':>8} {'classes':>22} {'greedy fill':>12} {'max fill':>9} {'time':>7}")
+        for rows, cols in ROOM_SIZES:
+            room, seats = build_room(rows, cols)
+            for mix in MIXES:
+                students = [
+                    Student(id=g * 100000 + i, roll_number=str(g * 100000 + i), department_id=g + 1, semester_id=1)
+                    for g, share in enumerate(mix) for i in range(round(share * len(seats)))
+                ]
+                stats = {}
+                allocate_optimized_anti_cheat(room, seats, students, time_budget=options['budget'], stats=stats)
+                self.stdout.write(
+                    f"{f'{rows}x{cols}':>8} {'/'.join(f'{share:.0%}' for share in mix):>22} "
+                    f"{stats['greedy'] / len(seats):>12.1%} {stats['placed'] / len(seats):>9.1%} {stats['elapsed']:>6.2f}s"
+                )
+
+    def _best_of(self, repeat, allocator, room, seats, students):
+        best, result = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = allocator(room, seats, students)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
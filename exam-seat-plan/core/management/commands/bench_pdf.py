@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Department, Room, Seat, SeatAllocation, Semester, Student
+from core.pdf_views import render_attendance_pdf, render_room_pdf, room_allocations
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the html and canvas PDF backends on a generated room (rolled back afterwards).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=60)
+        parser.add_argument('--cols', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per backend, best time is reported')
+
+    def handle(self, *args, **options):
+        rows, cols, repeat = options['rows'], options['cols'], options['repeat']
+
+        # The templates query the DB, so build a real room and throw it away at the end
+        with transaction.atomic():
+            room = self._build_room(rows, cols)
+            allocations = list(room_allocations(room))
+
+            self.stdout.write(f"{rows}x{cols} room, {len(allocations)} students")
+            self.stdout.write(f"{'document':<12} {'backend':<8} {'seconds':>8} {'pages/s':>8} {'size':>9}")
+            for document, render, pages in [
+                ('seat_plan', lambda backend: render_room_pdf(room, backend), None),
+                ('attendance', lambda backend: render_attendance_pdf(room, allocations, backend), len(allocations)),
+            ]:
+                timings = {}
+                for backend in ('html', 'canvas'):
+                    best, pdf = self._best_of(repeat, render, backend)
+                    timings[backend] = best
+                    count = pages or pdf.count(b'/Type /Page') - pdf.count(b'/Type /Pages')
+                    self.stdout.write(
+                        f"{document:<12} {backend:<8} {best:>8.3f} {count / best:>8.1f} {len(pdf) / 1024:>8.0f}K"
+                    )
+                self.stdout.write(f"{document:<12} speedup  {timings['html'] / timings['canvas']:>7.1f}x")
+
+            transaction.set_rollback(True)
+
+    def _build_room(self, rows, cols):
+        department, _ = Department.objects.get_or_create(code='BENCH', defaults={'name': 'Benchmark'})
+        semester, _ = Semester.objects.get_or_create(number=99, defaults={'name': 'Benchmark'})
+        room = Room.objects.create(name=f'Bench {rows}x{cols}', rows=rows, cols=cols)
+        Seat.objects.bulk_create(
+            [Seat(room=room, row=r, col=c) for r in range(1, rows + 1) for c in range(1, cols + 1)]
+        )
+        seats = list(Seat.objects.filter(room=room).order_by('row', 'col'))
+        Student.objects.bulk_create([
+            Student(roll_number=f'BENCH-{100000 + i}', department=department, semester=semester)
+            for i in range(len(seats))
+        ])
+        students = list(Student.objects.filter(roll_number__startswith='BENCH-').order_by('roll_number'))
+        SeatAllocation.objects.bulk_create(
+            [SeatAllocation(seat=seat, student=student) for seat, student in zip(seats, students)]
+        )
+        return room
+
+    def _best_of(self, repeat, render, backend):
+        best, pdf = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            pdf = render(backend)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, pdf
@@ -0,0 +1,107 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.master_plan import master_plan, refresh_master_plan
+from core.models import Department, Room, Seat, SeatAllocation, Semester, Student
+from core.ranges import RANGE_GAP, compress_ranges, seated_rolls
+
+
+def legacy_ranges(seated, gap):
+    """The inline compression the master plan PDF used to do, for comparison."""
+    import re
+
+    def get_num(s):
+        m = re.findall(r'\d+', s)
+        return int(m[-1]) if m else None
+
+    seated = sorted(seated, key=lambda x: int(x[1]) if x[1].isdigit() else x[1])
+    ranges, current = [], [seated[0]]
+    for curr in seated[1:]:
+        prev = current[-1]
+        p_num, c_num = get_num(prev[1]), get_num(curr[1])
+        if prev[0] == curr[0] and p_num is not None and c_num is not None and 0 < c_num - p_num < gap:
+            current.append(curr)
+        else:
+            ranges.append((current[0][0], current[0][1], current[-1][1], len(current)))
+            current = [curr]
+    ranges.append((current[0][0], current[0][1], current[-1][1], len(current)))
+    return ranges
+
+
+class Command(BaseCommand):
+    help = 'Benchmark master plan range compression and the precomputed table (DB part rolled back).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='Allocations')
+        parser.add_argument('--rooms', type=int, default=100)
+        parser.add_argument('--gap', type=int, default=RANGE_GAP)
+        parser.add_argument('--repeat', type=int, default=3, help='Runs of the in-memory part, best time is reported')
+        parser.add_argument('--no-db', action='store_true', help='Skip the database part')
+
+    def handle(self, *args, **options):
+        count, room_count, gap = options['count'], options['rooms'], options['gap']
+        # Rolls handed out in shuffled batches of 40 with the odd absentee, like a real exam
+        rng = random.Random(42)
+        rolls = [str(100000 + i) for i in range(count * 11 // 10) if rng.random() > 0.09][:count]
+        batches = [rolls[i:i + 40] for i in range(0, len(rolls), 40)]
+        rng.shuffle(batches)
+        seated = [(1 + i % room_count, roll) for i, batch in enumerate(batches) for roll in batch]
+
+        self.stdout.write(f'{len(seated)} allocations in {room_count} rooms, gap {gap}')
+        legacy_time, legacy = self._best_of(options['repeat'], lambda: legacy_ranges(seated, gap))
+        engine_time, engine = self._best_of(options['repeat'], lambda: list(compress_ranges(seated_rolls(seated), gap)))
+        presorted = seated_rolls(seated)
+        stream_time, _ = self._best_of(options['repeat'], lambda: list(compress_ranges(presorted, gap)))
+        if [tuple(r) for r in engine] != legacy:
+            self.stderr.write('engine and legacy compression disagree!')
+        self.stdout.write(f"{'legacy inline':<24} {legacy_time:>8.3f}s  {len(legacy)} ranges")
+        self.stdout.write(f"{'compress_ranges':<24} {engine_time:>8.3f}s  {legacy_time / engine_time:.1f}x")
+        self.stdout.write(f"{'  of which compression':<24} {stream_time:>8.3f}s  {len(seated) / stream_time:,.0f} rolls/s")
+
+        if not options['no_db']:
+            self._bench_db(seated, room_count)
+
+    def _bench_db(self, seated, room_count):
+        with transaction.atomic():
+            department, _ = Department.objects.get_or_create(code='BENCH', defaults={'name': 'Benchmark'})
+            semester, _ = Semester.objects.get_or_create(number=99, defaults={'name': 'Benchmark'})
+            cols = 20
+            rows = -(-len(seated) // room_count // cols) + 1
+            rooms = [Room.objects.create(name=f'Bench {i}', rows=rows, cols=cols) for i in range(1, room_count + 1)]
+            Seat.objects.bulk_create([
+                Seat(room=room, row=r, col=c) for room in rooms for r in range(1, rows + 1) for c in range(1, cols + 1)
+            ], batch_size=5000)
+            Student.objects.bulk_create([
+                Student(roll_number=f'BENCH{roll}', department=department, semester=semester) for _, roll in seated
+            ], batch_size=5000)
+            students = dict(Student.objects.filter(department=department, semester=semester)
+                            .values_list('roll_number', 'id'))
+            free = {room.id: iter(Seat.objects.filter(room=room).values_list('id', flat=True)) for room in rooms}
+            SeatAllocation.objects.bulk_create([
+                SeatAllocation(seat_id=next(free[rooms[room_index - 1].id]), student_id=students[f'BENCH{roll}'])
+                for room_index, roll in seated
+            ], batch_size=5000)
+
+            start = time.perf_counter()
+            written = refresh_master_plan([(semester.id, department.id)])
+            refresh_time = time.perf_counter() - start
+            start = time.perf_counter()
+            plan = master_plan()
+            read_time = time.perf_counter() - start
+
+            self.stdout.write(f"{'refresh_master_plan':<24} {refresh_time:>8.3f}s  {written} entries")
+            self.stdout.write(f"{'master_plan() read':<24} {read_time:>8.3f}s  "
+                              f"{sum(len(d['ranges']) for s in plan for d in s['departments'])} entries")
+            transaction.set_rollback(True)
+
+    def _best_of(self, repeat, run):
+        best, result = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bulk_pdf import format_report, iter_room_pdf_zip
+from core.models import Room
+from core.pdf_views import PDF_BACKENDS, pdf_backend
+
+
+class Command(BaseCommand):
+    help = "Render every room's seat plan and attendance sheet in parallel into one ZIP."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the ZIP file to write')
+        parser.add_argument('--room', type=int, action='append', dest='room_ids',
+                            help='Only export this room id (repeatable)')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+        parser.add_argument('--backend', choices=PDF_BACKENDS, default=None,
+                            help='PDF renderer (default: settings.PDF_BACKEND)')
+
+    def handle(self, *args, **options):
+        rooms = Room.objects.order_by('name')
+        if options['room_ids']:
+            rooms = rooms.filter(id__in=options['room_ids'])
+        if not rooms.exists():
+            raise CommandError('No rooms to export.')
+
+        report = []
+        start = time.perf_counter()
+        with open(options['output'], 'wb') as out:
+            for chunk in iter_room_pdf_zip(rooms, report, workers=options['workers'],
+                                           backend=options['backend'] or pdf_backend()):
+                out.write(chunk)
+
+        self.stdout.write(format_report(report))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']} ({len(report)} documents) in {time.perf_counter() - start:.1f}s"
+        ))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import IMPORT_FORMATS, import_students, open_rows
+from core.services import UPSERT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Create or update students from a CSV/XLSX file with roll_number, department (code) '
+        'and semester (number) columns. Streams the file; each chunk commits on its own.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='CSV or XLSX file')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, default=None,
+                            help='File format (default: from the extension)')
+        parser.add_argument('--chunk-size', type=int, default=UPSERT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(report, fraction):
+            percent = f' ({100 * fraction:.0f}%)' if fraction is not None else ''
+            self.stdout.write(f"{report['rows']} rows{percent}: {report['created']} created, "
+                              f"{report['updated']} updated, {report['bad_rows']} bad")
+
+        try:
+            rows = open_rows(options['input'], options['format'])
+            report = import_students(rows, chunk_size=options['chunk_size'], progress=progress)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for line, message in report['errors']:
+            self.stderr.write(f'line {line}: {message}')
+        if report['bad_rows'] > len(report['errors']):
+            self.stderr.write(f"... and {report['bad_rows'] - len(report['errors'])} more bad rows")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['rows'] - report['bad_rows']} of {report['rows']} rows in "
+            f"{time.perf_counter() - start:.1f}s: {report['created']} created, {report['updated']} updated, "
+            f"{report['unchanged']} unchanged, {report['bad_rows']} bad"
+        ))
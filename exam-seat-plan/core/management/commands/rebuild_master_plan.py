@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.master_plan import refresh_master_plan
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed master plan (MasterPlanEntry) from the current allocations.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = refresh_master_plan()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} master plan ranges.'))
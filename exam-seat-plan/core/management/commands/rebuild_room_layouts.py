@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core.layout import SeatBitmap, layouts_from_seats
+from core.models import Room
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the packed active-seat bitmap of every room (or --room ids) from its Seat rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', type=int, action='append', dest='room_ids',
+                            help='Only rebuild this room id (repeatable)')
+        parser.add_argument('--check', action='store_true',
+                            help='Only report rooms whose stored bitmap is missing or stale')
+
+    def handle(self, *args, **options):
+        rooms = Room.objects.order_by('name')
+        if options['room_ids']:
+            rooms = rooms.filter(id__in=options['room_ids'])
+        rooms = list(rooms)
+        fresh = layouts_from_seats(rooms)
+
+        stale = []
+        for room in rooms:
+            stored = SeatBitmap.for_room(room)
+            if stored is None or stored.to_bytes() != fresh[room.id].to_bytes():
+                self.stdout.write(f"{room.name}: {'no bitmap' if stored is None else 'bitmap out of date'}")
+                room.layout = fresh[room.id].to_bytes()
+                stale.append(room)
+
+        if options['check']:
+            self.stdout.write(f'Checked {len(rooms)} rooms, {len(stale)} missing or stale.')
+            return
+        Room.objects.bulk_update(stale, ['layout'], batch_size=500)
+        self.stdout.write(self.style.SUCCESS(f'Checked {len(rooms)} rooms, rebuilt {len(stale)}.'))
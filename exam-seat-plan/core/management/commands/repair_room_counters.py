@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core.caching import refresh_room_counters
+from core.models import Room
+
+
+class Command(BaseCommand):
+    help = "Recount every room's total/active/occupied seat counters in one aggregate query."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', type=int, action='append', dest='room_ids',
+                            help='Only repair this room id (repeatable)')
+
+    def handle(self, *args, **options):
+        before = {room.id: (room.total_seats, room.active_seats, room.occupied_seats)
+                  for room in Room.objects.only('total_seats', 'active_seats', 'occupied_seats')}
+        updated = refresh_room_counters(options['room_ids'])
+
+        fixed = 0
+        for room in Room.objects.filter(id__in=before).only('name', 'total_seats', 'active_seats', 'occupied_seats'):
+            after = (room.total_seats, room.active_seats, room.occupied_seats)
+            if after != before[room.id]:
+                fixed += 1
+                self.stdout.write(f'{room.name}: {before[room.id]} -> {after} (total, active, occupied)')
+
+        self.stdout.write(self.style.SUCCESS(f'Recounted {updated} rooms, {fixed} were out of date.'))
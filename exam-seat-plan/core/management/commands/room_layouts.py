@@ -0,0 +1,94 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.layout import SeatBitmap, decode_layout, encode_layout, layouts_from_seats
+from core.models import LayoutTemplate, Room
+from core.services import create_rooms_from_layout
+
+
+class Command(BaseCommand):
+    help = (
+        'Import/export layout templates as compact text and provision rooms from them. '
+        'One layout per line: "name | ROWSxCOLS | layout", layout as in core.layout.encode_layout '
+        '(e.g. "2#.7#/10#*10").'
+    )
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+
+        export = subcommands.add_parser('export', help='Write templates (or rooms) as text')
+        export.add_argument('--output', '-o', help='File to write (default: stdout)')
+        export.add_argument('--rooms', action='store_true', help='Export the layouts of existing rooms instead')
+
+        load = subcommands.add_parser('import', help='Create or update templates from text')
+        load.add_argument('input', help='File to read ("-" for stdin)')
+
+        provision = subcommands.add_parser('provision', help='Create rooms from a template')
+        provision.add_argument('template', help='Template name')
+        provision.add_argument('--count', type=int, default=1)
+        provision.add_argument('--prefix', help='Room name prefix (default: template name)')
+
+    def handle(self, *args, **options):
+        getattr(self, f"handle_{options['action']}")(options)
+
+    def handle_export(self, options):
+        if options['rooms']:
+            rooms = list(Room.objects.order_by('name'))
+            stored = {room.id: SeatBitmap.for_room(room) for room in rooms}
+            fresh = layouts_from_seats([room for room in rooms if stored[room.id] is None])
+            items = [(room.name, stored[room.id] or fresh[room.id]) for room in rooms]
+        else:
+            items = [(t.name, SeatBitmap(t.rows, t.cols, bytes(t.layout))) for t in LayoutTemplate.objects.all()]
+
+        lines = [f'{name} | {layout.rows}x{layout.cols} | {encode_layout(layout)}\n' for name, layout in items]
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as out:
+                out.writelines(lines)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(lines)} layouts to {options['output']}"))
+        else:
+            self.stdout.write(''.join(lines), ending='')
+
+    def handle_import(self, options):
+        source = sys.stdin if options['input'] == '-' else open(options['input'], encoding='utf-8')
+        with source:
+            entries = []
+            for number, line in enumerate(source, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    name, size, text = (part.strip() for part in line.split('|'))
+                    rows, cols = (int(n) for n in size.lower().split('x'))
+                    layout = decode_layout(text)
+                except ValueError as e:
+                    raise CommandError(f'Line {number}: {e}')
+                if (layout.rows, layout.cols) != (rows, cols):
+                    raise CommandError(f'Line {number}: layout is {layout.rows}x{layout.cols}, header says {size}')
+                entries.append((name, layout))
+
+        with transaction.atomic():
+            for name, layout in entries:
+                LayoutTemplate.objects.update_or_create(
+                    name=name, defaults={'rows': layout.rows, 'cols': layout.cols, 'layout': layout.to_bytes()}
+                )
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(entries)} layout templates.'))
+
+    def handle_provision(self, options):
+        try:
+            template = LayoutTemplate.objects.get(name=options['template'])
+        except LayoutTemplate.DoesNotExist:
+            raise CommandError(f"No layout template named {options['template']!r}")
+        count = options['count']
+        if count < 1:
+            raise CommandError('--count must be at least 1')
+
+        prefix = options['prefix'] or template.name
+        names = [prefix] if count == 1 else [f'{prefix} {i}' for i in range(1, count + 1)]
+        start = time.perf_counter()
+        rooms = create_rooms_from_layout(names, SeatBitmap(template.rows, template.cols, bytes(template.layout)))
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(rooms)} rooms ({len(rooms) * template.rows * template.cols} seats) '
+            f'in {time.perf_counter() - start:.1f}s'
+        ))
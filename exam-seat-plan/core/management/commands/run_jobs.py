@@ -0,0 +1,47 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+
+
+def _worker_main(poll_interval, once):
+    # Spawned workers (Windows/macOS) start with a fresh interpreter
+    import django
+    django.setup()
+
+    from core.jobs import work
+    work(poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs (PDF renders, exports, allocation runs) from the job table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        from django.db import connections
+        from core.jobs import work
+
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Starting {workers} job worker(s)...")
+
+        if workers == 1:
+            work(poll_interval=options['poll'], once=options['once'])
+            return
+
+        # Children must open their own DB connections
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=_worker_main, args=(options['poll'], options['once']))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
@@ -0,0 +1,117 @@
+"""
+The master plan (semester -> department -> room and roll range) kept as a
+table, MasterPlanEntry, instead of being recomputed from every allocation on
+each request.
+
+Every write that seats or unseats students goes through allocation_changed(),
+which calls refresh_master_plan() for the classes that had or now have
+students in the rooms it was given, so only the ranges of those classes are
+rebuilt. `manage.py rebuild_master_plan` redoes the
+whole table.
+"""
+from functools import reduce
+from itertools import groupby
+from operator import attrgetter, or_
+
+from django.db.models import Q
+
+from .models import MasterPlanEntry, Room, SeatAllocation
+from .ranges import RANGE_GAP, compress_ranges
+
+
+def _group_filter(groups, prefix=''):
+    return reduce(or_, (
+        Q(**{f'{prefix}semester_id': sem, f'{prefix}department_id': dept}) for sem, dept in groups
+    ))
+
+
+def refresh_master_plan(groups=None):
+    """
+    Rebuilds the MasterPlanEntry rows of `groups`, (semester_id, department_id)
+    pairs, or of every class if None: one delete, one read of their
+    allocations and one bulk insert. Call it inside the write's transaction.
+    """
+    entries = MasterPlanEntry.objects.all()
+    allocations = SeatAllocation.objects.filter(seat__isnull=False)
+    if groups is not None:
+        groups = set(groups)
+        if not groups:
+            return 0
+        entries = entries.filter(_group_filter(groups))
+        allocations = allocations.filter(_group_filter(groups, prefix='student__'))
+    entries.delete()
+
+    new_entries = []
+    for (semester_id, department_id), ranges in _class_ranges(allocations, RANGE_GAP):
+        for position, (room_id, first, last, count) in enumerate(ranges):
+            new_entries.append(MasterPlanEntry(
+                semester_id=semester_id, department_id=department_id, room_id=room_id,
+                position=position, first_roll=first, last_roll=last, student_count=count,
+            ))
+    MasterPlanEntry.objects.bulk_create(new_entries, batch_size=1000)
+    return len(new_entries)
+
+
+def _class_ranges(allocations, gap, group_fields=('student__semester_id', 'student__department_id')):
+    """
+    Yields (group, RollRange iterator) per class of `allocations`, group being
+    the values of `group_fields` (ordered by them). Rolls come out of the
+    database in natural order, so the allocations are streamed through
+    compress_ranges without sorting; consume each iterator before the next.
+    """
+    rows = allocations.order_by(*group_fields, 'student__roll_prefix', 'student__roll_num', 'student__roll_number')
+    rows = rows.values_list(*group_fields, 'seat__room_id', 'student__roll_num', 'student__roll_number')
+    width = len(group_fields)
+    for group, seated in groupby(rows.iterator(chunk_size=5000), key=lambda r: r[:width]):
+        yield group, compress_ranges((row[width:] for row in seated), gap)
+
+
+def master_plan_groups(room_ids):
+    """(semester_id, department_id) of every class listed in, or now seated in, `room_ids`."""
+    listed = MasterPlanEntry.objects.filter(room_id__in=room_ids).order_by().values_list('semester_id', 'department_id')
+    seated = SeatAllocation.objects.filter(seat__room_id__in=room_ids).order_by().values_list(
+        'student__semester_id', 'student__department_id'
+    )
+    return set(listed.union(seated))
+
+
+def master_plan():
+    """
+    [{'semester', 'departments': [{'department', 'ranges': [MasterPlanEntry]}]}]
+    in semester number, department code and roll order, from one query.
+    """
+    entries = MasterPlanEntry.objects.select_related('semester', 'department', 'room')
+    return [
+        {
+            'semester': semester,
+            'departments': [
+                {'department': department, 'ranges': list(ranges)}
+                for department, ranges in groupby(sem_entries, key=attrgetter('department'))
+            ],
+        }
+        for semester, sem_entries in groupby(entries, key=attrgetter('semester'))
+    ]
+
+
+EXPORT_FIELDS = ['semester', 'department', 'room', 'first_roll', 'last_roll', 'students']
+
+
+def master_plan_rows(gap=None):
+    """
+    Flat master plan rows for exports, (semester name, department code, room
+    name, first roll, last roll, student count), in plan order. The default gap
+    reads the MasterPlanEntry table; any other gap is compressed on the fly
+    from the allocations.
+    """
+    if gap is None or gap == RANGE_GAP:
+        yield from MasterPlanEntry.objects.values_list(
+            'semester__name', 'department__code', 'room__name', 'first_roll', 'last_roll', 'student_count',
+        ).iterator(chunk_size=5000)
+        return
+    allocations = SeatAllocation.objects.filter(seat__isnull=False)
+    rooms = dict(Room.objects.values_list('id', 'name'))
+    fields = ('student__semester__number', 'student__department__code',
+              'student__semester_id', 'student__department_id', 'student__semester__name')
+    for (_, department, _, _, semester), ranges in _class_ranges(allocations, gap, fields):
+        for room_id, first, last, count in ranges:
+            yield semester, department, rooms[room_id], first, last, count
@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-18 04:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_seats(apps, schema_editor):
+    Room = apps.get_model('core', 'Room')
+    Seat = apps.get_model('core', 'Seat')
+
+    def count(seats):
+        return Coalesce(Subquery(seats.order_by().values('room_id').annotate(n=Count('id')).values('n')), 0)
+
+    seats = Seat.objects.filter(room=OuterRef('pk'))
+    Room.objects.update(
+        total_seats=count(seats),
+        active_seats=count(seats.filter(is_active=True)),
+        occupied_seats=count(seats.filter(allocation__isnull=False)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='active_seats',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='occupied_seats',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='total_seats',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_seats, migrations.RunPython.noop),
+    ]
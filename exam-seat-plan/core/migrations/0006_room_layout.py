@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 04:42
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def backfill_layouts(apps, schema_editor):
+    # Same packing as core.layout.SeatBitmap: row-major, bit i of the map is cell i
+    Room = apps.get_model('core', 'Room')
+    Seat = apps.get_model('core', 'Seat')
+
+    active = defaultdict(list)
+    for room_id, row, col in Seat.objects.filter(is_active=True).order_by().values_list('room_id', 'row', 'col').iterator():
+        active[room_id].append((row, col))
+
+    rooms = list(Room.objects.only('id', 'rows', 'cols'))
+    for room in rooms:
+        bits = bytearray((room.rows * room.cols + 7) // 8)
+        for row, col in active[room.id]:
+            if row <= room.rows and col <= room.cols:
+                i = (row - 1) * room.cols + (col - 1)
+                bits[i >> 3] |= 1 << (i & 7)
+        room.layout = bytes(bits)
+    Room.objects.bulk_update(rooms, ['layout'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_room_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='layout',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(backfill_layouts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 6.0 on 2026-10-18 04:49
+
+import re
+from itertools import groupby
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _compress(pairs, gap):
+    # Same runs as core.ranges.compress_ranges(seated_rolls(pairs)), frozen here:
+    # rolls in roll order, one run per room while each is less than `gap` from the last
+    def number(roll):
+        digits = re.findall(r'\d+', roll)
+        return int(digits[-1]) if digits else None
+
+    rows = sorted(
+        ((room_id, number(roll), roll) for room_id, roll in pairs),
+        key=lambda item: (0, int(item[2]), '') if item[2].isdigit() else (1, 0, item[2]),
+    )
+    runs = []
+    previous = None
+    for room_id, n, roll in rows:
+        if runs and runs[-1][0] == room_id and n is not None and previous is not None and 0 < n - previous < gap:
+            runs[-1][2] = roll
+            runs[-1][3] += 1
+        else:
+            runs.append([room_id, roll, roll, 1])
+        previous = n
+    return runs
+
+
+def backfill_master_plan(apps, schema_editor):
+    # Same rows as core.master_plan.refresh_master_plan(), from the historical models
+    SeatAllocation = apps.get_model('core', 'SeatAllocation')
+    MasterPlanEntry = apps.get_model('core', 'MasterPlanEntry')
+    gap = getattr(settings, 'MASTER_PLAN_RANGE_GAP', 100)
+
+    rows = SeatAllocation.objects.filter(seat__isnull=False).order_by(
+        'student__semester_id', 'student__department_id'
+    ).values_list('student__semester_id', 'student__department_id', 'seat__room_id', 'student__roll_number')
+    entries = []
+    for (semester_id, department_id), seated in groupby(rows.iterator(), key=lambda r: r[:2]):
+        for position, (room_id, first, last, count) in enumerate(_compress((r[2:] for r in seated), gap)):
+            entries.append(MasterPlanEntry(
+                semester_id=semester_id, department_id=department_id, room_id=room_id,
+                position=position, first_roll=first, last_roll=last, student_count=count,
+            ))
+    MasterPlanEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_layouttemplate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MasterPlanEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('first_roll', models.CharField(max_length=50)),
+                ('last_roll', models.CharField(max_length=50)),
+                ('student_count', models.PositiveIntegerField()),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.department')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.room')),
+                ('semester', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.semester')),
+            ],
+            options={
+                'ordering': ['semester__number', 'department__code', 'position'],
+                'indexes': [models.Index(fields=['semester', 'department', 'position'], name='core_master_semeste_0f60ff_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_master_plan, migrations.RunPython.noop),
+    ]
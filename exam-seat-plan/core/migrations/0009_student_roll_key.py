@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-18 04:57
+
+import re
+
+from django.db import migrations, models
+
+
+def backfill_roll_keys(apps, schema_editor):
+    # Same split as core.models.roll_key: text before the last run of digits, and that run
+    Student = apps.get_model('core', 'Student')
+    pattern = re.compile(r'^(.*?)(\d+)\D*$')
+
+    batch = []
+    for student in Student.objects.only('id', 'roll_number').iterator(chunk_size=2000):
+        match = pattern.match(student.roll_number)
+        student.roll_prefix, student.roll_num = (match.group(1), int(match.group(2))) if match else (student.roll_number, None)
+        batch.append(student)
+        if len(batch) >= 2000:
+            Student.objects.bulk_update(batch, ['roll_prefix', 'roll_num'])
+            batch = []
+    Student.objects.bulk_update(batch, ['roll_prefix', 'roll_num'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_masterplanentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='roll_num',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='roll_prefix',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['roll_prefix', 'roll_num'], name='core_studen_roll_pr_cf5898_idx'),
+        ),
+        migrations.RunPython(backfill_roll_keys, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,30 @@
+import re
+
 from django.db import models
+from django.utils import timezone
 
 class Room(models.Model):
     name = models.CharField(max_length=100)
     rows = models.IntegerField(help_text="Number of rows in the room")
     cols = models.IntegerField(help_text="Number of columns (seats per row)")
+    # Bumped on every write that changes what this room's plan looks like (see caching.allocation_changed)
+    allocation_version = models.PositiveIntegerField(default=1)
+    allocation_changed_at = models.DateTimeField(default=timezone.now)
+    # Stored counters, recounted with every allocation_changed (repair: manage.py repair_room_counters)
+    total_seats = models.PositiveIntegerField(default=0)
+    active_seats = models.PositiveIntegerField(default=0)
+    occupied_seats = models.PositiveIntegerField(default=0)
+    # Packed active-seat bitmap, one bit per cell row-major (see core/layout.py)
+    layout = models.BinaryField(default=b'')
     
     @property
     def capacity(self):
         # Return count of active seats
-        return self.seats.filter(is_active=True).count()
+        return self.active_seats
+
+    @property
+    def free_seats(self):
+        return max(self.active_seats - self.occupied_seats, 0)
 
     def __str__(self):
         return f"{self.name} ({self.rows}x{self.cols})"
@@ -41,11 +57,84 @@ class Semester(models.Model):
     def __str__(self):
         return f"{self.name} ({self.number})"
 
+_ROLL_KEY = re.compile(r'^(.*?)(\d+)\D*$')
+
+
+def roll_key(roll):
+    """
+    (roll_prefix, roll_num) natural-sort key of a roll: the text before its last
+    run of digits and that run as a number. "CT-2023-042" -> ("CT-2023-", 42),
+    "1001" -> ("", 1001), a roll without digits -> (roll, None).
+    """
+    match = _ROLL_KEY.match(roll)
+    if not match:
+        return roll, None
+    return match.group(1), int(match.group(2))
+
+
+class StudentQuerySet(models.QuerySet):
+    """Keeps the roll sort key in step on the bulk paths that skip Student.save()."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for student in objs:
+            student.set_roll_key()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if 'roll_number' in fields:
+            objs = list(objs)
+            for student in objs:
+                student.set_roll_key()
+            fields = [*fields, 'roll_prefix', 'roll_num']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def natural_order(self):
+        return self.order_by('roll_prefix', 'roll_num', 'roll_number')
+
+    def in_rolls(self, intervals):
+        """
+        Students whose roll is in RollIntervals `intervals`: an index range scan
+        per interval (zero-padded rolls excluded, "0101" is not 101) plus the
+        literal rolls by roll_number.
+        """
+        if not intervals:
+            return self.none()
+        query = models.Q()
+        if intervals.intervals:
+            numeric = models.Q()
+            for start, end in intervals.intervals:
+                numeric |= models.Q(roll_num__range=(start, end))
+            plain = ~models.Q(roll_number__startswith='0') | models.Q(roll_number='0')
+            query |= numeric & plain & models.Q(roll_prefix='')
+        if intervals.literals:
+            query |= models.Q(roll_number__in=intervals.literals)
+        return self.filter(query)
+
+
 class Student(models.Model):
     roll_number = models.CharField(max_length=50, unique=True)
     department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='students')
     semester = models.ForeignKey(Semester, on_delete=models.CASCADE, related_name='students')
-    
+    # Natural-sort key derived from roll_number (see roll_key); kept in sync by save() and StudentQuerySet
+    roll_prefix = models.CharField(max_length=50, default='', blank=True, editable=False)
+    roll_num = models.BigIntegerField(null=True, blank=True, editable=False)
+
+    objects = StudentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['roll_prefix', 'roll_num'])]
+
+    def set_roll_key(self):
+        self.roll_prefix, self.roll_num = roll_key(self.roll_number)
+
+    def save(self, *args, **kwargs):
+        self.set_roll_key()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'roll_number' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'roll_prefix', 'roll_num'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.roll_number} ({self.department.code}-{self.semester.number})"
 
@@ -63,3 +152,99 @@ class SeatAllocation(models.Model):
         if self.seat:
             return f"{self.student.roll_number} in {self.seat}"
         return f"{self.student.roll_number} (Unassigned)"
+
+class PlanVersion(models.Model):
+    """
+    Single row (pk=1) holding the global allocation version, bumped together
+    with the per-room versions. Lives in the DB so every worker sees it.
+    """
+    version = models.PositiveIntegerField(default=1)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def current(cls):
+        plan, _ = cls.objects.get_or_create(pk=1)
+        return plan
+
+    def __str__(self):
+        return f"Plan v{self.version}"
+
+class MasterPlanEntry(models.Model):
+    """
+    One line of the master plan: a run of a class's rolls seated in one room.
+    Derived from SeatAllocation and rebuilt per (semester, department) by
+    caching.allocation_changed (see core/master_plan.py).
+    """
+    semester = models.ForeignKey(Semester, on_delete=models.CASCADE)
+    department = models.ForeignKey(Department, on_delete=models.CASCADE)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    # Order of the run within its class (by roll)
+    position = models.PositiveIntegerField()
+    first_roll = models.CharField(max_length=50)
+    last_roll = models.CharField(max_length=50)
+    student_count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['semester__number', 'department__code', 'position']
+        indexes = [models.Index(fields=['semester', 'department', 'position'])]
+
+    @property
+    def rolls(self):
+        from .ranges import format_range
+        return format_range(self.first_roll, self.last_roll, self.student_count)
+
+    def __str__(self):
+        return f"{self.rolls} in {self.room_id}"
+
+class LayoutTemplate(models.Model):
+    """A reusable room shape: size plus active-seat pattern (packed like Room.layout)."""
+    name = models.CharField(max_length=100, unique=True)
+    rows = models.IntegerField()
+    cols = models.IntegerField()
+    layout = models.BinaryField(default=b'')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} ({self.rows}x{self.cols})"
+
+class Job(models.Model):
+    """
+    Background work (PDF renders, exports, allocation runs) picked up by
+    `manage.py run_jobs`. The table is the queue, so no broker is needed.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percent complete (0-100)")
+    message = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    # Path of the finished artifact, relative to MEDIA_ROOT
+    result_file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Bumped by the running worker; a stale heartbeat means the worker is gone
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    # Token of the claim that is running the job, so a requeued job's old worker cannot finish it
+    claim = models.CharField(max_length=32, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"Job #{self.id} {self.kind} ({self.status})"
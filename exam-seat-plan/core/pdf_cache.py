@@ -0,0 +1,66 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from .grid import room_snapshot
+
+PDF_CACHE_DIR = Path(getattr(settings, 'PDF_CACHE_DIR', Path(settings.MEDIA_ROOT) / 'pdf_cache'))
+
+
+def room_fingerprint(room):
+    """
+    Hash of everything a room PDF shows: the room itself plus every seat's
+    active flag and occupant (roll, department, semester). Read from the
+    cached room snapshot.
+    """
+    digest = hashlib.sha1(f'{room.name}|{room.rows}|{room.cols}|'.encode('utf-8'))
+    digest.update(room_snapshot(room).digest.encode('ascii'))
+    return digest.hexdigest()
+
+
+def cached_pdf(key, fingerprint, render):
+    """
+    Returns the PDF bytes stored for (key, fingerprint), calling render() to
+    produce and store them on a miss. render() may return None (render
+    error); nothing is cached then.
+    """
+    pdf = get_cached_pdf(key, fingerprint)
+    if pdf is None:
+        pdf = render()
+        if pdf is not None:
+            store_pdf(key, fingerprint, pdf)
+    return pdf
+
+
+def get_cached_pdf(key, fingerprint):
+    try:
+        return (PDF_CACHE_DIR / f'{key}-{fingerprint}.pdf').read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def store_pdf(key, fingerprint, pdf):
+    """Stores PDF bytes and evicts files from older fingerprints of the same key."""
+    path = PDF_CACHE_DIR / f'{key}-{fingerprint}.pdf'
+    PDF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Write then rename so another worker never serves a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=PDF_CACHE_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(pdf)
+    os.replace(tmp_path, path)
+
+    for stale in PDF_CACHE_DIR.glob(f'{key}-*.pdf'):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+
+
+def pdf_response(pdf, filename=None):
+    response = HttpResponse(pdf, content_type='application/pdf')
+    response['Content-Length'] = len(pdf)
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
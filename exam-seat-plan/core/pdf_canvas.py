@@ -0,0 +1,206 @@
+"""
+Direct-draw PDF backend: paints seat plans and attendance sheets straight onto
+a ReportLab canvas instead of laying out HTML tables with xhtml2pdf. The
+layouts follow core/pdf_room.html and core/pdf_attendance.html.
+"""
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+
+INSTITUTE = 'Barisal Polytechnic Institute'
+FOOTER = 'Generated by Exam Seat Plan System'
+
+SEAT_ASSIGNED_FILL = colors.HexColor('#eff6ff')
+SEAT_ASSIGNED_BORDER = colors.HexColor('#bfdbfe')
+SEAT_EMPTY_FILL = colors.HexColor('#f8fafc')
+SEAT_EMPTY_BORDER = colors.HexColor('#e2e8f0')
+MUTED = colors.HexColor('#94a3b8')
+
+
+def _centered(c, text, y, font, size, width):
+    c.setFont(font, size)
+    c.drawCentredString(width / 2, y, text)
+
+
+def _fit(c, text, font, size, max_width):
+    """Shrinks the font until `text` fits `max_width`."""
+    while size > 4 and c.stringWidth(text, font, size) > max_width:
+        size -= 0.5
+    return size
+
+
+def draw_room_pdf(room, grid):
+    """
+    Seat plan for `room`. `grid` is rows x cols of grid.SeatCell (None for a gap),
+    as returned by RoomSnapshot.grid().
+    """
+    page_size = landscape(A4) if room.cols > 7 else A4
+    width, height = page_size
+    margin = 1 * cm
+    label_width = 0.8 * cm
+    header_height = 3.2 * cm
+    footer_height = 1 * cm
+
+    # Same figure as pdf_room.html, which prints the room's seat count
+    total_allocated = sum(1 for row in grid for seat in row if seat is not None)
+
+    # 60px cells with 8px spacing in the HTML version, scaled down to fit the page width
+    pitch = min(51.0, (width - 2 * margin - label_width) / max(room.cols, 1))
+    cell = pitch * 0.85
+    grid_width = label_width + pitch * room.cols
+    left = (width - grid_width) / 2 + label_width
+    rows_per_page = max(1, int((height - 2 * margin - header_height - footer_height) // pitch))
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=page_size)
+    c.setTitle(f'Exam Seat Plan - {room.name}')
+
+    roll_size = max(4.0, min(8.5, cell * 0.22))
+    class_size = max(3.5, roll_size * 0.8)
+
+    for page_start in range(0, max(len(grid), 1), rows_per_page):
+        top = height - margin
+        _centered(c, INSTITUTE, top - 24, 'Helvetica-Bold', 24, width)
+        _centered(c, f'Exam Seat Plan - {room.name}', top - 50, 'Helvetica-Bold', 16, width)
+        _centered(c, f'Total Allocated: {total_allocated}', top - 70, 'Helvetica', 12, width)
+
+        y = top - header_height
+        for row_index in range(page_start, min(page_start + rows_per_page, len(grid))):
+            row = grid[row_index]
+            cell_bottom = y - cell
+
+            c.setFillColor(MUTED)
+            c.setFont('Helvetica-Bold', min(9, roll_size + 1))
+            c.drawRightString(left - 6, cell_bottom + cell / 2 - 3, str(row_index + 1))
+
+            for col_index, seat in enumerate(row):
+                if seat is None:
+                    continue  # Gap
+                x = left + col_index * pitch
+                c.setLineWidth(1.5)
+                if seat.allocation_id:
+                    c.setStrokeColor(SEAT_ASSIGNED_BORDER)
+                    c.setFillColor(SEAT_ASSIGNED_FILL)
+                else:
+                    c.setStrokeColor(SEAT_EMPTY_BORDER)
+                    c.setFillColor(SEAT_EMPTY_FILL)
+                c.roundRect(x, cell_bottom, cell, cell, min(6, cell * 0.13), stroke=1, fill=1)
+
+                cx = x + cell / 2
+                if seat.allocation_id:
+                    roll = seat.roll_number
+                    size = _fit(c, roll, 'Helvetica-Bold', roll_size, cell - 4)
+                    c.setFillColor(colors.black)
+                    c.setFont('Helvetica-Bold', size)
+                    c.drawCentredString(cx, cell_bottom + cell / 2 + 1, roll)
+                    label = f'{seat.department_code} - {seat.semester_number}'
+                    c.setFont('Helvetica', _fit(c, label, 'Helvetica', class_size, cell - 4))
+                    c.drawCentredString(cx, cell_bottom + cell / 2 - class_size - 1, label)
+                else:
+                    c.setFillColor(MUTED)
+                    c.setFont('Helvetica', class_size)
+                    c.drawCentredString(cx, cell_bottom + cell / 2 - class_size / 3, 'Empty')
+            y -= pitch
+
+        c.setFillColor(colors.black)
+        c.setFont('Helvetica', 10)
+        c.drawString(margin, 0.5 * cm + 0.3 * cm, FOOTER)
+        c.showPage()
+
+    c.save()
+    return buffer.getvalue()
+
+
+ATTENDANCE_COLUMNS = [
+    ('Date', 0.15), ('Time', 0.10), ('Subject Name', 0.30),
+    ('Script Code', 0.15), ('Student Sign', 0.15), ('Invigilator Sign', 0.15),
+]
+ATTENDANCE_ROWS = 12
+
+
+def draw_attendance_pdf(room, allocations):
+    """
+    One attendance page per allocation (seat order), like core/pdf_attendance.html.
+    `allocations` iterate objects with .student (roll_number, department.name/.code,
+    semester.name) and .seat (row, col).
+    """
+    width, height = A4
+    margin = 1 * cm
+    inner = width - 2 * margin
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    c.setTitle(f'Attendance Sheet - {room.name}')
+
+    for alloc in allocations:
+        student = alloc.student
+        y = height - margin - 18
+
+        _centered(c, INSTITUTE.upper(), y, 'Helvetica-Bold', 18, width)
+        y -= 28
+        subtitle = 'Examination Attendance Sheet'
+        _centered(c, subtitle, y, 'Helvetica', 14, width)
+        underline = c.stringWidth(subtitle, 'Helvetica', 14)
+        c.setLineWidth(0.8)
+        c.line((width - underline) / 2, y - 2, (width + underline) / 2, y - 2)
+        y -= 26
+
+        # Student info box
+        info = [
+            ('Student Name:', '______________________________________', 'Helvetica'),
+            ('Roll Number:', student.roll_number, 'Helvetica-Bold'),
+            ('Department:', f'{student.department.name} ({student.department.code})', 'Helvetica'),
+            ('Semester:', student.semester.name, 'Helvetica'),
+            ('Room / Seat:', f'{room.name} / Seat: R-{alloc.seat.row} / C-{alloc.seat.col}', 'Helvetica'),
+        ]
+        line_height = 24
+        box_height = line_height * len(info) + 8
+        c.setStrokeColor(colors.black)
+        c.setLineWidth(1)
+        c.rect(margin, y - box_height, inner, box_height)
+        text_y = y - 20
+        for label, value, value_font in info:
+            c.setFont('Helvetica-Bold', 12)
+            c.drawString(margin + 8, text_y, label)
+            c.setFont(value_font, 12)
+            c.drawString(margin + 8 + inner * 0.2, text_y, value)
+            text_y -= line_height
+        y -= box_height + 20
+
+        # Subject table
+        header_height = 22
+        row_height = 22.5
+        c.setFillColor(colors.HexColor('#eeeeee'))
+        c.rect(margin, y - header_height, inner, header_height, stroke=0, fill=1)
+        c.setFillColor(colors.black)
+        x = margin
+        c.setFont('Helvetica-Bold', 10)
+        for title, share in ATTENDANCE_COLUMNS:
+            col_width = inner * share
+            c.drawCentredString(x + col_width / 2, y - header_height + 7, title)
+            x += col_width
+        table_height = header_height + row_height * ATTENDANCE_ROWS
+        c.rect(margin, y - table_height, inner, table_height)
+        x = margin
+        for _, share in ATTENDANCE_COLUMNS[:-1]:
+            x += inner * share
+            c.line(x, y, x, y - table_height)
+        line_y = y - header_height
+        for _ in range(ATTENDANCE_ROWS):
+            c.line(margin, line_y, margin + inner, line_y)
+            line_y -= row_height
+        y -= table_height + 30
+
+        c.setFont('Helvetica', 9)
+        c.drawCentredString(width / 2, y, 'Note: Verify Roll Number before signing.')
+
+        c.setFillColor(colors.HexColor('#555555'))
+        c.drawCentredString(width / 2, 0.5 * cm + 0.3 * cm, FOOTER)
+        c.setFillColor(colors.black)
+        c.showPage()
+
+    c.save()
+    return buffer.getvalue()
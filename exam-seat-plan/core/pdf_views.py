@@ -1,4 +1,5 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.template.loader import get_template
 from xhtml2pdf import pisa
 from io import BytesIO
@@ -8,26 +9,77 @@ from django.contrib import messages
 from django.shortcuts import redirect, get_object_or_404
 from django.utils.timezone import now
 from collections import defaultdict
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from .caching import room_etag, room_last_modified, plan_etag, plan_last_modified, plan_version
+from .grid import room_snapshot
+from .master_plan import master_plan
+from .pdf_cache import cached_pdf, pdf_response, room_fingerprint
+from .jobs import accepted_response, enqueue
 
-def render_to_pdf(template_src, context_dict={}):
-    template = get_template(template_src)
-    html  = template.render(context_dict)
+def _wants_job(request):
+    # ?async=1 queues the render on the job workers (staff only) and returns a job id
+    return request.GET.get('async') == '1' and request.user.is_staff
+
+PDF_BACKENDS = ('html', 'canvas')
+
+def pdf_backend(request=None):
+    """
+    'html' renders the templates through xhtml2pdf, 'canvas' draws seat plans and
+    attendance sheets directly with ReportLab (core/pdf_canvas.py). Defaults to
+    settings.PDF_BACKEND; ?backend= overrides it per request.
+    """
+    backend = request.GET.get('backend') if request is not None else None
+    if backend not in PDF_BACKENDS:
+        backend = getattr(settings, 'PDF_BACKEND', 'html')
+    return backend if backend in PDF_BACKENDS else 'html'
+
+def pdf_cache_key(document, room_id, backend):
+    # Each backend keeps its own cached copy ("room-7", "room-7.canvas")
+    key = f'{document}-{room_id}'
+    return key if backend == 'html' else f'{key}.{backend}'
+
+def html_to_pdf(html):
+    """HTML string -> PDF bytes (None on error). Needs no DB, so it can run in a worker process."""
     result = BytesIO()
     # ISO-8859-1 is default but we want UTF-8 likely
     pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result, encoding='UTF-8')
     if not pdf.err:
-        return HttpResponse(result.getvalue(), content_type='application/pdf')
+        return result.getvalue()
     return None
 
+def render_pdf_bytes(template_src, context_dict={}):
+    template = get_template(template_src)
+    return html_to_pdf(template.render(context_dict))
+
+def render_to_pdf(template_src, context_dict={}):
+    pdf = render_pdf_bytes(template_src, context_dict)
+    if pdf is not None:
+        return pdf_response(pdf)
+    return None
+
+@cache_control(no_cache=True)
+@condition(etag_func=room_etag, last_modified_func=room_last_modified)
 def download_room_pdf(request, room_id):
     room = get_object_or_404(Room, id=room_id)
-    seats = Seat.objects.filter(room=room).select_related('allocation__student')
-    
-    # Recreate Grid Logic for PDF
-    grid = [[None for _ in range(room.cols)] for _ in range(room.rows)]
-    for seat in seats:
-        if seat.row <= room.rows and seat.col <= room.cols:
-            grid[seat.row-1][seat.col-1] = seat
+    backend = pdf_backend(request)
+    if _wants_job(request):
+        return accepted_response(enqueue('room_pdf', room_id=room.id, backend=backend))
+    # Served from the PDF cache until the room's seats or allocations change
+    pdf = cached_pdf(pdf_cache_key('room', room.id, backend), room_fingerprint(room),
+                     lambda: render_room_pdf(room, backend))
+    return pdf_response(pdf) if pdf is not None else None
+
+def render_room_pdf(room, backend='html'):
+    snapshot = room_snapshot(room)
+    if backend == 'canvas':
+        from .pdf_canvas import draw_room_pdf
+        return draw_room_pdf(room, snapshot.grid())
+    return html_to_pdf(room_pdf_html(room, snapshot))
+
+def room_pdf_html(room, snapshot=None):
+    snapshot = snapshot or room_snapshot(room)
+    grid = snapshot.grid()
             
     # Dynamic Orientation
     orientation = 'landscape' if room.cols > 7 else 'portrait'
@@ -35,143 +87,85 @@ def download_room_pdf(request, room_id):
     context = {
         'room': room,
         'grid': grid,
-        'request': request,
+        'seat_count': snapshot.seat_count,
         'orientation': orientation,
     }
-    return render_to_pdf('core/pdf_room.html', context)
+    return get_template('core/pdf_room.html').render(context)
 
+@cache_control(no_cache=True)
+@condition(etag_func=plan_etag, last_modified_func=plan_last_modified)
 def download_master_plan_pdf(request):
     """
     Generates a master plan grouped by Semester -> Department -> Room Ranges.
     """
-    allocations = SeatAllocation.objects.select_related(
-        'student', 'student__semester', 'student__department', 'seat__room'
-    ).all()
-    
-    # Grouping Logic
-    from itertools import groupby
-    from operator import attrgetter
-    
-    # Sort for groupby: Semester Num, Dept Code, Roll
-    # We sort by objects for grouping, but roll sort needs custom key
-    # Helper to get sort key
-    def sort_key(alloc):
-        sem_num = alloc.student.semester.number
-        dept_code = alloc.student.department.code
-        # roll handle
-        roll = alloc.student.roll_number
-        roll_val = int(roll) if roll.isdigit() else roll
-        # We can't mix types in tuple easily if roll is mixed. 
-        # So convert to string for tuple but use padding for number-like sorting? 
-        # Actually, let's sort sequentially.
-        return (sem_num, dept_code)
-        
-    s_allocs = sorted(allocations, key=sort_key)
-    
-    master_data = [] # [{'semester': name, 'departments': [{'code': code, 'ranges': []}]}]
-    
-    for semester, sem_iter in groupby(s_allocs, key=attrgetter('student.semester')):
-        sem_list = list(sem_iter)
-        dept_data = []
-        
-        for dept, dept_iter in groupby(sem_list, key=attrgetter('student.department')):
-            students = list(dept_iter)
-            
-            # Sort students by roll for range compression
-            students.sort(key=lambda x: int(x.student.roll_number) if x.student.roll_number.isdigit() else x.student.roll_number)
-            
-            # Compress Ranges with Gap Tolerance
-            ranges = []
-            if students:
-                current_range = [students[0]]
-                
-                for i in range(1, len(students)):
-                    prev = current_range[-1]
-                    curr = students[i]
-                    
-                    is_same_room = (prev.seat.room.id == curr.seat.room.id)
-                    
-                    # Logic: If same room AND numeric difference is small (e.g. < 100), key them together.
-                    # This handles "1-10 excluding 9" -> shows "1-10".
-                    # And "743610... 756321" -> separate.
-                    
-                    def get_num(s):
-                        import re
-                        m = re.findall(r'\d+', s)
-                        return int(m[-1]) if m else None
-
-                    p_num = get_num(prev.student.roll_number)
-                    c_num = get_num(curr.student.roll_number)
-                    
-                    is_cluster = False
-                    if is_same_room and p_num is not None and c_num is not None:
-                        diff = c_num - p_num
-                        # Allow gap up to 100 (arbitrary "cluster" size). 
-                        # If diff is 1, it's sequential. If 2 (skipped 1), it's "missing".
-                        # User wants 1-10 even if 9 missing.
-                        if 0 < diff < 100:
-                            is_cluster = True
-                            
-                    if is_cluster:
-                        current_range.append(curr)
-                    else:
-                        ranges.append(_format_range(current_range))
-                        current_range = [curr]
-                
-                if current_range:
-                    ranges.append(_format_range(current_range))
-            
-            dept_data.append({
-                'department': dept,
-                'ranges': ranges
-            })
-            
-        master_data.append({
-            'semester': semester,
-            'departments': dept_data
-        })
-        
-    context = {'master_data': master_data}
-    return render_to_pdf('core/pdf_master.html', context)
-
-def _format_range(alloc_list):
-    first = alloc_list[0]
-    last = alloc_list[-1]
-    room_name = first.seat.room.name
-    
-    if len(alloc_list) > 1:
-        roll_str = f"{first.student.roll_number} - {last.student.roll_number}"
-    else:
-        roll_str = first.student.roll_number
-        
-    return {'rolls': roll_str, 'room': room_name}
+    if _wants_job(request):
+        return accepted_response(enqueue('master_pdf'))
+    pdf = cached_pdf('master', master_plan_fingerprint(), render_master_plan_pdf)
+    return pdf_response(pdf) if pdf is not None else None
+
+def master_plan_fingerprint():
+    # The plan version changes on every write; the date is printed on the PDF
+    return f'v{plan_version()[0]}-{now().date():%Y%m%d}'
+
+def render_master_plan_pdf():
+    # Ranges come precomputed from the MasterPlanEntry table
+    return render_pdf_bytes('core/pdf_master.html', {'master_data': master_plan()})
 
 @staff_member_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=room_etag, last_modified_func=room_last_modified)
 def download_attendance_pdf(request, room_id):
     room = get_object_or_404(Room, id=room_id)
-    allocations = SeatAllocation.objects.filter(seat__room=room).select_related('student', 'student__department', 'student__semester', 'seat').order_by('seat__row', 'seat__col')
+    allocations = room_allocations(room)
     
     if not allocations.exists():
         messages.error(request, "No students allocated to this room.")
         return redirect('dashboard')
 
+    backend = pdf_backend(request)
+    if _wants_job(request):
+        return accepted_response(enqueue('attendance_pdf', room_id=room.id, backend=backend))
+
+    pdf = cached_pdf(pdf_cache_key('attendance', room.id, backend), room_fingerprint(room),
+                     lambda: render_attendance_pdf(room, allocations, backend))
+    if pdf is None:
+        return HttpResponse('We had some errors rendering the attendance sheet.')
+    return pdf_response(pdf, filename=f'attendance_{room.name}_{now().strftime("%Y%m%d")}.pdf')
+
+def render_attendance_pdf(room, allocations, backend='html'):
+    if backend == 'canvas':
+        from .pdf_canvas import draw_attendance_pdf
+        return draw_attendance_pdf(room, allocations)
+    return html_to_pdf(attendance_html(room, allocations))
+
+def room_allocations(room):
+    return SeatAllocation.objects.filter(seat__room=room).select_related('student', 'student__department', 'student__semester', 'seat').order_by('seat__row', 'seat__col')
+
+def attendance_html(room, allocations):
     # Sort by Seat Order (Row, Col) as requested: "set plan onujay serial vabe"
     # allocations is already ordered by row, col from the initial query
     
+    # No render date on the sheet: it is cached on room_fingerprint alone, which has none
     context = {
         'room': room,
         'allocations': allocations, # Pass raw queryset, sorted by seat
-        'generated_at': now()
     }
     
-    template_path = 'core/pdf_attendance.html'
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="attendance_{room.name}_{now().strftime("%Y%m%d")}.pdf"'
-    
-    template = get_template(template_path)
-    html = template.render(context)
-    
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
-        return HttpResponse('We had some errors <pre>' + html + '</pre>')
+    template = get_template('core/pdf_attendance.html')
+    return template.render(context)
+
+
+@staff_member_required
+def download_all_room_pdfs(request):
+    """Every room's seat plan and attendance sheet in one ZIP, rendered in parallel."""
+    from .bulk_pdf import iter_room_pdf_zip
+
+    backend = pdf_backend(request)
+    if _wants_job(request):
+        return accepted_response(enqueue('room_pdfs_zip', backend=backend))
+
+    rooms = Room.objects.order_by('name')
+    response = StreamingHttpResponse(iter_room_pdf_zip(rooms, report=[], backend=backend),
+                                     content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="room_pdfs_{now().strftime("%Y%m%d")}.zip"'
     return response
@@ -0,0 +1,148 @@
+"""
+Allocation previews: what allocate_batch would do to one room, worked out in
+memory and handed back as a signed proposal.
+
+preview_batch() reads the room's active seats with their occupants in one
+query, frees the seats held by the batch's own students (the real run
+releases them first) and runs allocate_seats over unsaved Seat/Student
+objects. Nothing is written. The placements (seat id, roll) are signed
+together with the room's allocation_version; commit_proposal() accepts them
+only while that version is unchanged, so a proposal made against a room that
+has since been written to is refused instead of double-booking seats.
+"""
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+
+from .caching import allocation_changed
+from .models import Department, Room, Seat, SeatAllocation, Semester, Student
+from .services import upsert_and_release_students
+from .utils import RollIntervals, allocate_seats, parse_roll_intervals
+
+# How long a preview can be committed for, in seconds
+PREVIEW_MAX_AGE = getattr(settings, 'ALLOCATION_PREVIEW_MAX_AGE', 60 * 60)
+_SALT = 'core.preview'
+
+
+class StaleProposal(ValueError):
+    pass
+
+
+def _conflicts(cells, cols):
+    """
+    (same-class neighbour pairs, new students with a same-class neighbour) over
+    `cells` {index: (department_id, semester_id, is_new)}, 4-neighbours.
+    """
+    pairs = 0
+    conflicted = set()
+    for i, (department_id, semester_id, is_new) in cells.items():
+        right = i + 1 if (i + 1) % cols else None
+        for j in (right, i + cols):
+            other = cells.get(j)
+            if other is None or other[:2] != (department_id, semester_id) or not (is_new or other[2]):
+                continue
+            pairs += 1
+            conflicted.update(k for k, new in ((i, is_new), (j, other[2])) if new)
+    return pairs, len(conflicted)
+
+
+def preview_batch(room, department, semester, rolls, algorithm='linear'):
+    """
+    Runs allocate_batch for one Department/Semester batch (RollIntervals)
+    without touching the database. `room` must be freshly read: its
+    allocation_version is what the proposal is checked against.
+
+    Returns {'placed', 'unplaced' (RollIntervals), 'conflicts' {'pairs', 'students'},
+    'fill' ({'seats', 'placed', 'greedy'} for anti_cheat_max, else None), 'grid' (rows x cols: None for no seat, {} for a free seat, else
+    {'roll', 'department_id', 'semester_id', 'new'}), 'version', 'proposal' (signed token)}.
+    """
+    # Same cut as upsert_and_release_students(keep=room.capacity)
+    head, overflow = rolls.split(room.capacity)
+
+    free_seats = []
+    cells = {}
+    rolls_at = {}
+    seats = Seat.objects.filter(room=room, is_active=True, row__lte=room.rows, col__lte=room.cols).order_by(
+        'row', 'col',
+    ).values_list(
+        'id', 'row', 'col', 'allocation__student__roll_number',
+        'allocation__student__department_id', 'allocation__student__semester_id',
+    )
+    for seat_id, row, col, roll, department_id, semester_id in seats:
+        i = (row - 1) * room.cols + (col - 1)
+        if roll is None or roll in rolls:
+            free_seats.append(Seat(id=seat_id, room=room, row=row, col=col, is_active=True))
+            rolls_at[i] = None
+        else:
+            cells[i] = (department_id, semester_id, False)
+            rolls_at[i] = roll
+
+    students = [Student(roll_number=roll, department=department, semester=semester) for roll in head]
+    stats = {}
+    allocations = allocate_seats(room, students, algorithm, seats=free_seats, stats=stats)
+
+    placements = []
+    for allocation in allocations:
+        seat = allocation.seat
+        i = (seat.row - 1) * room.cols + (seat.col - 1)
+        cells[i] = (department.id, semester.id, True)
+        rolls_at[i] = allocation.student.roll_number
+        placements.append([seat.id, allocation.student.roll_number])
+
+    grid = [[None] * room.cols for _ in range(room.rows)]
+    for i, roll in rolls_at.items():
+        cell = {}
+        if roll is not None:
+            department_id, semester_id, is_new = cells[i]
+            cell = {'roll': roll, 'department_id': department_id, 'semester_id': semester_id, 'new': is_new}
+        grid[i // room.cols][i % room.cols] = cell
+
+    placed = {roll for _, roll in placements}
+    pairs, conflicted = _conflicts(cells, room.cols)
+    proposal = signing.dumps({
+        'room': room.id, 'version': room.allocation_version,
+        'department': department.id, 'semester': semester.id,
+        'rolls': str(rolls), 'keep': room.capacity, 'seats': placements,
+    }, salt=_SALT, compress=True)
+    return {
+        'placed': len(placements),
+        'unplaced': RollIntervals.from_rolls(roll for roll in head if roll not in placed) | overflow,
+        'conflicts': {'pairs': pairs, 'students': conflicted},
+        # anti_cheat_max only: free seats, placed, and the greedy anti_cheat baseline
+        'fill': {key: stats[key] for key in ('seats', 'placed', 'greedy')} if stats else None,
+        'grid': grid,
+        'version': room.allocation_version,
+        'proposal': proposal,
+    }
+
+
+def commit_proposal(token, max_age=None):
+    """
+    Writes a preview_batch proposal: upserts and releases the batch as
+    allocate_batch does, then inserts the proposed allocations in one
+    bulk_create, all in one transaction with the room row locked.
+
+    Returns (room, number of allocations written). Raises signing.BadSignature
+    (or SignatureExpired) for a bad or old token and StaleProposal when the room
+    has been written to since the preview.
+    """
+    data = signing.loads(token, salt=_SALT, max_age=PREVIEW_MAX_AGE if max_age is None else max_age)
+    with transaction.atomic():
+        room = Room.objects.select_for_update().filter(id=data['room']).first()
+        if room is None:
+            raise StaleProposal('The room no longer exists')
+        if room.allocation_version != data['version']:
+            raise StaleProposal(f'{room.name} has changed since the preview; preview again')
+        try:
+            department = Department.objects.get(id=data['department'])
+            semester = Semester.objects.get(id=data['semester'])
+        except (Department.DoesNotExist, Semester.DoesNotExist):
+            raise StaleProposal('The department or semester no longer exists')
+
+        rolls = parse_roll_intervals(data['rolls'])
+        students, _, released_room_ids = upsert_and_release_students(rolls, department, semester, keep=data['keep'])
+        by_roll = {student.roll_number: student for student in students}
+        allocations = [SeatAllocation(seat_id=seat_id, student=by_roll[roll]) for seat_id, roll in data['seats']]
+        SeatAllocation.objects.bulk_create(allocations)
+        allocation_changed(room_ids=released_room_ids | {room.id}, rolls=rolls)
+    return room, len(allocations)
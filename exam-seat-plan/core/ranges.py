@@ -0,0 +1,69 @@
+"""
+Roll range compression for the master plan and its exports.
+
+compress_ranges() turns a class's seated rolls, already in roll order, into
+"first - last" runs per room in one pass, holding only the run it is
+building. Rolls of the same room are one run while each is less than `gap`
+from the previous one, so "1-10 excluding 9" still reads "1 - 10" but two
+far-apart batches in one room stay separate.
+"""
+import re
+from collections import namedtuple
+
+from django.conf import settings
+
+# Default gap tolerance (see compress_ranges)
+RANGE_GAP = getattr(settings, 'MASTER_PLAN_RANGE_GAP', 100)
+
+RollRange = namedtuple('RollRange', ['room_id', 'first_roll', 'last_roll', 'count'])
+
+_DIGITS = re.compile(r'\d+')
+
+
+def roll_number(roll):
+    """The last run of digits in a roll as an int ("CT-2023-042" -> 42), or None."""
+    digits = _DIGITS.findall(roll)
+    return int(digits[-1]) if digits else None
+
+
+def roll_sort_key(roll):
+    # Numeric rolls in numeric order, anything else after them
+    return (0, int(roll), '') if roll.isdigit() else (1, 0, roll)
+
+
+def seated_rolls(pairs):
+    """
+    (room_id, roll) pairs of one class -> (room_id, roll_number, roll) in roll
+    order, sorted in Python. Queries order by Student's stored roll key instead.
+    """
+    return sorted(
+        ((room_id, roll_number(roll), roll) for room_id, roll in pairs),
+        key=lambda item: roll_sort_key(item[2]),
+    )
+
+
+def compress_ranges(rows, gap=None):
+    """
+    Yields a RollRange per run of `rows`, (room_id, numeric roll, roll)
+    tuples of one class in roll order; numeric roll may be None (never
+    joined to a run). `gap` defaults to settings.MASTER_PLAN_RANGE_GAP.
+    """
+    gap = RANGE_GAP if gap is None else gap
+    room_id = first = last = previous = None
+    count = 0
+    for row_room, number, roll in rows:
+        if count and row_room == room_id and number is not None and previous is not None \
+                and 0 < number - previous < gap:
+            last = roll
+            count += 1
+        else:
+            if count:
+                yield RollRange(room_id, first, last, count)
+            room_id, first, last, count = row_room, roll, roll, 1
+        previous = number
+    if count:
+        yield RollRange(room_id, first, last, count)
+
+
+def format_range(first, last, count):
+    return first if count == 1 else f'{first} - {last}'
@@ -0,0 +1,502 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import IntegerField, Q
+from django.db.models.functions import Cast
+
+from .caching import allocation_changed, invalidate_seat_lookups
+from .layout import SeatBitmap, layouts_from_seats, save_room_layout
+from .models import LayoutTemplate, Room, Seat, SeatAllocation, Student
+from .utils import RollIntervals, allocate_seats, interleave_by_group
+
+UPSERT_CHUNK_SIZE = 500
+# Seats inserted per INSERT when rooms are created or grow
+SEAT_BATCH_SIZE = 1000
+
+
+def bulk_upsert_students(entries, chunk_size=UPSERT_CHUNK_SIZE):
+    """
+    Creates or updates students from (roll_number, department_id, semester_id) entries.
+
+    Each chunk costs a constant number of queries (one lookup, one bulk insert,
+    one bulk update, one re-read of the inserted rows) no matter how many rolls
+    are submitted. Runs in a single transaction.
+
+    Returns the Student objects in input order (duplicate rolls collapse to the
+    last entry).
+    """
+    students = {}
+    with transaction.atomic():
+        for chunk in iter_bulk_upsert_students(entries, chunk_size):
+            students.update((s.roll_number, s) for s in chunk)
+    return list(students.values())
+
+
+def iter_bulk_upsert_students(entries, chunk_size=UPSERT_CHUNK_SIZE):
+    """
+    Streaming form of bulk_upsert_students: consumes `entries` lazily and yields
+    the upserted Students one chunk at a time, so only a chunk is held in memory.
+    The caller owns the transaction.
+    """
+    chunk = {}
+    for roll, department_id, semester_id in entries:
+        chunk[roll] = (department_id, semester_id)
+        if len(chunk) >= chunk_size:
+            yield list(upsert_student_chunk(chunk).values())
+            chunk = {}
+    if chunk:
+        yield list(upsert_student_chunk(chunk).values())
+
+
+def upsert_students(roll_numbers, department, semester):
+    """Creates or updates a Department/Semester batch of rolls. See bulk_upsert_students."""
+    return bulk_upsert_students((roll, department.id, semester.id) for roll in roll_numbers)
+
+
+def upsert_and_release_students(rolls, department, semester, keep):
+    """
+    Upserts a (possibly huge) RollIntervals batch chunk by chunk and clears the
+    current allocations of every student in it.
+
+    Only the first `keep` Students are returned; those are the only ones an
+    allocation run with `keep` seats could place. Must be called inside a
+    transaction.
+
+    Returns (kept students, RollIntervals of the rolls that were not kept,
+    ids of the rooms the batch's students were released from).
+    """
+    kept = []
+    released_room_ids = set()
+    entries = ((roll, department.id, semester.id) for roll in rolls)
+    for chunk in iter_bulk_upsert_students(entries):
+        released_room_ids |= release_students(chunk)
+        if len(kept) < keep:
+            kept.extend(chunk[:keep - len(kept)])
+    return kept, rolls.split(len(kept))[1], released_room_ids
+
+
+def release_students(students):
+    """Deletes the current allocations of `students`. Returns the ids of the rooms they left."""
+    allocations = SeatAllocation.objects.filter(student__in=students)
+    room_ids = set(allocations.values_list('seat__room_id', flat=True))
+    if room_ids:
+        allocations.delete()
+    room_ids.discard(None)
+    return room_ids
+
+
+def upsert_student_chunk(chunk, stats=None):
+    """Upserts {roll: (department_id, semester_id)}; adds created/updated counts to `stats` if given."""
+    existing = Student.objects.in_bulk(list(chunk), field_name='roll_number')
+
+    to_create = []
+    to_update = []
+    for roll, (department_id, semester_id) in chunk.items():
+        student = existing.get(roll)
+        if student is None:
+            to_create.append(Student(roll_number=roll, department_id=department_id, semester_id=semester_id))
+        elif (student.department_id, student.semester_id) != (department_id, semester_id):
+            student.department_id = department_id
+            student.semester_id = semester_id
+            to_update.append(student)
+
+    if to_create:
+        Student.objects.bulk_create(to_create)
+        # Not every backend returns primary keys from a bulk insert (MariaDB
+        # here), so re-read the new rows in one query.
+        existing.update(Student.objects.in_bulk([s.roll_number for s in to_create], field_name='roll_number'))
+    if to_update:
+        Student.objects.bulk_update(to_update, ['department', 'semester'])
+    if stats is not None:
+        stats['created'] += len(to_create)
+        stats['updated'] += len(to_update)
+
+    return {roll: existing[roll] for roll in chunk}
+
+
+class PhaseTimer:
+    """Wall time per named phase, in the order they first ran: `with timer('upsert'): ...`."""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def __call__(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def _untimed(name):
+    return nullcontext()
+
+
+def load_free_seats(rooms):
+    """{room_id: [free active Seat]} for `rooms`, in one query."""
+    seats_by_room = defaultdict(list)
+    free_seats = Seat.objects.filter(
+        room__in=rooms, is_active=True, allocation__isnull=True
+    ).order_by('room_id', 'row', 'col')
+    for seat in free_seats:
+        seats_by_room[seat.room_id].append(seat)
+    return seats_by_room
+
+
+def place_students(rooms, seats_by_room, students, algorithm='linear'):
+    """
+    Runs the allocator room by room over preloaded seats, in memory.
+    Returns (new SeatAllocations, per-room summary, students left over); with
+    anti_cheat_max a room's summary also has 'greedy', the greedy baseline.
+    """
+    # The anti-cheat allocators interleave the groups; do it once, not per room.
+    # Dropping each room's placed students keeps the rest in interleaved order.
+    remaining = interleave_by_group(students) if algorithm in ('anti_cheat', 'anti_cheat_max') else students
+    new_allocations = []
+    summary = []
+    for room in rooms:
+        room_seats = seats_by_room.get(room.id, [])
+        stats = {}
+        allocations = allocate_seats(
+            room, remaining, algorithm, seats=room_seats, stats=stats, interleaved=True,
+        ) if remaining else []
+
+        placed = {alloc.student.id for alloc in allocations}
+        remaining = [s for s in remaining if s.id not in placed]
+        new_allocations.extend(allocations)
+        summary.append({
+            'id': room.id,
+            'name': room.name,
+            'allocated': len(allocations),
+            'free': len(room_seats) - len(allocations),
+        })
+        if stats:
+            # anti_cheat_max: what the greedy anti_cheat would have placed
+            summary[-1]['greedy'] = stats['greedy']
+    return new_allocations, summary, remaining
+
+
+def allocate_batch(room, department, semester, rolls, algorithm='linear', stats=None):
+    """
+    Allocates one Department/Semester batch (RollIntervals) into one room, the
+    allocate_view workflow, in one transaction. `stats` as for allocate_seats.
+
+    Returns (new allocations, RollIntervals of the rolls that could not be placed).
+    """
+    with transaction.atomic():
+        # Create or Update Students with selected Dept/Sem in chunks and clear their
+        # prior allocations. A single batch is one group, so only the first
+        # `capacity` students can ever be seated; only those are kept in memory.
+        students, overflow_rolls, released_room_ids = upsert_and_release_students(
+            rolls, department, semester, keep=room.capacity
+        )
+
+        # Incremental allocation: existing allocations in the room (e.g. other
+        # departments) are kept, allocate_seats only fills empty active seats.
+        new_allocations = allocate_seats(room, students, algorithm, stats=stats)
+
+        SeatAllocation.objects.bulk_create(new_allocations)
+        allocation_changed(room_ids=released_room_ids | {room.id}, rolls=rolls)
+
+    allocated = {alloc.student.id for alloc in new_allocations}
+    unallocated = RollIntervals.from_rolls(s.roll_number for s in students if s.id not in allocated)
+    return new_allocations, unallocated | overflow_rolls
+
+
+def allocate_exam_batches(rooms, batches, algorithm='linear', timer=None, dry_run=False):
+    """
+    Allocates every batch across an ordered list of rooms in one transaction.
+    `batches` is a list of (department, semester, RollIntervals). Students are
+    upserted chunk by chunk (releasing their current seats); per batch only as
+    many as there are active seats in total are kept for the allocator. Free
+    seats are then loaded in one query, placed in memory and written in batches.
+
+    `timer` (a PhaseTimer) records the upsert, seat load, allocate and write
+    phases. With `dry_run` nothing is written and the upserts are rolled back.
+
+    Returns {'rooms': per-room summary, 'allocated': int, 'unplaced': RollIntervals}.
+    """
+    timer = timer or _untimed
+    with transaction.atomic():
+        with timer('upsert'):
+            # No batch can place more students than there are active seats in total
+            capacity = Seat.objects.filter(room__in=rooms, is_active=True).count()
+            students = []
+            unplaced = RollIntervals()
+            submitted = RollIntervals()
+            released = set()
+            for department, semester, rolls in batches:
+                kept, overflow, released_room_ids = upsert_and_release_students(
+                    rolls, department, semester, keep=capacity,
+                )
+                students.extend(kept)
+                unplaced |= overflow
+                submitted |= rolls
+                released |= released_room_ids
+
+        with timer('seat load'):
+            seats_by_room = load_free_seats(rooms)
+        with timer('allocate'):
+            new_allocations, summary, remaining = place_students(rooms, seats_by_room, students, algorithm)
+
+        if dry_run:
+            transaction.set_rollback(True)
+        else:
+            with timer('write'):
+                SeatAllocation.objects.bulk_create(new_allocations, batch_size=SEAT_BATCH_SIZE)
+                # Cover the rooms written to, the rooms students left and every submitted roll
+                allocation_changed(room_ids=released | {room.id for room in rooms}, rolls=submitted)
+
+    return {
+        'rooms': summary,
+        'allocated': len(new_allocations),
+        'unplaced': unplaced | RollIntervals.from_rolls(s.roll_number for s in remaining),
+    }
+
+
+def rooms_by_free_seats(min_free=1, exclude_ids=()):
+    """
+    Rooms with at least `min_free` free active seats, most free first. One query
+    over the stored seat counters; each room carries `free`.
+    """
+    free = Cast('active_seats', IntegerField()) - Cast('occupied_seats', IntegerField())
+    return (
+        Room.objects.exclude(id__in=exclude_ids)
+        .annotate(free=free)
+        .filter(free__gte=min_free)
+        .order_by('-free', 'name')
+    )
+
+
+def anti_cheat_estimates(rooms, department_id, semester_id):
+    """
+    {room.id: how many more students of one (department, semester) group the room
+    can take with no two of the group side by side (row or column neighbours)}.
+
+    Walks the free active seats in the anti_cheat allocation order (column by
+    column) and places greedily, treating seats next to existing students of
+    the group as unavailable, so the figure errs on the low side. Active seats
+    come from the rooms' layout bitmaps; one query reads the occupied seats.
+    """
+    layouts = {room.id: SeatBitmap.for_room(room) for room in rooms}
+    missing = [room for room in rooms if layouts[room.id] is None]
+    if missing:
+        layouts.update(layouts_from_seats(missing))
+
+    occupied = defaultdict(dict)
+    allocations = SeatAllocation.objects.filter(seat__room__in=rooms).values_list(
+        'seat__room_id', 'seat__row', 'seat__col', 'student__department_id', 'student__semester_id',
+    )
+    for room_id, row, col, dept_id, sem_id in allocations.iterator(chunk_size=2000):
+        occupied[room_id][(row, col)] = (dept_id, sem_id)
+
+    estimates = {}
+    for room in rooms:
+        taken = occupied[room.id]
+        blocked = set()
+        for (row, col), group in taken.items():
+            if group == (department_id, semester_id):
+                blocked.update(((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)))
+        fit = 0
+        for row, col in sorted(layouts[room.id].active_cells(), key=lambda cell: (cell[1], cell[0])):
+            if (row, col) in taken or (row, col) in blocked:
+                continue
+            fit += 1
+            blocked.update(((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)))
+        estimates[room.id] = fit
+    return estimates
+
+
+def suggest_rooms(department=None, semester=None, min_free=1, exclude_ids=(), anti_cheat=False):
+    """
+    Overflow suggestions: [{'id', 'name', 'available', 'anti_cheat_fit'}] ranked by
+    free seats. anti_cheat_fit (None unless requested) is the anti_cheat_estimates
+    figure for the given department/semester.
+    """
+    rooms = list(rooms_by_free_seats(min_free, exclude_ids).only('id', 'name', 'rows', 'cols', 'layout'))
+    fits = {}
+    if anti_cheat and department is not None and semester is not None:
+        fits = anti_cheat_estimates(rooms, department.id, semester.id)
+    return [
+        {'id': r.id, 'name': r.name, 'available': r.free, 'anti_cheat_fit': fits.get(r.id)}
+        for r in rooms
+    ]
+
+
+def set_seat_layout(room, active):
+    """
+    Applies {(row, col): is_active} to a room's seats in one transaction: one
+    query reads the seats with their occupancy, one bulk_update writes the
+    changed flags.
+
+    Nothing is written if any change would disable an occupied seat; those
+    cells come back as conflicts. Cells without a Seat are ignored.
+
+    Returns (number of seats changed, [(row, col) conflicts], layout), where
+    layout is one string per row: '1' active, '0' inactive, '2' occupied, '.' no seat.
+    """
+    with transaction.atomic():
+        seats = Seat.objects.filter(room=room).values_list('id', 'row', 'col', 'is_active', 'allocation__id')
+
+        cells = [['.'] * room.cols for _ in range(room.rows)]
+        changed, conflicts = [], []
+        for seat_id, row, col, is_active, allocation_id in seats:
+            wanted = active.get((row, col), is_active)
+            if allocation_id and not wanted:
+                conflicts.append((row, col))
+            elif wanted != is_active:
+                changed.append(Seat(id=seat_id, is_active=wanted))
+                is_active = wanted
+            if row <= room.rows and col <= room.cols:
+                cells[row - 1][col - 1] = '2' if allocation_id else ('1' if is_active else '0')
+
+        if conflicts:
+            return 0, sorted(conflicts), None
+        if changed:
+            Seat.objects.bulk_update(changed, ['is_active'], batch_size=1000)
+            save_room_layout(room, SeatBitmap.from_cells(room.rows, room.cols, [
+                (r, c) for r, line in enumerate(cells, start=1) for c, flag in enumerate(line, start=1) if flag in '12'
+            ]))
+            allocation_changed(room_ids=[room.id])
+    return len(changed), [], [''.join(row) for row in cells]
+
+
+def resize_room(room, rows, cols):
+    """
+    Resizes a room in one transaction, touching only the seats that change:
+    seats outside the new size are removed with one set-based delete (their
+    allocations first), and only the cells the room gains are inserted, in
+    batches. Surviving cells keep their active flag in the layout bitmap.
+
+    `room.name` is saved too; on a rename, cached seat lookups of everyone
+    seated in the room are dropped, since they carry the room name.
+
+    Returns the displaced students grouped by class, so they can be allocated
+    again: [{'department_id', 'department', 'semester_id', 'semester', 'rolls', 'count'}],
+    where 'rolls' is compact text the allocate form accepts.
+    """
+    old_rows, old_cols = room.rows, room.cols
+    layout = SeatBitmap.for_room(room)
+
+    with transaction.atomic():
+        renamed = Room.objects.filter(id=room.id).exclude(name=room.name).exists()
+        removed = Seat.objects.filter(room=room).filter(Q(row__gt=rows) | Q(col__gt=cols))
+        displaced = list(SeatAllocation.objects.filter(seat__in=removed).order_by(
+            'student__roll_prefix', 'student__roll_num', 'student__roll_number',
+        ).values_list(
+            'student__roll_number', 'student__department_id', 'student__department__code',
+            'student__semester_id', 'student__semester__number',
+        ))
+        if rows < old_rows or cols < old_cols:
+            # Allocations have no dependents, so this is a single DELETE; with them gone
+            # the seats' cascade finds nothing and the seats go in a set-based delete too.
+            SeatAllocation.objects.filter(seat__in=removed).delete()
+            removed.delete()
+
+        new_seats = (
+            Seat(room=room, row=r, col=c)
+            for r in range(1, rows + 1)
+            for c in range(1, cols + 1)
+            if r > old_rows or c > old_cols
+        )
+        while True:
+            batch = list(islice(new_seats, SEAT_BATCH_SIZE))
+            if not batch:
+                break
+            Seat.objects.bulk_create(batch, ignore_conflicts=True)
+
+        room.rows, room.cols = rows, cols
+        room.save(update_fields=['name', 'rows', 'cols'])
+        save_room_layout(room, layout.resized(rows, cols) if layout else None)
+        allocation_changed(room_ids=[room.id], rolls=[roll for roll, *_ in displaced])
+        if renamed:
+            invalidate_seat_lookups(list(
+                SeatAllocation.objects.filter(seat__room=room).values_list('student__roll_number', flat=True)
+            ))
+
+    groups = defaultdict(list)
+    for roll, dept_id, dept_code, sem_id, sem_number in displaced:
+        groups[(dept_id, dept_code, sem_id, sem_number)].append(roll)
+    return [
+        {'department_id': dept_id, 'department': dept_code, 'semester_id': sem_id, 'semester': sem_number,
+         'rolls': format_rolls(rolls), 'count': len(rolls)}
+        for (dept_id, dept_code, sem_id, sem_number), rolls in sorted(groups.items(), key=lambda g: (g[0][3], g[0][1]))
+    ]
+
+
+def format_rolls(rolls):
+    """
+    Compact text for a list of rolls in natural order ("1001-1005, 1009");
+    non-numeric rolls are listed as they are, after the numeric ones.
+    """
+    numeric = [r for r in rolls if r.isdigit()]
+    other = [r for r in rolls if not r.isdigit()]
+    parts = [str(RollIntervals.from_rolls(numeric))] if numeric else []
+    return ', '.join(parts + other)
+
+
+def save_layout_template(room, name):
+    """Saves (or overwrites) the layout template `name` from the room's size and active seats."""
+    layout = SeatBitmap.for_room(room) or layouts_from_seats([room])[room.id]
+    template, _ = LayoutTemplate.objects.update_or_create(
+        name=name, defaults={'rows': room.rows, 'cols': room.cols, 'layout': layout.to_bytes()}
+    )
+    return template
+
+
+def create_rooms_from_layout(names, layout):
+    """
+    Creates one room per name with the SeatBitmap `layout`, in one transaction.
+    Rooms are inserted one by one (their ids are needed and MariaDB returns
+    none from bulk inserts); every room's seats then go in in batches of
+    SEAT_BATCH_SIZE.
+    """
+    with transaction.atomic():
+        rooms = [
+            Room.objects.create(name=name, rows=layout.rows, cols=layout.cols, layout=layout.to_bytes())
+            for name in names
+        ]
+        seats = (
+            Seat(room=room, row=r, col=c, is_active=layout[r, c])
+            for room in rooms
+            for r in range(1, layout.rows + 1)
+            for c in range(1, layout.cols + 1)
+        )
+        while True:
+            batch = list(islice(seats, SEAT_BATCH_SIZE))
+            if not batch:
+                break
+            Seat.objects.bulk_create(batch)
+        allocation_changed(room_ids=[room.id for room in rooms])
+    return rooms
+
+
+def apply_layout_template(template, rooms):
+    """
+    Gives existing rooms the template's size and walkways. Each room is its own
+    savepoint: a room where the pattern would disable an occupied seat is left
+    untouched and reported.
+
+    Returns [{'id', 'name', 'displaced', 'conflicts'}], displaced as from resize_room.
+    """
+    layout = SeatBitmap(template.rows, template.cols, bytes(template.layout))
+    wanted = {(r, c): layout[r, c] for r in range(1, layout.rows + 1) for c in range(1, layout.cols + 1)}
+    results = []
+    with transaction.atomic():
+        for room in rooms:
+            with transaction.atomic():
+                displaced = []
+                if (room.rows, room.cols) != (layout.rows, layout.cols):
+                    displaced = resize_room(room, layout.rows, layout.cols)
+                _, conflicts, _ = set_seat_layout(room, wanted)
+                if conflicts:
+                    transaction.set_rollback(True)
+                    displaced = []
+            if conflicts:
+                room.refresh_from_db()
+            results.append({'id': room.id, 'name': room.name, 'displaced': displaced, 'conflicts': conflicts})
+    return results
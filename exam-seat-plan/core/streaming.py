@@ -0,0 +1,63 @@
+import zipfile
+
+
+class _ChunkSink:
+    """Write-only file object that hands out whatever was written since the last drain()."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    """
+    Builds a ZIP archive incrementally for a StreamingHttpResponse: after each
+    add(), drain() returns the bytes produced so far, so only one member is
+    ever held in memory. zipfile writes data descriptors because the sink
+    cannot seek.
+    """
+
+    def __init__(self, compression=zipfile.ZIP_DEFLATED):
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', compression=compression)
+
+    def add(self, name, data):
+        self._zip.writestr(name, data)
+        return self._sink.drain()
+
+    def add_stream(self, name, chunks):
+        """
+        Writes one member from an iterable of byte strings, yielding the
+        archive bytes as they are produced, so a large member is never held
+        in memory either.
+        """
+        with self._zip.open(name, 'w', force_zip64=True) as member:
+            for chunk in chunks:
+                member.write(chunk)
+                data = self._sink.drain()
+                if data:
+                    yield data
+        yield self._sink.drain()
+
+    def drain(self):
+        return self._sink.drain()
+
+    def close(self):
+        self._zip.close()
+        return self._sink.drain()
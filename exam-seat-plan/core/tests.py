@@ -1,7 +1,35 @@
-from django.test import TestCase, Client
+import json
+import tempfile
+import zipfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import Room, Department, Semester, Student, Seat
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from .models import Room, Department, Semester, Student, Seat, SeatAllocation, PlanVersion, LayoutTemplate, MasterPlanEntry, Job
+from .caching import lookup_seat, refresh_room_counters
+from .exports import iter_xlsx
+from .imports import import_students, open_rows
+from .jobs import enqueue, requeue_stale, run_job, work
+from .master_plan import refresh_master_plan
+from .ranges import compress_ranges, seated_rolls
+from .layout import SeatBitmap, decode_layout, encode_layout, layouts_from_seats, rebuild_room_layouts
+from .services import rooms_by_free_seats, upsert_students
+from .utils import (
+    allocate_greedy_anti_cheat, allocate_grid_anti_cheat, allocate_optimized_anti_cheat, allocate_seats,
+    interleave_by_group,
+    parse_roll_intervals, parse_student_input,
+)
 
 class CoreTest(TestCase):
     def setUp(self):
@@ -19,6 +47,8 @@ class CoreTest(TestCase):
         # Create Seats
         seats = [Seat(room=self.room, row=r, col=c) for r in range(1, 6) for c in range(1, 6)]
         Seat.objects.bulk_create(seats)
+        # Seats were created directly, bring the room counters up to date
+        refresh_room_counters([self.room.id])
 
     def test_dashboard_load(self):
         response = self.client.get(reverse('dashboard'))
@@ -53,6 +83,462 @@ class CoreTest(TestCase):
         allocated_count = Seat.objects.filter(room=self.room, allocation__isnull=False).count()
         self.assertEqual(allocated_count, 3)
 
+    def test_zero_padded_rolls(self):
+        self.assertEqual(parse_student_input('0101'), ['0101'])
+        rolls = parse_roll_intervals('0101, 101, 0098-0100, -0099')
+        self.assertEqual(list(rolls), ['101', '0098', '0100', '0101'])
+        self.assertEqual(str(parse_roll_intervals(str(rolls))), str(rolls))
+        self.assertTrue('0101' in rolls and '101' in rolls and '0099' not in rolls)
+
+        Student.objects.create(roll_number='0101', department=self.dept, semester=self.sem)
+        self.client.post(reverse('allocate_view'), {
+            'room_id': self.room.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+            'student_data': '0101', 'algorithm': 'linear',
+        })
+        self.assertEqual(list(Student.objects.values_list('roll_number', flat=True)), ['0101'])
+        self.assertTrue(SeatAllocation.objects.filter(student__roll_number='0101').exists())
+        self.assertEqual(list(Student.objects.in_rolls(parse_roll_intervals('101'))), [])
+
+        # Padded ranges are listed roll by roll, so an oversized one is refused rather than dropped
+        with self.assertRaises(ValueError):
+            parse_roll_intervals('00001-20000')
+        response = self.client.post(reverse('allocate_view'), {
+            'room_id': self.room.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+            'student_data': '00001-20000, 0101', 'algorithm': 'linear', 'async': '1',
+        }, follow=True)
+        self.assertTrue(any('zero-padded range' in str(m) for m in response.context['messages']))
+        self.assertFalse(Job.objects.exists())
+        response = self.client.post(reverse('allocate_exam'), json.dumps({
+            'room_ids': [self.room.id],
+            'batches': [{'department_id': self.dept.id, 'semester_id': self.sem.id, 'student_data': '00001-20000'}],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Student.objects.count(), 1)
+
+    def test_allocate_exam_across_rooms(self):
+        room2 = Room.objects.create(name='Overflow Room', rows=2, cols=2)
+        Seat.objects.bulk_create([Seat(room=room2, row=r, col=c) for r in range(1, 3) for c in range(1, 3)])
+        eee = Department.objects.create(name='Electrical', code='EEE')
+
+        response = self.client.post(reverse('allocate_exam'), json.dumps({
+            'algorithm': 'linear_vertical',
+            'room_ids': [self.room.id, room2.id],
+            'batches': [
+                {'department_id': self.dept.id, 'semester_id': self.sem.id, 'student_data': '1001-1020'},
+                {'department_id': eee.id, 'semester_id': self.sem.id, 'student_data': '2001-2010'},
+            ],
+        }), content_type='application/json')
+
+        data = response.json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual([r['allocated'] for r in data['rooms']], [25, 4])
+        self.assertEqual(data['unplaced'], '2010')
+        self.assertEqual(SeatAllocation.objects.count(), 29)
+
+        # anti_cheat interleaves the groups once for the whole run, not once per room
+        with mock.patch('core.services.interleave_by_group', wraps=interleave_by_group) as once, \
+                mock.patch('core.utils.interleave_by_group', wraps=interleave_by_group) as per_room:
+            response = self.client.post(reverse('allocate_exam'), json.dumps({
+                'algorithm': 'anti_cheat', 'room_ids': [self.room.id, room2.id],
+                'batches': [
+                    {'department_id': self.dept.id, 'semester_id': self.sem.id, 'student_data': '1001-1020'},
+                    {'department_id': eee.id, 'semester_id': self.sem.id, 'student_data': '2001-2010'},
+                ],
+            }), content_type='application/json')
+        self.assertEqual(response.json()['status'], 'success')
+        self.assertEqual((once.call_count, per_room.call_count), (1, 0))
+
+        for body in ('{not json', '[]', json.dumps({'room_ids': [self.room.id], 'batches': ['CSE']}),
+                     json.dumps({'room_ids': [self.room.id], 'batches': [
+                         {'department_id': self.dept.id, 'semester_id': self.sem.id, 'student_data': [1001]}]})):
+            response = self.client.post(reverse('allocate_exam'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['status'], 'error')
+
+    def test_room_counters_and_constant_dashboard(self):
+        with CaptureQueriesContext(connection) as one_room:
+            self.client.get(reverse('dashboard'))
+        for i in range(10):
+            self.client.post(reverse('room_create'), {'name': f'Hall {i}', 'rows': 2, 'cols': 3})
+        with CaptureQueriesContext(connection) as many_rooms:
+            self.client.get(reverse('dashboard'))
+        self.assertEqual(len(one_room), len(many_rooms))
+
+        self.client.post(reverse('room_toggle_seat', args=[self.room.id]), json.dumps({
+            'row': 1, 'col': 1,
+        }), content_type='application/json')
+        self.client.post(reverse('allocate_view'), {
+            'room_id': self.room.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+            'student_data': '1001-1005', 'algorithm': 'linear_vertical',
+        })
+        self.client.post(reverse('student_delete', args=[Student.objects.get(roll_number='1001').id]))
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.total_seats, self.room.active_seats, self.room.occupied_seats), (25, 24, 4))
+
+        Room.objects.filter(id=self.room.id).update(occupied_seats=0)
+        refresh_room_counters()
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.occupied_seats, 4)
+        self.assertEqual(Room.objects.get(name='Hall 3').capacity, 6)
+
+    def test_free_seat_index(self):
+        hall = Room.objects.create(name='Hall', rows=2, cols=3)
+        Seat.objects.bulk_create([Seat(room=hall, row=r, col=c) for r in range(1, 3) for c in range(1, 4)])
+        other = Student.objects.create(roll_number='7001', department=self.dept, semester=self.sem)
+        SeatAllocation.objects.create(seat=Seat.objects.get(room=hall, row=1, col=1), student=other)
+        refresh_room_counters()
+
+        response = self.client.get(reverse('free_rooms'), {
+            'min_free': 3, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+        })
+        rooms = response.json()['rooms']
+        self.assertEqual([(r['name'], r['available']) for r in rooms], [('Test Room', 25), ('Hall', 5)])
+        # Hall: (1,1) is taken by the class, so (1,2) and (2,1) are out; (2,2) and then (1,3) fit
+        self.assertEqual([r['anti_cheat_fit'] for r in rooms], [13, 2])
+        self.assertEqual(self.client.get(reverse('free_rooms'), {'min_free': 6}).json()['rooms'][0]['anti_cheat_fit'], None)
+        self.assertEqual(self.client.get(reverse('free_rooms'), {'department_id': 'cse'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('free_rooms'), {'semester_id': '1st'}).status_code, 400)
+
+        with self.assertNumQueries(1):
+            self.assertEqual([r.name for r in rooms_by_free_seats(min_free=10)], ['Test Room'])
+
+    def test_batch_seat_layout(self):
+        student = Student.objects.create(roll_number='5001', department=self.dept, semester=self.sem)
+        SeatAllocation.objects.create(seat=Seat.objects.get(room=self.room, row=1, col=1), student=student)
+        url = reverse('room_seat_layout', args=[self.room.id])
+
+        # Disabling the occupied seat rejects the whole batch
+        response = self.client.post(url, json.dumps({'changes': [
+            {'row': 1, 'col': 1, 'active': False}, {'row': 1, 'col': 3, 'active': False},
+        ]}), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['conflicts'], [[1, 1]])
+        self.assertEqual(Seat.objects.filter(room=self.room, is_active=False).count(), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, json.dumps({
+                'mask': ['xx0xx', 'xx0xx', 'xx0xx', 'xx0xx', 'xx0xx'],
+            }), content_type='application/json')
+        self.assertEqual(response.json()['layout'], ['21011'] + ['11011'] * 4)
+        self.assertEqual(response.json()['changed'], 5)
+        self.assertLess(len(queries), 15)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.active_seats, 20)
+
+        response = self.client.post(url, json.dumps({'changes': [{'row': 6, 'col': 1, 'active': False}]}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_room_layout_bitmap(self):
+        self.client.post(reverse('room_create'), {'name': 'Hall', 'rows': 3, 'cols': 4})
+        hall = Room.objects.get(name='Hall')
+        self.assertEqual(SeatBitmap.for_room(hall).count(), 12)
+
+        self.client.post(reverse('room_seat_layout', args=[hall.id]), json.dumps({
+            'mask': ['1011', '1011', '1011'],
+        }), content_type='application/json')
+        self.client.post(reverse('room_edit', args=[hall.id]), {'name': 'Hall', 'rows': 4, 'cols': 3})
+        hall.refresh_from_db()
+        layout = SeatBitmap.for_room(hall)
+        self.assertEqual([layout[r, 2] for r in range(1, 5)], [False, False, False, True])
+        self.assertEqual(layout.to_bytes(), layouts_from_seats([hall])[hall.id].to_bytes())
+
+        # An empty room is drawn from the bitmap alone; only its emptiness is asked of the allocations
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('public_room_view', args=[hall.id]))
+        self.assertFalse([q for q in queries if 'core_seat' in q['sql'] and 'core_seatallocation' not in q['sql']])
+        self.assertEqual([seat.is_active for seat in response.context['grid'][0]], [True, False, True])
+
+        # Rooms without a bitmap are backfilled from their Seat rows
+        self.assertIsNone(SeatBitmap.for_room(self.room))
+        rebuild_room_layouts([self.room.id])
+        self.room.refresh_from_db()
+        self.assertEqual(SeatBitmap.for_room(self.room).count(), 25)
+
+    def test_room_resize_reports_displaced_students(self):
+        self.client.post(reverse('allocate_view'), {
+            'room_id': self.room.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+            'student_data': '1001-1025', 'algorithm': 'linear',
+        })
+        response = self.client.post(reverse('room_edit', args=[self.room.id]),
+                                    {'name': 'Test Room', 'rows': 4, 'cols': 6}, follow=True)
+
+        seats = Seat.objects.filter(room=self.room)
+        self.assertEqual(seats.count(), 24)
+        self.assertEqual(seats.filter(row__gt=4).count() + seats.filter(col__gt=6).count(), 0)
+        # Linear fills column by column, so row 5 held every fifth roll
+        self.assertEqual(SeatAllocation.objects.filter(seat__room=self.room).count(), 20)
+        warning = [str(m) for m in response.context['messages'] if m.level_tag == 'warning'][0]
+        self.assertIn('5 CSE-1 students', warning)
+        self.assertIn('1005, 1010, 1015, 1020, 1025', warning)
+        self.assertEqual(Student.objects.count(), 25)
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.total_seats, self.room.occupied_seats), (24, 20))
+
+    def test_layout_templates(self):
+        self.client.post(reverse('room_create'), {'name': 'Hall', 'rows': 3, 'cols': 4})
+        hall = Room.objects.get(name='Hall')
+        self.client.post(reverse('room_seat_layout', args=[hall.id]), json.dumps({
+            'mask': ['1011', '1011', '1011'],
+        }), content_type='application/json')
+        self.client.post(reverse('room_save_template', args=[hall.id]), {'name': 'Walkway'})
+        template = LayoutTemplate.objects.get(name='Walkway')
+        self.assertEqual(encode_layout(SeatBitmap(3, 4, bytes(template.layout))), '#.2#*3')
+        self.assertEqual(decode_layout('#.2#*3').to_bytes(), bytes(template.layout))
+        with self.assertRaises(ValueError):
+            decode_layout('3#/2#')
+
+        self.client.post(reverse('rooms_from_template'), {'template_id': template.id, 'prefix': 'Block', 'count': 3})
+        blocks = Room.objects.filter(name__startswith='Block ')
+        self.assertEqual(blocks.count(), 3)
+        self.assertEqual(Seat.objects.filter(room__in=blocks).count(), 36)
+        self.assertEqual([b.active_seats for b in blocks], [9, 9, 9])
+
+        # A room where the pattern would disable a taken seat is left as it was
+        self.client.post(reverse('allocate_view'), {
+            'room_id': self.room.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+            'student_data': '1001-1010', 'algorithm': 'linear',
+        })
+        response = self.client.post(reverse('apply_template', args=[template.id]),
+                                    json.dumps({'room_ids': [self.room.id]}), content_type='application/json')
+        self.assertTrue(response.json()['rooms'][0]['conflicts'])
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.rows, self.room.cols, self.room.total_seats), (5, 5, 25))
+
+        # Text export/import round trip, then provisioning from the command line
+        out = StringIO()
+        call_command('room_layouts', 'export', stdout=out)
+        self.assertEqual(out.getvalue(), 'Walkway | 3x4 | #.2#*3\n')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'layouts.txt'
+            path.write_text('Lab | 2x3 | 3#/.2#\n')
+            call_command('room_layouts', 'import', str(path), stdout=StringIO())
+        call_command('room_layouts', 'provision', 'Lab', '--count', '2', stdout=StringIO())
+        labs = Room.objects.filter(name__startswith='Lab ')
+        self.assertEqual([(lab.total_seats, lab.active_seats) for lab in labs], [(6, 5), (6, 5)])
+
+    def test_master_plan_table(self):
+        annex, hall = Room.objects.create(name='Annex', rows=2, cols=3), Room.objects.create(name='Hall', rows=2, cols=2)
+        Seat.objects.bulk_create([Seat(room=annex, row=r, col=c) for r in (1, 2) for c in (1, 2, 3)] +
+                                 [Seat(room=hall, row=r, col=c) for r in (1, 2) for c in (1, 2)])
+        refresh_room_counters([annex.id, hall.id])
+        other = Department.objects.create(name='Civil', code='CT')
+        for room, dept, rolls in ((self.room, self.dept, '1001-1010, 1012'), (annex, other, '2001-2005')):
+            self.client.post(reverse('allocate_view'), {
+                'room_id': room.id, 'department_id': dept.id, 'semester_id': self.sem.id,
+                'student_data': rolls, 'algorithm': 'linear',
+            })
+        ranges = lambda dept: list(MasterPlanEntry.objects.filter(department=dept).values_list(
+            'first_roll', 'last_roll', 'student_count'))
+        self.assertEqual(ranges(self.dept), [('1001', '1012', 11)])
+        self.assertEqual(ranges(other), [('2001', '2005', 5)])
+
+        # Moving students to another room rebuilds only the classes in the rooms involved
+        civil_ids = list(MasterPlanEntry.objects.filter(department=other).values_list('id', flat=True))
+        self.client.post(reverse('allocate_view'), {
+            'room_id': hall.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+            'student_data': '1011-1012', 'algorithm': 'linear',
+        })
+        self.assertEqual(ranges(self.dept), [('1001', '1010', 10), ('1011', '1012', 2)])
+        self.assertEqual(list(MasterPlanEntry.objects.filter(department=other).values_list('id', flat=True)), civil_ids)
+
+        # Deleting a room drops its ranges
+        self.client.get(reverse('room_delete', args=[hall.id]))
+        self.assertEqual(ranges(self.dept), [('1001', '1010', 10)])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('master_plan_view'))
+        self.assertContains(response, '1001 - 1010')
+        self.assertContains(response, '2001 - 2005')
+        self.assertLess(len(queries), 8)
+
+        response = self.client.get(reverse('master_plan_export'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['semester,department,room,first_roll,last_roll,students',
+                                 '1st,CSE,Test Room,1001,1010,10', '1st,CT,Annex,2001,2005,5'])
+        self.client.post(reverse('room_manage_seat', args=[self.room.id]), json.dumps(
+            {'row': 3, 'col': 1, 'action': 'delete'}), content_type='application/json')
+        response = self.client.get(reverse('master_plan_export'), {'format': 'json', 'gap': 2})
+        self.assertEqual([row[3:] for row in response.json()['ranges']],
+                         [['1001', '1002', 2], ['1004', '1010', 7], ['2001', '2005', 5]])
+
+        MasterPlanEntry.objects.all().delete()
+        refresh_master_plan()
+        self.assertEqual(MasterPlanEntry.objects.count(), 2)
+
+    def test_student_natural_roll_order(self):
+        for roll in ['99', '1001', 'CT-10', 'CT-9', 'ABC']:
+            Student.objects.create(roll_number=roll, department=self.dept, semester=self.sem)
+        upsert_students(['150', '1500', '20'], self.dept, self.sem)
+        student = Student.objects.get(roll_number='CT-9')
+        student.roll_number = 'CT-11'
+        student.save(update_fields=['roll_number'])
+
+        self.assertEqual(list(Student.objects.natural_order().values_list('roll_number', flat=True)),
+                         ['20', '99', '150', '1001', '1500', 'ABC', 'CT-10', 'CT-11'])
+        response = self.client.get(reverse('manage_students'), {'rolls': '100-1200'})
+        self.assertEqual([s.roll_number for s in response.context['students']], ['150', '1001'])
+        self.assertEqual(Student.objects.get(roll_number='CT-11').roll_num, 11)
+
+    def test_allocation_export(self):
+        other = Department.objects.create(name='Civil', code='CT')
+        for dept, rolls in ((self.dept, '1001-1003'), (other, '2001-2002')):
+            self.client.post(reverse('allocate_view'), {
+                'room_id': self.room.id, 'department_id': dept.id, 'semester_id': self.sem.id,
+                'student_data': rolls, 'algorithm': 'linear',
+            })
+
+        response = self.client.get(reverse('allocation_export', args=['csv']),
+                                   {'department': self.dept.id, 'order': 'roll'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'roll_number,department,department_name,semester,semester_name,room,row,col')
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], ['1001', '1002', '1003'])
+        self.assertEqual(lines[1], '1001,CSE,Computer,1,1st,Test Room,1,1')
+        self.assertEqual(self.client.get(reverse('allocation_export', args=['csv']), {'order': 'x'}).status_code, 400)
+
+        response = self.client.get(reverse('allocation_export', args=['xlsx']), {'room': self.room.id})
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as workbook:
+            sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        ns = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = sheet.findall('.//x:row', ns)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(''.join(rows[4].itertext())[:4], '2001')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'allocations.csv'
+            call_command('export_allocations', str(path), '--department', 'CT', stdout=StringIO())
+            self.assertEqual(len(path.read_text().splitlines()), 3)
+
+    def test_student_import(self):
+        eee = Department.objects.create(name='Electrical', code='EEE')
+        self.client.post(reverse('allocate_view'), {
+            'room_id': self.room.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+            'student_data': '1001-1002', 'algorithm': 'linear',
+        })
+        csv_text = (
+            'Roll No,Dept,Sem\n1001,EEE,1\n1003,CSE,1\n,CSE,1\n1004,XYZ,1\n1005,CSE,9\n\n'
+            + ''.join(f'{roll},CSE,1\n' for roll in range(2000, 2010))
+        )
+        with tempfile.TemporaryDirectory() as tmp, override_settings(MEDIA_ROOT=tmp), \
+                mock.patch('core.jobs.JOB_DIR', Path(tmp) / 'jobs'):
+            upload = SimpleUploadedFile('registrar.csv', csv_text.encode('utf-8'), content_type='text/csv')
+            response = self.client.post(reverse('student_import') + '?async=1', {'file': upload})
+            self.assertEqual(response.status_code, 202)
+            job_id = response.json()['job_id']
+            work(once=True)
+
+            status = self.client.get(reverse('job_status', args=[job_id])).json()
+            self.assertEqual(status['status'], 'done')
+            report = status['result']
+            self.assertEqual((report['rows'], report['created'], report['updated'], report['bad_rows']), (15, 11, 1, 3))
+            self.assertEqual([line for line, _ in report['errors']], [4, 5, 6])
+            download = self.client.get(status['download_url'])
+            self.assertIn(b'unknown department', b''.join(download.streaming_content))
+            download.close()
+            self.assertFalse(list((Path(tmp) / 'jobs' / 'uploads').iterdir()))
+
+        # The moved student's class is reflected in the master plan
+        self.assertEqual(Student.objects.get(roll_number='1001').department, eee)
+        self.assertTrue(MasterPlanEntry.objects.filter(department=eee, first_roll='1001').exists())
+
+        # An allocation export (XLSX) imports as it is, in small chunks
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'allocations.xlsx'
+            path.write_bytes(b''.join(iter_xlsx(iter([
+                ('3001', 'CSE', 'Computer', 1, '1st', 'Test Room', 1, 1),
+                ('3002', 'EEE', 'Electrical', 1, '1st', 'Test Room', 1, 2),
+            ]))))
+            report = import_students(open_rows(str(path)), chunk_size=1)
+        self.assertEqual((report['created'], report['bad_rows']), (2, 0))
+        self.assertEqual(Student.objects.get(roll_number='3002').department, eee)
+
+    def test_allocation_preview_and_commit(self):
+        self.client.post(reverse('allocate_view'), {
+            'room_id': self.room.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+            'student_data': '1001-1005', 'algorithm': 'linear',
+        })
+        body = {
+            'room_id': self.room.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+            'student_data': '1004-1030', 'algorithm': 'linear',
+        }
+        with CaptureQueriesContext(connection) as queries:
+            preview = self.client.post(reverse('allocate_preview'), json.dumps(body),
+                                       content_type='application/json').json()
+        self.assertFalse([q for q in queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))])
+        # 1004 and 1005 give their seats back, so 22 of the 27 rolls fit next to 1001-1003
+        self.assertEqual((preview['placed'], preview['unplaced_count'], preview['unplaced']), (22, 5, '1026-1030'))
+        self.assertEqual(preview['grid'][0][0], {'roll': '1001', 'department_id': self.dept.id,
+                                                 'semester_id': self.sem.id, 'new': False})
+        self.assertEqual(preview['grid'][3][0]['roll'], '1004')
+        self.assertTrue(preview['grid'][3][0]['new'])
+        self.assertGreater(preview['conflicts']['pairs'], 0)
+        self.assertEqual(SeatAllocation.objects.count(), 5)
+        self.assertFalse(Student.objects.filter(roll_number='1030').exists())
+
+        # The HTML flow renders the same proposal without saving
+        response = self.client.post(reverse('allocate_view'), dict(body, preview='1'))
+        self.assertContains(response, 'Save This Plan')
+        self.assertEqual(SeatAllocation.objects.count(), 5)
+
+        response = self.client.post(reverse('allocate_commit'), json.dumps({'proposal': preview['proposal']}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['allocated'], 22)
+        self.assertEqual(SeatAllocation.objects.count(), 25)
+        self.assertEqual(SeatAllocation.objects.get(student__roll_number='1004').seat.row, 4)
+
+        # A proposal for a room that has been written to since is refused
+        stale = self.client.post(reverse('allocate_preview'), json.dumps(dict(body, student_data='1001-1003')),
+                                 content_type='application/json').json()['proposal']
+        self.client.post(reverse('room_manage_seat', args=[self.room.id]), json.dumps({
+            'action': 'delete', 'row': 5, 'col': 5,
+        }), content_type='application/json')
+        response = self.client.post(reverse('allocate_commit'), json.dumps({'proposal': stale}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(reverse('allocate_commit'), json.dumps({'proposal': stale + 'x'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_allocate_plan_command(self):
+        plan = {
+            'algorithm': 'linear_vertical',
+            'departments': [{'code': 'EEE', 'name': 'Electrical'}],
+            'rooms': ['Test Room', {'name': 'Annex', 'layout': '3#/.2#'}],
+            'batches': [
+                {'department': 'CSE', 'semester': 1, 'rolls': '1001-1020'},
+                {'department': 'EEE', 'semester': 1, 'rolls': '2001-2012, -2005'},
+            ],
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'plan.json'
+            path.write_text(json.dumps(plan))
+
+            out = StringIO()
+            call_command('allocate_plan', str(path), '--dry-run', stdout=out)
+            self.assertIn('would seat 30 students in 2 rooms (linear_vertical), 1 unplaced: 2012', out.getvalue())
+            for phase in ('parse', 'setup', 'upsert', 'seat load', 'allocate'):
+                self.assertIn(phase, out.getvalue())
+            self.assertFalse(Room.objects.filter(name='Annex').exists())
+            self.assertFalse(Student.objects.exists())
+
+            out = StringIO()
+            call_command('allocate_plan', str(path), stdout=out)
+            self.assertIn('write', out.getvalue())
+        annex = Room.objects.get(name='Annex')
+        self.assertEqual((annex.rows, annex.cols, annex.active_seats), (2, 3, 5))
+        self.assertEqual(SeatAllocation.objects.count(), 30)
+        self.assertEqual(SeatAllocation.objects.filter(seat__room=annex).count(), 5)
+        self.assertFalse(Student.objects.filter(roll_number='2005').exists())
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.occupied_seats, 25)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'plan.json'
+            path.write_text(json.dumps(dict(plan, rooms=['Nowhere'])))
+            with self.assertRaisesMessage(CommandError, 'Unknown rooms'):
+                call_command('allocate_plan', str(path), stdout=StringIO())
+
     def test_bulk_delete_student(self):
         s1 = Student.objects.create(roll_number='9999', department=self.dept, semester=self.sem)
         
@@ -62,3 +548,313 @@ class CoreTest(TestCase):
         
         self.assertEqual(response.status_code, 200)
         self.assertFalse(Student.objects.filter(id=s1.id).exists())
+
+    def test_upsert_students_constant_queries(self):
+        eee = Department.objects.create(name='Electrical', code='EEE')
+        Student.objects.create(roll_number='1001', department=eee, semester=self.sem)
+
+        with CaptureQueriesContext(connection) as small:
+            upsert_students([str(r) for r in range(1001, 1011)], self.dept, self.sem)
+        # 190 rows x 5 columns stays inside one sqlite INSERT (999 parameters)
+        with CaptureQueriesContext(connection) as large:
+            upsert_students([str(r) for r in range(1005, 1195)], eee, self.sem)
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Student.objects.count(), 194)
+        self.assertEqual(Student.objects.get(roll_number='1001').department, self.dept)
+        self.assertEqual(Student.objects.get(roll_number='1005').department, eee)
+
+    def test_allocation_overflow_is_not_materialized(self):
+        response = self.client.post(reverse('allocate_view'), {
+            'room_id': self.room.id,
+            'department_id': self.dept.id,
+            'semester_id': self.sem.id,
+            'student_data': '1001-1030, -1002',
+            'algorithm': 'linear_vertical'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['unallocated_rolls']), 4)
+        self.assertEqual(str(response.context['unallocated_rolls']), '1027-1030')
+        self.assertEqual(Student.objects.count(), 29)
+        self.assertFalse(Student.objects.filter(roll_number='1002').exists())
+
+    def test_public_search_cache(self):
+        cache.clear()
+        student = Student.objects.create(roll_number='5001', department=self.dept, semester=self.sem)
+        seat = Seat.objects.get(room=self.room, row=2, col=3)
+        SeatAllocation.objects.create(seat=seat, student=student)
+
+        self.client.logout()
+        self.client.get(reverse('public_search'), {'q': '5001'})
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('public_search'), {'q': '5001'})
+        self.assertEqual(response.context['result']['room_name'], 'Test Room')
+        self.assertEqual((response.context['result']['row'], response.context['result']['col']), (2, 3))
+
+        self.client.login(username='admin', password='password')
+        self.client.post(reverse('room_manage_seat', args=[self.room.id]), json.dumps({
+            'row': 2, 'col': 3, 'action': 'delete',
+        }), content_type='application/json')
+
+        response = self.client.get(reverse('public_search'), {'q': '5001'})
+        self.assertIsNone(response.context['result'])
+        self.assertEqual(self.client.get(reverse('seat_lookup_stats')).json()['hits'], 1)
+
+    def test_seat_lookup_follows_room_rename(self):
+        cache.clear()
+        self.client.post(reverse('allocate_view'), {
+            'room_id': self.room.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+            'student_data': '1001-1003', 'algorithm': 'linear',
+        })
+        self.assertEqual(lookup_seat('1001')['room_name'], 'Test Room')
+
+        self.client.post(reverse('room_edit', args=[self.room.id]), {'name': 'Hall A', 'rows': 5, 'cols': 5})
+        self.assertEqual(lookup_seat('1001')['room_name'], 'Hall A')
+        self.assertEqual(self.client.get(reverse('public_search'), {'q': '1002'}).context['result']['room_name'], 'Hall A')
+
+    def test_conditional_get_follows_allocation_version(self):
+        url = reverse('public_room_view', args=[self.room.id])
+        etag = self.client.get(url)['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(reverse('room_toggle_seat', args=[self.room.id]), json.dumps({
+            'row': 1, 'col': 1,
+        }), content_type='application/json')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(reverse('master_plan_view'))['ETag'], f'"plan-v{PlanVersion.current().version}"')
+
+    def test_room_snapshot_is_cached_until_a_write(self):
+        url = reverse('public_room_view', args=[self.room.id])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse([q for q in queries if 'core_seat' in q['sql']])
+        self.assertTrue(response.context['grid'][0][0].is_active)
+
+        self.client.post(reverse('room_toggle_seat', args=[self.room.id]), json.dumps({
+            'row': 1, 'col': 1,
+        }), content_type='application/json')
+        self.assertFalse(self.client.get(url).context['grid'][0][0].is_active)
+
+    def test_room_snapshot_after_overflow_allocation(self):
+        self.client.post(reverse('room_create'), {'name': 'Small', 'rows': 2, 'cols': 2})
+        small = Room.objects.get(name='Small')
+        response = self.client.post(reverse('allocate_view'), {
+            'room_id': small.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+            'student_data': '1001-1006', 'algorithm': 'linear',
+        })
+        self.assertEqual(str(response.context['unallocated_rolls']), '1005-1006')
+        self.assertEqual((response.context['room'].occupied_seats, response.context['room'].free_seats), (4, 0))
+
+        def seated(grid):
+            return sorted(cell.roll_number for row in grid for cell in row if cell and cell.roll_number)
+
+        rolls = ['1001', '1002', '1003', '1004']
+        self.assertEqual(seated(response.context['grid']), rolls)
+        self.assertEqual(seated(self.client.get(reverse('room_detail', args=[small.id])).context['grid']), rolls)
+        self.assertEqual(seated(self.client.get(reverse('public_room_view', args=[small.id])).context['grid']), rolls)
+
+    def test_cached_attendance_sheet_has_no_render_date(self):
+        from .pdf_views import attendance_html, room_allocations
+        student = Student.objects.create(roll_number='5001', department=self.dept, semester=self.sem)
+        SeatAllocation.objects.create(seat=Seat.objects.get(room=self.room, row=1, col=1), student=student)
+
+        # The sheet is cached on room_fingerprint, so it must read the same on any day
+        sheets = []
+        for day in (timezone.now(), timezone.now() + timedelta(days=3)):
+            with mock.patch('django.utils.timezone.now', return_value=day), \
+                    mock.patch('core.pdf_views.now', return_value=day):
+                sheets.append(attendance_html(self.room, room_allocations(self.room)))
+        self.assertIn('5001', sheets[0])
+        self.assertEqual(sheets[0], sheets[1])
+
+    def test_room_pdf_cache(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch('core.pdf_cache.PDF_CACHE_DIR', Path(tmp)):
+            response = self.client.get(reverse('room_pdf', args=[self.room.id]))
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertEqual(int(response['Content-Length']), len(response.content))
+            first = list(Path(tmp).glob('room-*.pdf'))
+            self.assertEqual(len(first), 1)
+
+            with mock.patch('core.pdf_views.render_room_pdf') as render:
+                self.assertEqual(self.client.get(reverse('room_pdf', args=[self.room.id])).content, response.content)
+                render.assert_not_called()
+
+            self.client.post(reverse('room_manage_seat', args=[self.room.id]), json.dumps({
+                'row': 1, 'col': 1, 'action': 'update', 'roll_number': '5001',
+                'department_id': self.dept.id, 'semester_id': self.sem.id,
+            }), content_type='application/json')
+            self.client.get(reverse('room_pdf', args=[self.room.id]))
+            second = list(Path(tmp).glob('room-*.pdf'))
+            self.assertEqual(len(second), 1)
+            self.assertNotEqual(first, second)
+
+    def test_all_room_pdfs_zip(self):
+        student = Student.objects.create(roll_number='5001', department=self.dept, semester=self.sem)
+        SeatAllocation.objects.create(seat=Seat.objects.get(room=self.room, row=1, col=1), student=student)
+        Room.objects.create(name='Empty Hall', rows=1, cols=1)
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch('core.pdf_cache.PDF_CACHE_DIR', Path(tmp)):
+            response = self.client.get(reverse('all_room_pdfs'))
+            archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+
+        names = set(archive.namelist())
+        self.assertIn(f'{self.room.id:03d}-test-room/seat_plan.pdf', names)
+        self.assertIn(f'{self.room.id:03d}-test-room/attendance.pdf', names)
+        self.assertIn('report.txt', names)
+        self.assertIn('No students allocated', archive.read('report.txt').decode())
+
+    def test_canvas_pdf_backend(self):
+        student = Student.objects.create(roll_number='5001', department=self.dept, semester=self.sem)
+        SeatAllocation.objects.create(seat=Seat.objects.get(room=self.room, row=1, col=1), student=student)
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch('core.pdf_cache.PDF_CACHE_DIR', Path(tmp)):
+            with mock.patch('core.pdf_views.html_to_pdf') as html_to_pdf:
+                room_pdf = self.client.get(reverse('room_pdf', args=[self.room.id]), {'backend': 'canvas'})
+                attendance = self.client.get(reverse('room_attendance_pdf', args=[self.room.id]), {'backend': 'canvas'})
+                html_to_pdf.assert_not_called()
+            self.assertTrue(room_pdf.content.startswith(b'%PDF'))
+            self.assertTrue(attendance.content.startswith(b'%PDF'))
+            # Kept apart from the html renders in the PDF cache
+            self.assertEqual(len(list(Path(tmp).glob('room-*.canvas-*.pdf'))), 1)
+            self.assertEqual(len(list(Path(tmp).glob('attendance-*.canvas-*.pdf'))), 1)
+
+    def test_background_jobs(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(MEDIA_ROOT=tmp), \
+                mock.patch('core.jobs.JOB_DIR', Path(tmp) / 'jobs'), \
+                mock.patch('core.pdf_cache.PDF_CACHE_DIR', Path(tmp) / 'pdf_cache'):
+            response = self.client.get(reverse('room_pdf', args=[self.room.id]), {'async': '1'})
+            self.assertEqual(response.status_code, 202)
+            pdf_job = response.json()['job_id']
+
+            response = self.client.post(reverse('allocate_view'), {
+                'room_id': self.room.id,
+                'department_id': self.dept.id,
+                'semester_id': self.sem.id,
+                'student_data': '1001-1030',
+                'algorithm': 'linear_vertical',
+                'async': '1',
+            })
+            allocation_job = response.json()['job_id']
+            self.assertEqual(SeatAllocation.objects.count(), 0)
+
+            work(once=True)
+
+            status = self.client.get(reverse('job_status', args=[pdf_job])).json()
+            self.assertEqual(status['status'], 'done')
+            download = self.client.get(status['download_url'])
+            self.assertEqual(download['Content-Type'], 'application/pdf')
+            download.close()
+
+            status = self.client.get(reverse('job_status', args=[allocation_job])).json()
+            self.assertEqual(status['result']['allocated'], 25)
+            self.assertEqual(status['result']['unplaced'], '1026-1030')
+            self.assertEqual(SeatAllocation.objects.count(), 25)
+
+    def test_stale_running_job_is_requeued(self):
+        params = {'room_id': self.room.id, 'department_id': self.dept.id, 'semester_id': self.sem.id,
+                  'student_data': '1001-1003'}
+        long_ago = timezone.now() - timedelta(hours=2)
+        # This one's worker died ten minutes ago; the other has run for two hours and is still beating
+        stale = enqueue('allocate_batch', **params)
+        Job.objects.filter(id=stale.id).update(
+            status=Job.RUNNING, started_at=long_ago, heartbeat_at=timezone.now() - timedelta(minutes=10), claim='dead',
+        )
+        busy = enqueue('allocate_batch', **dict(params, student_data='2001'))
+        Job.objects.filter(id=busy.id).update(
+            status=Job.RUNNING, started_at=long_ago, heartbeat_at=timezone.now(), claim='alive',
+        )
+
+        work(once=True)
+
+        stale.refresh_from_db()
+        busy.refresh_from_db()
+        self.assertEqual((stale.status, stale.result['allocated']), (Job.DONE, 3))
+        self.assertNotEqual(stale.claim, 'dead')
+        self.assertEqual(busy.status, Job.RUNNING)
+
+        # The dead worker coming back cannot overwrite the rerun's outcome or progress
+        stale.claim = 'dead'
+        with mock.patch.dict('core.jobs.HANDLERS', {'allocate_batch': lambda job, ctx: ctx.progress(50) or {'allocated': 0}}):
+            run_job(stale)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.progress, stale.result['allocated']), (Job.DONE, 100, 3))
+
+        with mock.patch('core.jobs.JOB_STALE_AFTER', None):
+            Job.objects.filter(id=busy.id).update(heartbeat_at=long_ago)
+            self.assertEqual(requeue_stale(), 0)
+        self.assertEqual(requeue_stale(), 1)
+
+class AllocatorTest(TestCase):
+    def test_grid_anti_cheat_matches_greedy(self):
+        room = Room(id=1, name='Bench', rows=7, cols=6)
+        seats = [Seat(id=r * 10 + c, room=room, row=r, col=c) for c in range(1, 7) for r in range(1, 8) if (r, c) != (3, 4)]
+        students = interleave_by_group([
+            Student(id=i, roll_number=str(i), department_id=1 + i % 3, semester_id=1 + i % 2)
+            for i in range(80)
+        ])
+
+        greedy = allocate_greedy_anti_cheat(room, seats, students)
+        grid = allocate_grid_anti_cheat(room, seats, students)
+
+        self.assertEqual(
+            [(a.seat.id, a.student.id) for a in greedy],
+            [(a.seat.id, a.student.id) for a in grid],
+        )
+
+    def test_optimized_anti_cheat(self):
+        room = Room(id=1, name='Bench', rows=10, cols=10)
+        seats = [Seat(id=r * 100 + c, room=room, row=r, col=c) for c in range(1, 11) for r in range(1, 11) if c != 6]
+        sizes = {1: 63, 2: 18, 3: 9}
+        students = [
+            Student(id=dept * 1000 + i, roll_number=str(dept * 1000 + i), department_id=dept, semester_id=1)
+            for dept, size in sizes.items() for i in range(size)
+        ]
+
+        stats = {}
+        allocations = allocate_seats(room, students, 'anti_cheat_max', seats=list(seats), stats=stats)
+        greedy = allocate_grid_anti_cheat(room, sorted(seats, key=lambda s: (s.col, s.row)), interleave_by_group(students))
+        self.assertEqual(stats['greedy'], len(greedy))
+        self.assertEqual(stats['placed'], len(allocations))
+        # The walkway splits the room into 10x5 and 10x4 blocks: department 1
+        # can hold at most half of each, the other classes sit on the rest
+        self.assertEqual(len(allocations), 45 + 18 + 9)
+        self.assertGreater(len(allocations), len(greedy))
+
+        taken = {(a.seat.row, a.seat.col): a.student.department_id for a in allocations}
+        self.assertFalse([
+            cell for (r, c), dept in taken.items() for cell in ((r + 1, c), (r, c + 1)) if taken.get(cell) == dept
+        ])
+        # Each class is seated from its first roll on, in seat order
+        ids = [a.student.id for a in allocations]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(sorted(i for i in ids if i < 2000), list(range(1000, 1045)))
+
+        # With no time to search it still never does worse than greedy
+        fallback = allocate_optimized_anti_cheat(room, seats, students, time_budget=0)
+        self.assertGreaterEqual(len(fallback), len(greedy))
+
+    def test_roll_intervals(self):
+        rolls = parse_roll_intervals('1001-1010, -1003, -1005-1006\n1020, 1008-1012, 100000-999999, -200000-899999')
+
+        self.assertEqual(len(rolls), 200010)
+        self.assertEqual(str(rolls), '1001-1002, 1004, 1007-1012, 1020, 100000-199999, 900000-999999')
+        self.assertEqual((rolls[0], rolls[-1]), ('1001', '999999'))
+        self.assertEqual(parse_student_input('1001-1005, -1003, 1010'), ['1001', '1002', '1004', '1005', '1010'])
+
+        head, tail = rolls.split(4)
+        self.assertEqual(list(head), ['1001', '1002', '1004', '1007'])
+        self.assertEqual(len(tail), 200006)
+
+    def test_compress_ranges(self):
+        seated = [(1, '1003'), (1, '1001'), (1, '1004'), (2, '1005'), (1, '1006'), (1, '1090'), (1, 'X-7')]
+        self.assertEqual([tuple(r) for r in compress_ranges(seated_rolls(seated))], [
+            (1, '1001', '1004', 3), (2, '1005', '1005', 1), (1, '1006', '1090', 2), (1, 'X-7', 'X-7', 1),
+        ])
+        self.assertEqual(len(list(compress_ranges(seated_rolls(seated), gap=10))), 5)
+        self.assertEqual(list(compress_ranges(iter([]))), [])
@@ -5,6 +5,8 @@ urlpatterns = [
     # Public Routes
     path('', views.public_search, name='public_search'),
     path('public/room/<int:room_id>/', views.public_room_view, name='public_room_view'),
+    path('lookup/stats/', views.seat_lookup_stats_view, name='seat_lookup_stats'),
+    path('rooms/free/', views.free_rooms_view, name='free_rooms'),
     
     # Admin / Staff Routes
     path('dashboard/', views.dashboard, name='dashboard'),
@@ -12,13 +14,22 @@ urlpatterns = [
     path('room/<int:room_id>/delete/', views.room_delete, name='room_delete'),
     path('room/<int:room_id>/edit/', views.room_edit, name='room_edit'),
     path('room/<int:room_id>/toggle/', views.toggle_seat, name='room_toggle_seat'),
+    path('room/<int:room_id>/layout/', views.seat_layout, name='room_seat_layout'),
+    path('room/<int:room_id>/save-template/', views.room_save_template, name='room_save_template'),
+    path('templates/create-rooms/', views.rooms_from_template, name='rooms_from_template'),
+    path('templates/<int:template_id>/apply/', views.apply_template, name='apply_template'),
     path('room/<int:room_id>/manage/', views.manage_seat, name='room_manage_seat'),
     path('room/<int:room_id>/', views.room_detail, name='room_detail'), # Admin interactive view
     path('allocate/', views.allocate_view, name='allocate_view'),
+    path('allocate/exam/', views.allocate_exam_view, name='allocate_exam'),
+    path('allocate/preview/', views.allocate_preview, name='allocate_preview'),
+    path('allocate/commit/', views.allocate_commit, name='allocate_commit'),
     path('manage-metadata/', views.manage_metadata, name='manage_metadata'),
     
     # Master Plan HTML
     path('master-plan/view/', views.master_plan_view, name='master_plan_view'),
+    path('master-plan/export/', views.master_plan_export, name='master_plan_export'),
+    path('export/allocations.<str:export_format>', views.allocation_export, name='allocation_export'),
     path('seats/allocate/', views.allocate_view, name='allocate_seats'),
     path('metadata/manage/', views.manage_metadata, name='manage_metadata'),
     
@@ -26,12 +37,18 @@ urlpatterns = [
     path('students/', views.manage_students, name='manage_students'),
     path('students/save/', views.student_save, name='student_save'),
     path('students/<int:student_id>/delete/', views.student_delete, name='student_delete'),
+    path('students/import/', views.student_import, name='student_import'),
     path('students/bulk-delete/', views.student_bulk_delete, name='student_bulk_delete'),
     path('department/<int:dept_id>/delete/', views.department_delete, name='department_delete'),
     path('semester/<int:sem_id>/delete/', views.semester_delete, name='semester_delete'),
     
+    # Background Jobs
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/download/', views.job_download, name='job_download'),
+
     # PDF Downloads (Legacy/Admin)
     path('room/<int:room_id>/pdf/', pdf_views.download_room_pdf, name='room_pdf'),
     path('room/<int:room_id>/attendance/', pdf_views.download_attendance_pdf, name='room_attendance_pdf'),
     path('master-plan/pdf/', pdf_views.download_master_plan_pdf, name='master_pdf'),
+    path('rooms/pdfs.zip', pdf_views.download_all_room_pdfs, name='all_room_pdfs'),
 ]
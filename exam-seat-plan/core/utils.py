@@ -1,68 +1,221 @@
+import heapq
 import random
+import time
+from bisect import bisect_right
 from collections import defaultdict
+
+from django.conf import settings
+
 from .models import SeatAllocation
 
-def parse_student_input(input_text):
+# Seconds anti_cheat_max may spend improving one room's placement
+ANTI_CHEAT_TIME_BUDGET = getattr(settings, 'ANTI_CHEAT_TIME_BUDGET', 0.5)
+
+class RollIntervals:
+    """
+    A sorted set of numeric roll numbers stored as merged, inclusive (start, end)
+    integer intervals. Counting, indexing and splitting cost O(number of
+    intervals); rolls are only turned into strings while iterating.
+
+    Rolls that are not plain integers ("0101" is not 101) are kept verbatim in
+    `literals` and come after the interval rolls in every ordering.
+    """
+
+    def __init__(self, intervals=(), literals=()):
+        merged = []
+        for start, end in sorted(intervals):
+            if start > end:
+                continue
+            if merged and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        self.intervals = [(start, end) for start, end in merged]
+        self.literals = sorted(set(literals))
+
+    @classmethod
+    def from_rolls(cls, rolls):
+        intervals, literals = [], []
+        for r in rolls:
+            if _is_plain_number(r):
+                intervals.append((int(r), int(r)))
+            else:
+                literals.append(r)
+        return cls(intervals, literals)
+
+    def __len__(self):
+        return sum(end - start + 1 for start, end in self.intervals) + len(self.literals)
+
+    def __bool__(self):
+        return bool(self.intervals or self.literals)
+
+    def __iter__(self):
+        for start, end in self.intervals:
+            for n in range(start, end + 1):
+                yield str(n)
+        yield from self.literals
+
+    def __contains__(self, roll):
+        roll = str(roll)
+        if not _is_plain_number(roll):
+            i = bisect_right(self.literals, roll) - 1
+            return i >= 0 and self.literals[i] == roll
+        n = int(roll)
+        i = bisect_right(self.intervals, (n, float('inf'))) - 1
+        return i >= 0 and self.intervals[i][1] >= n
+
+    def __getitem__(self, index):
+        # Positional access so templates can use |first and |last
+        total = len(self)
+        if index < 0:
+            index += total
+        if not 0 <= index < total:
+            raise IndexError(index)
+        for start, end in self.intervals:
+            size = end - start + 1
+            if index < size:
+                return str(start + index)
+            index -= size
+        return self.literals[index]
+
+    def __or__(self, other):
+        return RollIntervals(self.intervals + other.intervals, self.literals + other.literals)
+
+    def __sub__(self, other):
+        result = []
+        excluded = iter(other.intervals)
+        ex = next(excluded, None)
+        for start, end in self.intervals:
+            while ex is not None and ex[1] < start:
+                ex = next(excluded, None)
+            cursor = start
+            while ex is not None and ex[0] <= end:
+                if ex[0] > cursor:
+                    result.append((cursor, ex[0] - 1))
+                cursor = max(cursor, ex[1] + 1)
+                if ex[1] > end:
+                    break
+                ex = next(excluded, None)
+            if cursor <= end:
+                result.append((cursor, end))
+        removed = set(other.literals)
+        return RollIntervals(result, [r for r in self.literals if r not in removed])
+
+    def __str__(self):
+        # Same syntax parse_student_input accepts, so it can be pasted back
+        return ', '.join(
+            [str(s) if s == e else f'{s}-{e}' for s, e in self.intervals] + self.literals
+        )
+
+    def split(self, count):
+        """Returns (first `count` rolls, the rest) as two RollIntervals."""
+        head, tail = [], []
+        for start, end in self.intervals:
+            if count <= 0:
+                tail.append((start, end))
+            elif end - start + 1 <= count:
+                head.append((start, end))
+                count -= end - start + 1
+            else:
+                head.append((start, start + count - 1))
+                tail.append((start + count, end))
+                count = 0
+        count = max(count, 0)
+        return (RollIntervals(head, self.literals[:count]),
+                RollIntervals(tail, self.literals[count:]))
+
+    def chunks(self, size):
+        """Yields the rolls as lists of at most `size` strings."""
+        for start, end in self.intervals:
+            for chunk_start in range(start, end + 1, size):
+                yield [str(n) for n in range(chunk_start, min(chunk_start + size - 1, end) + 1)]
+        for i in range(0, len(self.literals), size):
+            yield self.literals[i:i + size]
+
+
+def _is_plain_number(roll):
+    """True for rolls that round-trip through int(): "101" but not "0101"."""
+    return roll.isdigit() and (roll[0] != '0' or roll == '0')
+
+
+# Zero-padded ranges ("0101-0105") are expanded roll by roll, so cap their size
+MAX_PADDED_RANGE = 10000
+
+
+def parse_roll_intervals(input_text):
     """
-    Parses input string into a list of roll numbers.
+    Parses input string into RollIntervals without materializing ranges.
     Supports:
     - Ranges: 1001-1005
     - Individual: 1001, 1002
-    - Exclusions: -1003 (removes 1003 from list)
+    - Exclusions: -1003 (removes 1003), -1003-1005 (removes the range)
+    - Zero-padded rolls: 0101 is kept as "0101", not 101; 0101-0105 keeps the padding
+
+    Raises ValueError for a zero-padded range of more than MAX_PADDED_RANGE rolls.
     """
-    exclusions = set()
-    
     # Normalize newlines to commas
     text = input_text.replace('\n', ',').replace('\r', '')
-    
+
     tokens = [t.strip() for t in text.split(',') if t.strip()]
-    
-    rolls = set()
-    
+
+    included, included_literals = [], []
+    excluded, excluded_literals = [], []
+
     for token in tokens:
-        is_exclusion = False
+        target, literals = included, included_literals
         if token.startswith('-'):
-            is_exclusion = True
+            target, literals = excluded, excluded_literals
             token = token[1:].strip()
-            
+
         # Parse Range or Single
-        current_rolls = []
         if '-' in token:
-            try:
-                parts = token.split('-')
-                if len(parts) == 2:
-                    start = int(parts[0])
-                    end = int(parts[1])
-                    current_rolls = [str(r) for r in range(start, end + 1)]
-            except ValueError:
-                pass
-        else:
-            if token.isdigit():
-                current_rolls = [token]
-                
-        for roll in current_rolls:
-            if is_exclusion:
-                exclusions.add(roll)
-            else:
-                rolls.add(roll)
-                
+            parts = [part.strip() for part in token.split('-')]
+            if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+                start, end = int(parts[0]), int(parts[1])
+                if _is_plain_number(parts[0]):
+                    target.append((start, end))
+                elif end - start < MAX_PADDED_RANGE:
+                    width = len(parts[0])
+                    literals.extend(str(n).zfill(width) for n in range(start, end + 1))
+                else:
+                    raise ValueError(
+                        f'{token}: a zero-padded range can list at most {MAX_PADDED_RANGE} rolls; split it up'
+                    )
+        elif _is_plain_number(token):
+            target.append((int(token), int(token)))
+        elif token.isdigit():
+            literals.append(token)
+
     # Apply exclusions
-    final_rolls = sorted(list(rolls - exclusions), key=lambda x: int(x) if x.isdigit() else x)
-    
-    # Return list of dicts for compatibility or just list of rolls?
-    # Logic in view expects list of dicts with 'roll_number' and 'student_class' (previously).
-    # Now view will assign Dept/Sem. So just returning list of rolls is easier, but let's return dicts to keep structure if needed.
-    # Actually, let's just return list of strings. View will handle it.
-    return final_rolls
+    return RollIntervals(included, included_literals) - RollIntervals(excluded, excluded_literals)
 
-def allocate_seats(room, students, algorithm='linear'):
+def parse_student_input(input_text):
+    """
+    Parses input string into a sorted list of roll number strings.
+    Same syntax as parse_roll_intervals, which should be preferred for large inputs.
+    """
+    return list(parse_roll_intervals(input_text))
+
+# Accepted values of allocate_seats' `algorithm` ('linear' is the legacy name of linear_vertical)
+ALGORITHMS = ('linear_vertical', 'linear', 'z_pattern', 'anti_cheat', 'anti_cheat_max', 'random')
+
+
+def allocate_seats(room, students, algorithm='linear', seats=None, stats=None, interleaved=False):
     """
     Allocates students to a room based on the selected algorithm.
     Only considers Seat objects where is_active=True.
+
+    `seats` lets a caller that already loaded the room's free active seats
+    (e.g. a multi-room run) skip the query. `stats` is passed on to
+    allocate_optimized_anti_cheat (anti_cheat_max). `interleaved` tells the
+    anti-cheat algorithms the students are already in interleave_by_group order.
     """
-    # Get all active seats that are NOT occupied
-    # We filter out seats that have an improved 'allocation' relation
-    seats = list(room.seats.filter(is_active=True, allocation__isnull=True))
+    if seats is None:
+        # Get all active seats that are NOT occupied
+        # We filter out seats that have an improved 'allocation' relation
+        seats = room.seats.filter(is_active=True, allocation__isnull=True)
+    seats = list(seats)
     
     if not seats:
         return []
@@ -107,31 +260,14 @@ def allocate_seats(room, students, algorithm='linear'):
         seats.sort(key=lambda s: (s.col, s.row))
         
         # Heuristic: Interleave by (Department, Semester)
-        
-        # 1. Group students by (Department, Semester)
-        students_by_group = defaultdict(list)
-        for s in students:
-            key = (s.department_id, s.semester_id)
-            students_by_group[key].append(s)
-            
-        # Interleave
-        interleaved_students = []
-        while students_by_group:
-            keys = list(students_by_group.keys())
-            if not keys: break
-            
-            # Sort keys to ensure deterministic interleaving pattern?
-            # Or just random? Deterministic is better for UI predictability.
-            keys.sort() 
-            
-            for k in keys:
-                if students_by_group[k]:
-                    interleaved_students.append(students_by_group[k].pop(0))
-                else:
-                    del students_by_group[k]
-        
-        students = interleaved_students
-        return allocate_greedy_anti_cheat(room, seats, students)
+        if not interleaved:
+            students = interleave_by_group(students)
+        return allocate_grid_anti_cheat(room, seats, students)
+
+    elif algorithm == 'anti_cheat_max':
+        # Same constraint, placed by the optimizing allocator within its time budget
+        seats.sort(key=lambda s: (s.col, s.row))
+        return allocate_optimized_anti_cheat(room, seats, students, stats=stats, interleaved=interleaved)
 
     # Standard Allocation Loop
     num_to_allocate = min(len(seats), len(students))
@@ -145,6 +281,31 @@ def allocate_seats(room, students, algorithm='linear'):
         
     return allocations
 
+def interleave_by_group(students):
+    """
+    Round-robin students across their (Department, Semester) groups so that
+    consecutive students come from different groups.
+    """
+    # 1. Group students by (Department, Semester)
+    students_by_group = defaultdict(list)
+    for s in students:
+        key = (s.department_id, s.semester_id)
+        students_by_group[key].append(s)
+
+    # Interleave. Sorted keys keep the pattern deterministic for UI predictability.
+    interleaved_students = []
+    queues = [iter(students_by_group[k]) for k in sorted(students_by_group)]
+    while queues:
+        still_open = []
+        for q in queues:
+            student = next(q, None)
+            if student is not None:
+                interleaved_students.append(student)
+                still_open.append(q)
+        queues = still_open
+
+    return interleaved_students
+
 def allocate_greedy_anti_cheat(room, seats, students):
     """
     Tries to place students such that no neighbors have the same (Department, Semester).
@@ -203,3 +364,282 @@ def allocate_greedy_anti_cheat(room, seats, students):
         final_allocations.append(allocation)
         
     return final_allocations
+
+def seat_neighbors(seats):
+    """For each seat, the positions in `seats` of its row and column neighbours."""
+    max_row = max(s.row for s in seats)
+    max_col = max(s.col for s in seats)
+
+    # Cell (row, col) -> position in `seats` (the allocation order), -1 for no seat
+    index_grid = [-1] * ((max_row + 2) * (max_col + 2))
+    width = max_col + 2
+    for i, s in enumerate(seats):
+        index_grid[s.row * width + s.col] = i
+
+    neighbors = []
+    for s in seats:
+        base = s.row * width + s.col
+        neighbors.append([
+            j for j in (index_grid[base - width], index_grid[base + width],
+                        index_grid[base - 1], index_grid[base + 1])
+            if j >= 0
+        ])
+    return neighbors
+
+def allocate_grid_anti_cheat(room, seats, students):
+    """
+    Same placement as allocate_greedy_anti_cheat (first valid seat in the given
+    seat order, Strict Mode skips), but backed by flat arrays instead of a scan
+    over every remaining seat per student.
+
+    Eligibility of a seat for a group only ever shrinks (seats get taken, neighbours
+    get filled), so each group keeps a cursor into the seat order plus a 'blocked'
+    bytearray. A cursor never moves backwards, so the total work is
+    O(groups x seats + students) instead of O(students x seats).
+    """
+    n = len(seats)
+    if not n or not students:
+        return []
+
+    neighbors = seat_neighbors(seats)
+    taken = bytearray(n)
+    blocked = {}  # {(department_id, semester_id): bytearray(n)}
+    cursor = {}   # {(department_id, semester_id): first index that may still be valid}
+    free_left = n
+    final_allocations = []
+
+    for student in students:
+        if not free_left:
+            break
+
+        s_key = (student.department_id, student.semester_id)
+        group_blocked = blocked.get(s_key)
+        if group_blocked is None:
+            group_blocked = blocked[s_key] = bytearray(n)
+            cursor[s_key] = 0
+
+        i = cursor[s_key]
+        while i < n and (taken[i] or group_blocked[i]):
+            i += 1
+        cursor[s_key] = i
+
+        # Strict Mode: no valid seat left for this group, skip the student
+        if i == n:
+            continue
+
+        taken[i] = 1
+        free_left -= 1
+        for j in neighbors[i]:
+            group_blocked[j] = 1
+
+        final_allocations.append(SeatAllocation(seat=seats[i], student=student))
+
+    return final_allocations
+
+
+def allocate_optimized_anti_cheat(room, seats, students, time_budget=None, stats=None, interleaved=False):
+    """
+    anti_cheat placement that tries to seat as many students as possible.
+
+    Seating is treated as colouring the seat graph (row/column neighbours) with
+    one colour per (Department, Semester) group, each colour limited to its
+    group's head count, and seats allowed to stay empty. Construction is
+    DSatur-style: the seat with the most distinct groups around it is coloured
+    next, with the group that has the most students left. The better of that
+    and the greedy (allocate_grid_anti_cheat) placement is then improved by
+    local repair until every seat or student is used, the search stalls or
+    `time_budget` seconds (settings.ANTI_CHEAT_TIME_BUDGET) run out. A repair
+    picks an empty seat and fills it directly, or gives it to a group with no
+    students left while one of that group's seats goes to a group that has
+    some, or else swaps it with its only blocking neighbour; when the search
+    stalls, a seat is forced in against several blockers to get out of a
+    local optimum. The best placement seen is kept, so it never places fewer
+    than greedy, and never seats two students of a group side by side.
+
+    Each group's students keep their order and take its seats in seat order.
+    `stats`, if given, gets 'seats', 'students', 'greedy', 'placed', 'moves'
+    and 'elapsed'. `interleaved` says `students` already went through
+    interleave_by_group.
+    """
+    started = time.perf_counter()
+    n = len(seats)
+    if not n or not students:
+        return []
+    budget = ANTI_CHEAT_TIME_BUDGET if time_budget is None else time_budget
+
+    neighbors = seat_neighbors(seats)
+    members = defaultdict(list)
+    for student in students:
+        members[(student.department_id, student.semester_id)].append(student)
+    keys = sorted(members)
+    quota = [len(members[key]) for key in keys]
+    group_of = {key: g for g, key in enumerate(keys)}
+    # A group can't hold more seats than an independent set of the seat graph;
+    # n minus any matching bounds that (exact for a maximum one, the graph being bipartite)
+    independent = n - _matching_size(neighbors)
+    bound = min(n, sum(min(q, independent) for q in quota))
+
+    # Greedy baseline, as the anti_cheat algorithm would place
+    seat_index = {id(seat): i for i, seat in enumerate(seats)}
+    greedy = allocate_grid_anti_cheat(room, seats, students if interleaved else interleave_by_group(students))
+    colour = [-1] * n
+    for allocation in greedy:
+        colour[seat_index[id(allocation.seat)]] = group_of[(allocation.student.department_id,
+                                                          allocation.student.semester_id)]
+
+    if len(greedy) < bound:
+        candidate = _dsatur_colouring(neighbors, quota)
+        if sum(c >= 0 for c in candidate) > len(greedy):
+            colour = candidate
+
+    placed, moves = _repair_colouring(neighbors, colour, quota, bound, started + budget)
+
+    allocations = []
+    queues = [iter(members[key]) for key in keys]
+    for i, g in enumerate(colour):
+        if g >= 0:
+            allocations.append(SeatAllocation(seat=seats[i], student=next(queues[g])))
+    if stats is not None:
+        stats.update(seats=n, students=len(students), greedy=len(greedy), placed=placed,
+                     moves=moves, elapsed=time.perf_counter() - started)
+    return allocations
+
+
+def _matching_size(neighbors):
+    """Size of a greedy maximal matching of the seat graph."""
+    matched = bytearray(len(neighbors))
+    size = 0
+    for i, adjacent in enumerate(neighbors):
+        if matched[i]:
+            continue
+        j = next((j for j in adjacent if not matched[j]), None)
+        if j is not None:
+            matched[i] = matched[j] = 1
+            size += 1
+    return size
+
+
+def _dsatur_colouring(neighbors, quota):
+    """Seat -> group index (-1 empty), DSatur order, most-students-left group first."""
+    n = len(neighbors)
+    colour = [-1] * n
+    done = bytearray(n)
+    left = list(quota)
+    around = [set() for _ in range(n)]
+    heap = [(0, -len(neighbors[i]), i) for i in range(n)]
+    heapq.heapify(heap)
+    while heap:
+        _, _, i = heapq.heappop(heap)
+        if done[i]:
+            continue
+        done[i] = 1
+        g = max((g for g in range(len(left)) if left[g] and g not in around[i]),
+                key=lambda g: left[g], default=-1)
+        if g < 0:
+            if not any(left):
+                break
+            continue
+        colour[i] = g
+        left[g] -= 1
+        for j in neighbors[i]:
+            if not done[j] and g not in around[j]:
+                around[j].add(g)
+                heapq.heappush(heap, (-len(around[j]), -len(neighbors[j]), j))
+    return colour
+
+
+def _repair_colouring(neighbors, colour, quota, bound, deadline):
+    """
+    Local repair of `colour` in place (see allocate_optimized_anti_cheat).
+    Returns (seats placed, moves tried); `colour` ends as the best colouring seen.
+    """
+    n = len(neighbors)
+    rng = random.Random(n)
+    groups = range(len(quota))
+    left = list(quota)
+    # Seats of each group, and of -1 (empty), as list + position for O(1) moves and picks
+    bucket = {g: [] for g in (-1, *groups)}
+    where = [0] * n
+    for i, g in enumerate(colour):
+        where[i] = len(bucket[g])
+        bucket[g].append(i)
+        if g >= 0:
+            left[g] -= 1
+    empty = bucket[-1]
+    placed = n - len(empty)
+    best, best_colour = placed, list(colour)
+
+    def recolour(i, g):
+        old = bucket[colour[i]]
+        last = old.pop()
+        if last != i:
+            old[where[i]] = last
+            where[last] = where[i]
+        where[i] = len(bucket[g])
+        bucket[g].append(i)
+        if colour[i] >= 0:
+            left[colour[i]] += 1
+        if g >= 0:
+            left[g] -= 1
+        colour[i] = g
+
+    def fits(i, g):
+        return all(colour[j] != g for j in neighbors[i])
+
+    def transfer(i, open_groups):
+        # A group with no students left that fits at i takes it, and one of its
+        # seats elsewhere goes to a group that still has students
+        for h in groups:
+            if left[h] or not bucket[h] or not fits(i, h):
+                continue
+            t = bucket[h][rng.randrange(len(bucket[h]))]
+            g = next((g for g in open_groups if fits(t, g)), -1)
+            if g >= 0:
+                recolour(t, g)
+                recolour(i, h)
+                return True
+        return False
+
+    moves = stalled = 0
+    stall_limit = 100 * n
+    while empty and placed < bound and stalled < stall_limit:
+        moves += 1
+        stalled += 1
+        if moves % 256 == 0 and time.perf_counter() > deadline:
+            break
+        i = empty[rng.randrange(len(empty))]
+        open_groups = [g for g in groups if left[g]]
+        rng.shuffle(open_groups)
+
+        g = next((g for g in open_groups if fits(i, g)), -1)
+        if g >= 0:
+            # Fill the seat directly
+            recolour(i, g)
+            placed += 1
+        elif transfer(i, open_groups):
+            placed += 1
+        else:
+            # Swap: evict the same-group neighbours blocking the seat and take
+            # their place, then refill around them. With one blocker this loses
+            # nothing (and gains when a freed seat fits someone); every n stalled
+            # moves more blockers may go too, a kick out of a local optimum (the
+            # best colouring is kept).
+            g = min(open_groups, key=lambda g: sum(colour[j] == g for j in neighbors[i]))
+            blocking = [j for j in neighbors[i] if colour[j] == g]
+            if len(blocking) == 1 or stalled % n == 0:
+                for x in blocking:
+                    recolour(x, -1)
+                recolour(i, g)
+                placed += 1 - len(blocking)
+                for u in {u for x in blocking for u in (*neighbors[x], x)}:
+                    h = next((h for h in groups if left[h] and fits(u, h)), -1) if colour[u] < 0 else -1
+                    if h >= 0:
+                        recolour(u, h)
+                        placed += 1
+
+        if placed > best:
+            best, best_colour = placed, list(colour)
+            stalled = 0
+
+    colour[:] = best_colour
+    return best, moves
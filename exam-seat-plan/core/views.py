@@ -1,19 +1,36 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib import messages
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.core import signing
+from django.http import JsonResponse, FileResponse, Http404, StreamingHttpResponse
+from django.views.decorators.http import require_POST, condition
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
+from django.utils.timezone import now
 from django.contrib.admin.views.decorators import staff_member_required
-from .models import Room, Student, SeatAllocation, Seat, Department, Semester
-from .utils import allocate_seats
+from .models import Room, Student, SeatAllocation, Seat, Department, Semester, Job, LayoutTemplate
+from .jobs import accepted_response, artifact_path, enqueue
+from .grid import room_snapshot
+from .master_plan import EXPORT_FIELDS, master_plan, master_plan_rows
+from .layout import SeatBitmap, save_room_layout
+from .preview import StaleProposal, commit_proposal, preview_batch
+from .services import (
+    allocate_batch, allocate_exam_batches, upsert_students, release_students, suggest_rooms,
+    set_seat_layout, resize_room, apply_layout_template, create_rooms_from_layout, save_layout_template,
+)
+from .caching import (
+    lookup_seat, seat_lookup_stats, allocation_changed, students_changed,
+    room_etag, room_last_modified, plan_etag, plan_last_modified,
+)
 import json
 
 @staff_member_required
 def dashboard(request):
     """Admin Dashboard: Create Rooms, Run Allocation, View Stats."""
-    rooms = Room.objects.all()
-    # ... stats logic ...
-    total_rooms = rooms.count()
+    rooms = list(Room.objects.all())
+    # ... stats logic ... (capacity is a stored counter, no query per room)
+    total_rooms = len(rooms)
     total_students = SeatAllocation.objects.count()
     total_capacity = sum(r.capacity for r in rooms)
     
@@ -21,6 +38,7 @@ def dashboard(request):
         'rooms': rooms,
         'departments': Department.objects.all(),
         'semesters': Semester.objects.all(),
+        'layout_templates': LayoutTemplate.objects.only('id', 'name', 'rows', 'cols'),
         'total_rooms': total_rooms,
         'total_students': total_students,
         'total_capacity': total_capacity,
@@ -33,23 +51,63 @@ def room_create(request):
         rows = int(request.POST.get('rows'))
         cols = int(request.POST.get('cols'))
         
-        room = Room.objects.create(name=name, rows=rows, cols=cols)
-        
-        # Create Seat objects
-        seats = []
-        for r in range(1, rows + 1):
-            for c in range(1, cols + 1):
-                seats.append(Seat(room=room, row=r, col=c))
-        Seat.objects.bulk_create(seats)
+        # Every seat active
+        create_rooms_from_layout([name], SeatBitmap.full(rows, cols))
         
         messages.success(request, 'Room created with default grid.')
         return redirect('dashboard')
     return redirect('dashboard')
 
+@staff_member_required
+@require_POST
+def room_save_template(request, room_id):
+    """Saves the room's size and walkways as a reusable layout template."""
+    room = get_object_or_404(Room, id=room_id)
+    name = request.POST.get('name', '').strip() or room.name
+    template = save_layout_template(room, name)
+    messages.success(request, f'Layout template "{template.name}" saved ({template.rows}x{template.cols}).')
+    return redirect('room_detail', room_id=room.id)
+
+@staff_member_required
+@require_POST
+def rooms_from_template(request):
+    """Creates `count` rooms ("<prefix> 1", "<prefix> 2", ...) with a template's layout."""
+    template = get_object_or_404(LayoutTemplate, id=request.POST.get('template_id'))
+    prefix = request.POST.get('prefix', '').strip() or template.name
+    try:
+        count = int(request.POST.get('count', 1))
+        if not 1 <= count <= 1000: raise ValueError
+    except ValueError:
+        messages.error(request, 'Count must be between 1 and 1000.')
+        return redirect('dashboard')
+
+    names = [prefix] if count == 1 else [f'{prefix} {i}' for i in range(1, count + 1)]
+    create_rooms_from_layout(names, SeatBitmap(template.rows, template.cols, bytes(template.layout)))
+    messages.success(request, f'Created {count} rooms from "{template.name}".')
+    return redirect('dashboard')
+
+@csrf_exempt
+@staff_member_required
+@require_POST
+def apply_template(request, template_id):
+    """
+    API: give existing rooms a template's size and walkways.
+    Body: {"room_ids": [...]}. Rooms where an occupied seat would be disabled are skipped.
+    """
+    template = get_object_or_404(LayoutTemplate, id=template_id)
+    try:
+        room_ids = [int(i) for i in json.loads(request.body)['room_ids']]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'status': 'error', 'message': 'Send {"room_ids": [...]}'}, status=400)
+    rooms = list(Room.objects.filter(id__in=room_ids))
+    results = apply_layout_template(template, rooms)
+    return JsonResponse({'status': 'success', 'rooms': results})
+
 @staff_member_required
 def room_delete(request, room_id):
     room = get_object_or_404(Room, id=room_id)
-    room.delete()
+    with transaction.atomic(), students_changed(Student.objects.filter(seatallocation__seat__room=room)):
+        room.delete()
     messages.success(request, 'Room deleted successfully.')
     return redirect('dashboard')
 
@@ -67,29 +125,14 @@ def room_edit(request, room_id):
             return redirect('dashboard')
 
         room.name = name
-        
-        # Resize Logic
-        # 1. Shrink
-        if rows < room.rows:
-            Seat.objects.filter(room=room, row__gt=rows).delete()
-        if cols < room.cols:
-            Seat.objects.filter(room=room, col__gt=cols).delete()
-            
-        # 2. Expand: Create missing seats using bulk_create with ignore_conflicts
-        if rows > room.rows or cols > room.cols:
-            new_seats = []
-            for r in range(1, rows + 1):
-                for c in range(1, cols + 1):
-                    # We could check existence, but bulk_create(ignore_conflicts=True) is efficient
-                    new_seats.append(Seat(room=room, row=r, col=c))
-            
-            if new_seats:
-                Seat.objects.bulk_create(new_seats, ignore_conflicts=True)
+        displaced = resize_room(room, rows, cols)
 
-        room.rows = rows
-        room.cols = cols
-        room.save()
-        
+        for group in displaced:
+            messages.warning(
+                request,
+                f"{group['count']} {group['department']}-{group['semester']} students lost their seats in "
+                f"{room.name}: {group['rolls']}. Allocate them again to place them.",
+            )
         messages.success(request, 'Room updated successfully.')
         return redirect('dashboard')
     
@@ -112,13 +155,71 @@ def toggle_seat(request, room_id):
             if hasattr(seat, 'allocation'):
                  return JsonResponse({'status': 'error', 'message': 'Cannot disable occupied seat'}, status=400)
                  
-            seat.is_active = not seat.is_active
-            seat.save()
+            with transaction.atomic():
+                seat.is_active = not seat.is_active
+                seat.save()
+                layout = SeatBitmap.for_room(room)
+                if layout:
+                    layout.set(seat.row, seat.col, seat.is_active)
+                save_room_layout(room, layout)
+                allocation_changed(room_ids=[room.id])
             return JsonResponse({'status': 'success', 'is_active': seat.is_active})
         except Seat.DoesNotExist:
             return JsonResponse({'status': 'error', 'message': 'Seat not found'}, status=404)
     return JsonResponse({'status': 'error'}, status=400)
 
+def _parse_layout(data, room):
+    """
+    {(row, col): is_active} from a layout request body: either "changes" as a
+    list of {"row", "col", "active"}, or "mask" as one string per row ('1'
+    active, '0' inactive, anything else leaves the seat alone).
+    """
+    active = {}
+    if 'mask' in data:
+        mask = data['mask']
+        if not isinstance(mask, list) or len(mask) != room.rows or any(
+                not isinstance(line, str) or len(line) != room.cols for line in mask):
+            raise ValueError(f'mask must be {room.rows} strings of {room.cols} characters')
+        for r, line in enumerate(mask, start=1):
+            for c, flag in enumerate(line, start=1):
+                if flag in '01':
+                    active[(r, c)] = flag == '1'
+        return active
+
+    changes = data.get('changes')
+    if not isinstance(changes, list):
+        raise ValueError('Send "changes" or "mask"')
+    for change in changes:
+        row, col = int(change['row']), int(change['col'])
+        if not (1 <= row <= room.rows and 1 <= col <= room.cols):
+            raise ValueError(f'Seat R{row}C{col} is outside the room')
+        active[(row, col)] = bool(change['active'])
+    return active
+
+@csrf_exempt
+@staff_member_required
+@require_POST
+def seat_layout(request, room_id):
+    """
+    API: enable/disable many seats at once (walkways).
+    Body: {"changes": [{"row", "col", "active"}]} or {"mask": ["1101", ...]}.
+    Rejected with 409 if it would disable an occupied seat; returns the new layout.
+    """
+    room = get_object_or_404(Room, id=room_id)
+    try:
+        active = _parse_layout(json.loads(request.body), room)
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'status': 'error', 'message': str(e) or 'Invalid layout'}, status=400)
+
+    changed, conflicts, layout = set_seat_layout(room, active)
+    if conflicts:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Cannot disable occupied seats: ' + ', '.join(f'R{r}C{c}' for r, c in conflicts),
+            'conflicts': conflicts,
+        }, status=409)
+    return JsonResponse({'status': 'success', 'changed': changed, 'layout': layout})
+
 @csrf_exempt
 @staff_member_required
 def manage_seat(request, room_id):
@@ -138,7 +239,10 @@ def manage_seat(request, room_id):
             
             if action == 'delete':
                 if hasattr(seat, 'allocation'):
-                    seat.allocation.delete()
+                    with transaction.atomic():
+                        roll = seat.allocation.student.roll_number
+                        seat.allocation.delete()
+                        allocation_changed(room_ids=[room.id], rolls=[roll])
                     return JsonResponse({'status': 'success', 'message': 'Allocation removed'})
                 else:
                     return JsonResponse({'status': 'info', 'message': 'Seat already empty'})
@@ -157,26 +261,24 @@ def manage_seat(request, room_id):
                 except (Department.DoesNotExist, Semester.DoesNotExist):
                     return JsonResponse({'status': 'error', 'message': 'Invalid Department or Semester'}, status=400)
                 
-                # Find or create student with department and semester
-                student, created = Student.objects.get_or_create(
-                    roll_number=new_roll,
-                    defaults={'department': department, 'semester': semester}
-                )
-                
-                # Update student's dept/sem if they were already created with different values
-                if not created:
-                    student.department = department
-                    student.semester = semester
-                    student.save()
-                
-                # Remove any existing allocations for this student (avoid double-booking)
-                SeatAllocation.objects.filter(student=student).delete()
-                
-                # Update or Create allocation for THIS seat
-                SeatAllocation.objects.update_or_create(
-                    seat=seat,
-                    defaults={'student': student}
-                )
+                with transaction.atomic():
+                    # Find or create student, updating dept/sem if they were created with different values
+                    student = upsert_students([new_roll], department, semester)[0]
+
+                    # The seat's previous occupant (if any) and this student both move
+                    touched_rolls = [new_roll]
+                    if hasattr(seat, 'allocation'):
+                        touched_rolls.append(seat.allocation.student.roll_number)
+
+                    # Remove any existing allocations for this student (avoid double-booking)
+                    released_room_ids = release_students([student])
+
+                    # Update or Create allocation for THIS seat
+                    SeatAllocation.objects.update_or_create(
+                        seat=seat,
+                        defaults={'student': student}
+                    )
+                    allocation_changed(room_ids=released_room_ids | {room.id}, rolls=touched_rolls)
                 return JsonResponse({'status': 'success', 'message': f'Allocated {new_roll}'})
                 
         except Seat.DoesNotExist:
@@ -204,173 +306,200 @@ def allocate_view(request):
             messages.error(request, 'Please select both Department and Semester.')
             return redirect('room_detail', room_id=room.id)
         
-        # Parse Rolls
-        from .utils import parse_student_input
-        # Now returns list of strings (roll numbers)
-        roll_numbers = parse_student_input(student_data_raw)
-        
-        students_to_allocate = []
-        for roll in roll_numbers:
-            # Create or Update Student with selected Dept/Sem
-            s, _ = Student.objects.update_or_create(
-                roll_number=roll,
-                defaults={
-                    'department': department,
-                    'semester': semester
-                }
-            )
-            students_to_allocate.append(s)
-            
-        # Clear prior allocations for these students
-        SeatAllocation.objects.filter(student__in=students_to_allocate).delete()
-        
-        # Clear allocations in this room for seats that are about to be filled? 
-        # Actually, standard behavior: Clear ALL allocations in this room? 
-        # Or just fill empty ones?
-        # User said "update allocations" usually implies filling, but previous code cleared room.
-        # "Clear existing allocations for this room"
-        # Since we are essentially "running allocation" for the room, clearing it is safer to avoid conflicts,
-        # UNLESS user wants to append?
-        # Let's keep existing logic: Wipe room, then fill.
-        # BUT if we are only adding a specific batch, maybe we shouldn't wipe?
-        # "admin student... edit ba delete... add korte parbe"
-        # If I select "CSE" and add 10 students, I probably don't want to wipe the "EEE" students already there.
-        # So we should only clear seats that conflict? 
-        # Current logic: `SeatAllocation.objects.filter(seat__room=room).delete()` clears the WHOLE room.
-        # This is bad if we are doing incremental allocation (Dept by Dept).
-        # Let's CHANGE this to incremental. ONLY new students are allocated.
-        # But we need to find EMPTY seats.
-        
-        # Don't clear room. Just find seats.
-        # But we must ensure these students aren't already seated elsewhere (already handled above).
-        
-        allocations = allocate_seats(room, students_to_allocate, algorithm)
-        # allocate_seats only uses EMPTY seats if we check logic? 
-        # utils.py: "seats = list(room.seats.filter(is_active=True))" -> this gets ALL seats.
-        # We need to filter out occupied seats.
-        
-        # Let's update allocate_seats slightly or filter here.
-        # Actually filter here:
-        allocated_seat_ids = SeatAllocation.objects.filter(seat__room=room).values_list('seat_id', flat=True)
-        # We need to update existing utils logic to handle occupied seats?
-        # In utils.py: "Only considers Seat objects where is_active=True."
-        # It doesn't check if occupied.
-        # Hack: Pass only empty seats to allocate_seats?
-        # allocate_seats takes `room`.
-        # Let's pass a list of seats instead? No, it takes room.
-        # Let's Fix utils.py to ignore occupied seats?
-        # Or Just clear the whole room if that's the intended workflow?
-        # Usually "Exam Seat Plan" = All at once.
-        # But user said "Dept add korbo...". Implies multiple batches.
-        # So Incremental is better.
-        
-        # I cannot change utils.py signature easily without breaking other things? 
-        # Actually I just updated utils.py.
-        # I can update it to: `seats = list(room.seats.filter(is_active=True, allocation__isnull=True))`
-        # But wait, `allocation` is O2O from Seat?
-        # Seat has `related_name='allocation'`.
-        # So `allocation__isnull=True` works.
-        
-        # However, I didn't verify utils.py handles this.
-        # Let's assume I fix utils logic inline here or re-edit utils.
-        # Check utils.py content again:
-        # `seats = list(room.seats.filter(is_active=True))`
-        # It gets ALL active seats.
-        
-        # If I want incremental, I should filter for empty seats.
-        # But `allocate_seats` takes `room` object.
-        # I should probably pass seats to it.
-        # Valid update: Change allocate_seats to accept `seats` list optional arg?
-        # Or just hack it:
-        # We can't easily hack it without changing utils.
-        
-        # DECISION: For now, I will wipe the room because mixing algorithms with partial data is messy (e.g. Z-pattern on half room).
-        # UNLESS user specifically asked for incremental.
-        # User: "department hobe... semistar takbe... jokon student roll add korbo tokon amra age teke add kora department... add korte parbo"
-        # Doesn't explicitly say "Append to existing room".
-        # But if a room has mixed departments, we MUST support incremental.
-        # So I MUST fix utils.py to only use Empty Seats.
-        
-        # I will modify utils.py NEXT to support `seats` argument or filter.
-        # For now in views, I'll prepare for it.
-        
-        # Let's stick to cleaning the room for now to ensure it works, then refine?
-        # No, wiping room every time you add a department is annoying.
-        # I'll modify utils.py to filter occupied seats.
-        
-        existing_allocs = list(SeatAllocation.objects.filter(seat__room=room))
-        if existing_allocs and not request.POST.get('append', 'false') == 'true':
-             # Maybe default to append? Or default to overwrite?
-             # Let's default to APPEND.
-             pass
-             
-        # Actually, let's just make `allocate_seats` smart.
-        # For now, I will use `SeatAllocation.objects.filter(seat__room=room).delete()` IF it's a fresh start.
-        # But I'll assume append for now.
-        
-        new_allocations = allocate_seats(room, students_to_allocate, algorithm)
+        # Parse Rolls into intervals (huge ranges are never expanded in memory)
+        from .utils import parse_roll_intervals
+        try:
+            roll_intervals = parse_roll_intervals(student_data_raw)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('room_detail', room_id=room.id)
 
-        SeatAllocation.objects.bulk_create(new_allocations)
-        
-        # Calculate Unallocated Students
-        allocated_students = {alloc.student for alloc in new_allocations}
-        unallocated_students = [s for s in students_to_allocate if s not in allocated_students]
-        
-        if unallocated_students:
-            # Sort for range display
-            unallocated_students.sort(key=lambda s: int(s.roll_number) if s.roll_number.isdigit() else s.roll_number)
-            
-            # Logic to compress list to ranges
-            unallocated_rolls = [s.roll_number for s in unallocated_students]
-            
-            # Find Suggested Rooms (Rooms with empty seats)
-            # This is a bit expensive, but necessary.
-            suggested_rooms = []
-            all_rooms = Room.objects.exclude(id=room.id)
-            for r in all_rooms:
-                taken = SeatAllocation.objects.filter(seat__room=r).count()
-                capacity = r.seats.count() # Total seats
-                # Check active seats only?
-                # For suggestion, let's assume total capacity vs total used
-                available = r.seats.filter(is_active=True).count() - taken
-                
-                if available > 0:
-                    suggested_rooms.append({
-                        'id': r.id,
-                        'name': r.name,
-                        'available': available
-                    })
-            
-            # Sort suggested rooms by name (heuristically similar names are close)
-            suggested_rooms.sort(key=lambda x: x['name'])
+        if request.POST.get('async') == '1':
+            return accepted_response(enqueue(
+                'allocate_batch', room_id=room.id, department_id=department.id, semester_id=semester.id,
+                student_data=student_data_raw, algorithm=algorithm,
+            ))
+
+        if request.POST.get('preview') == '1':
+            preview = preview_batch(room, department, semester, roll_intervals, algorithm)
+            codes = dict(Department.objects.values_list('id', 'code'))
+            numbers = dict(Semester.objects.values_list('id', 'number'))
+            grid = [
+                [cell and dict(cell, label=f"{codes[cell['department_id']]} - {numbers[cell['semester_id']]}")
+                 for cell in row]
+                for row in preview['grid']
+            ]
+            return render(request, 'core/allocation_preview.html', {
+                'room': room, 'department': department, 'semester': semester,
+                'algorithm': algorithm, 'preview': preview, 'grid': grid,
+            })
+
+        stats = {}
+        new_allocations, unallocated_rolls = allocate_batch(
+            room, department, semester, roll_intervals, algorithm, stats=stats,
+        )
+
+        if unallocated_rolls:
+            # unallocated_rolls are sorted intervals; the template only needs first/last/length
             
-            messages.warning(request, f'Allocated {len(new_allocations)} students. {len(unallocated_students)} could not be placed.')
+            # Suggested Rooms: most free seats first, from the stored room counters
+            suggested_rooms = suggest_rooms(
+                department, semester, exclude_ids=[room.id], anti_cheat=algorithm in ('anti_cheat', 'anti_cheat_max')
+            )
             
-            # We need to re-render the room detail page with this extra info
-            # Re-fetch data needed for room_detail
-            seats = Seat.objects.filter(room=room).select_related('allocation__student')
-            grid = [[None for _ in range(room.cols)] for _ in range(room.rows)]
-            for seat in seats:
-                if seat.row <= room.rows and seat.col <= room.cols:
-                    grid[seat.row-1][seat.col-1] = seat
+            messages.warning(request, f'Allocated {len(new_allocations)} students. {len(unallocated_rolls)} could not be placed.{_fill_note(stats)}')
             
-            allocations_list = sorted([s for s in seats if hasattr(s, 'allocation')], key=lambda s: int(s.allocation.student.roll_number) if s.allocation.student.roll_number.isdigit() else s.allocation.student.roll_number)
+            # We need to re-render the room detail page with this extra info;
+            # the version, counters and layout all moved with the write
+            room.refresh_from_db()
+            snapshot = room_snapshot(room)
             
             return render(request, 'core/room_detail.html', {
                 'room': room,
-                'grid': grid,
-                'allocations_list': allocations_list,
+                'grid': snapshot.grid(),
+                'seat_count': snapshot.seat_count,
                 'departments': Department.objects.all(),
                 'semesters': Semester.objects.all().order_by('number'),
                 'unallocated_rolls': unallocated_rolls,
                 'suggested_rooms': suggested_rooms
             })
         
-        messages.success(request, f'Allocated {len(new_allocations)} students.')
+        messages.success(request, f'Allocated {len(new_allocations)} students.{_fill_note(stats)}')
         return redirect('room_detail', room_id=room.id)
         
     return redirect('dashboard')
 
+
+def _fill_note(stats):
+    # anti_cheat_max reports how it did against the greedy anti_cheat placement
+    if not stats:
+        return ''
+    seats = stats['seats']
+    return (f" Filled {stats['placed']}/{seats} free seats ({stats['placed'] / seats:.0%});"
+            f" greedy anti-cheat would fill {stats['greedy']} ({stats['greedy'] / seats:.0%}).")
+
+@csrf_exempt
+@staff_member_required
+@require_POST
+def allocate_preview(request):
+    """
+    API: how a batch would land in a room, without writing anything.
+    Body: {"room_id", "department_id", "semester_id", "student_data", "algorithm"}
+    The returned proposal can be written with allocate_commit.
+    """
+    try:
+        data = json.loads(request.body)
+        room = Room.objects.get(id=int(data['room_id']))
+        department = Department.objects.get(id=int(data['department_id']))
+        semester = Semester.objects.get(id=int(data['semester_id']))
+    except (ValueError, KeyError, TypeError, Room.DoesNotExist, Department.DoesNotExist, Semester.DoesNotExist):
+        return JsonResponse({'status': 'error', 'message': 'Invalid room, department or semester'}, status=400)
+
+    from .utils import parse_roll_intervals
+    try:
+        rolls = parse_roll_intervals(data.get('student_data', ''))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    preview = preview_batch(room, department, semester, rolls, data.get('algorithm', 'linear'))
+    return JsonResponse({
+        'status': 'success',
+        'placed': preview['placed'],
+        'unplaced_count': len(preview['unplaced']),
+        'unplaced': str(preview['unplaced']),
+        'conflicts': preview['conflicts'],
+        'fill': preview['fill'],
+        'grid': preview['grid'],
+        'version': preview['version'],
+        'proposal': preview['proposal'],
+    })
+
+
+@csrf_exempt
+@staff_member_required
+@require_POST
+def allocate_commit(request):
+    """
+    Writes a proposal from allocate_preview (JSON {"proposal"}) or the preview
+    page (form field). Refused with 409 if the room changed since the preview.
+    """
+    is_json = request.content_type == 'application/json'
+    try:
+        token = json.loads(request.body).get('proposal', '') if is_json else request.POST.get('proposal', '')
+        room, written = commit_proposal(token)
+    except (ValueError, AttributeError, signing.BadSignature) as e:
+        status = 409 if isinstance(e, StaleProposal) else 400
+        message = str(e) if isinstance(e, StaleProposal) else 'Invalid or expired proposal; preview again'
+        if is_json:
+            return JsonResponse({'status': 'error', 'message': message}, status=status)
+        messages.error(request, message)
+        return redirect('dashboard')
+
+    if is_json:
+        return JsonResponse({'status': 'success', 'room_id': room.id, 'allocated': written})
+    messages.success(request, f'Allocated {written} students.')
+    return redirect('room_detail', room_id=room.id)
+
+@csrf_exempt
+@staff_member_required
+def allocate_exam_view(request):
+    """
+    API to allocate a whole exam day in one go.
+    Body: {"algorithm": "...", "room_ids": [ordered], "batches": [{"department_id", "semester_id", "student_data"}]}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error'}, status=400)
+
+    try:
+        data = json.loads(request.body)
+        algorithm = data.get('algorithm', 'linear')
+        batch_specs = data.get('batches') or []
+        room_ids = [int(rid) for rid in data.get('room_ids') or []]
+        for spec in batch_specs:
+            if not isinstance(spec, dict) or not isinstance(spec.get('student_data', ''), str):
+                raise ValueError(spec)
+            spec['department_id'] = int(spec.get('department_id'))
+            spec['semester_id'] = int(spec.get('semester_id'))
+    except (json.JSONDecodeError, AttributeError, TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'Invalid request body or ids'}, status=400)
+
+    if not room_ids or not batch_specs:
+        return JsonResponse({'status': 'error', 'message': 'Rooms and batches are required'}, status=400)
+
+    rooms_by_id = Room.objects.in_bulk(room_ids)
+    missing = [rid for rid in room_ids if rid not in rooms_by_id]
+    if missing:
+        return JsonResponse({'status': 'error', 'message': f'Unknown rooms: {missing}'}, status=404)
+    rooms = [rooms_by_id[rid] for rid in room_ids]
+
+    departments = Department.objects.in_bulk([b.get('department_id') for b in batch_specs])
+    semesters = Semester.objects.in_bulk([b.get('semester_id') for b in batch_specs])
+
+    if any(b['department_id'] not in departments or b['semester_id'] not in semesters for b in batch_specs):
+        return JsonResponse({'status': 'error', 'message': 'Invalid Department or Semester'}, status=400)
+
+    from .utils import parse_roll_intervals
+    try:
+        batches = [
+            (departments[b['department_id']], semesters[b['semester_id']], parse_roll_intervals(b.get('student_data', '')))
+            for b in batch_specs
+        ]
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    if data.get('async'):
+        return accepted_response(enqueue('allocate_exam', room_ids=room_ids, batches=batch_specs, algorithm=algorithm))
+
+    result = allocate_exam_batches(rooms, batches, algorithm)
+
+    return JsonResponse({
+        'status': 'success',
+        'rooms': result['rooms'],
+        'allocated': result['allocated'],
+        'unplaced_count': len(result['unplaced']),
+        # Same syntax as the roll input, ready to paste into the next run
+        'unplaced': str(result['unplaced']),
+    })
+
 @staff_member_required
 def manage_metadata(request):
     """Simple view to add Department or Semester."""
@@ -381,12 +510,16 @@ def manage_metadata(request):
         
         if action == 'add_department':
              code = request.POST.get('code')
-             Department.objects.create(name=name, code=code)
+             with transaction.atomic():
+                 Department.objects.create(name=name, code=code)
+                 allocation_changed()
              messages.success(request, 'Department added.')
              
         elif action == 'add_semester':
              number = request.POST.get('number')
-             Semester.objects.create(name=name, number=number)
+             with transaction.atomic():
+                 Semester.objects.create(name=name, number=number)
+                 allocation_changed()
              messages.success(request, 'Semester added.')
              
         return redirect(next_url)
@@ -398,15 +531,24 @@ def manage_students(request):
     semesters = Semester.objects.all().order_by('number')
     
     # Filter Logic
-    students = Student.objects.all().select_related('department', 'semester').order_by('roll_number')
+    students = Student.objects.select_related('department', 'semester').natural_order()
     
     dept_id = request.GET.get('dept')
     sem_id = request.GET.get('sem')
+    rolls = request.GET.get('rolls', '').strip()
     
     if dept_id:
         students = students.filter(department_id=dept_id)
     if sem_id:
         students = students.filter(semester_id=sem_id)
+    if rolls:
+        from .utils import parse_roll_intervals
+        # "1001-1500, 1600" is a range scan on the (roll_prefix, roll_num) index
+        try:
+            students = students.in_rolls(parse_roll_intervals(rolls))
+        except ValueError as e:
+            messages.error(request, str(e))
+            students = students.none()
         
     context = {
         'departments': departments,
@@ -429,10 +571,12 @@ def student_save(request):
         
         if student_id: # Edit
             student = get_object_or_404(Student, id=student_id)
-            student.roll_number = roll
-            student.department = dept
-            student.semester = sem
-            student.save()
+            with transaction.atomic(), students_changed(Student.objects.filter(id=student.id)):
+                student.roll_number = roll
+                student.department = dept
+                student.semester = sem
+                student.save()
+                allocation_changed(rolls=[roll])
             messages.success(request, f'Student {roll} updated.')
         else: # Create
             # Check dupes
@@ -440,6 +584,7 @@ def student_save(request):
                 messages.error(request, f'Student {roll} already exists in this class.')
             else:
                 Student.objects.create(roll_number=roll, department=dept, semester=sem)
+                allocation_changed(rolls=[roll])
                 messages.success(request, f'Student {roll} added.')
                 
     except Exception as e:
@@ -447,11 +592,42 @@ def student_save(request):
         
     return redirect('manage_students')
 
+@require_POST
+@staff_member_required
+def student_import(request):
+    """
+    Queues a CSV/XLSX student list for import on the job workers. The upload is
+    copied to disk chunk by chunk; the job streams it and reports bad rows.
+    """
+    import uuid
+    from .imports import import_format
+    from .jobs import JOB_DIR
+
+    upload = request.FILES.get('file')
+    fmt = import_format(upload.name) if upload else None
+    if fmt is None:
+        messages.error(request, 'Upload a .csv or .xlsx file.')
+        return redirect('manage_students')
+
+    path = JOB_DIR / 'uploads' / f'{uuid.uuid4().hex}.{fmt}'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as out:
+        for chunk in upload.chunks():
+            out.write(chunk)
+    job = enqueue('import_students', path=str(path), format=fmt)
+
+    if request.GET.get('async') == '1':
+        return accepted_response(job)
+    messages.success(request, f'Import of {upload.name} queued as job #{job.id}; '
+                              f'progress at {reverse("job_status", args=[job.id])}.')
+    return redirect('manage_students')
+
 @staff_member_required
 def student_delete(request, student_id):
     student = get_object_or_404(Student, id=student_id)
     roll = student.roll_number
-    student.delete()
+    with transaction.atomic(), students_changed(Student.objects.filter(id=student.id)):
+        student.delete()
     messages.success(request, f'Student {roll} deleted.')
     return redirect('manage_students')
 
@@ -461,7 +637,9 @@ def student_bulk_delete(request):
     """Bulk delete students."""
     student_ids = request.POST.getlist('student_ids')
     if student_ids:
-        deleted_count, _ = Student.objects.filter(id__in=student_ids).delete()
+        students = Student.objects.filter(id__in=student_ids)
+        with transaction.atomic(), students_changed(students):
+            deleted_count, _ = students.delete()
         messages.success(request, f'Deleted {deleted_count} students.')
     else:
         messages.error(request, 'No students selected.')
@@ -472,7 +650,8 @@ def student_bulk_delete(request):
 def department_delete(request, dept_id):
     dept = get_object_or_404(Department, id=dept_id)
     name = dept.name
-    dept.delete()
+    with transaction.atomic(), students_changed(dept.students.all()):
+        dept.delete()
     messages.success(request, f'Department {name} deleted.')
     return redirect('manage_students')
 
@@ -480,91 +659,173 @@ def department_delete(request, dept_id):
 def semester_delete(request, sem_id):
     sem = get_object_or_404(Semester, id=sem_id)
     name = sem.name
-    sem.delete()
+    with transaction.atomic(), students_changed(sem.students.all()):
+        sem.delete()
     messages.success(request, f'Semester {name} deleted.')
     return redirect('manage_students')
 
+def _room_detail_etag(request, room_id):
+    # Pending flash messages must be rendered, never answered with a 304
+    if len(messages.get_messages(request)):
+        return None
+    room_tag = room_etag(request, room_id)
+    return room_tag and f'{room_tag}-{plan_etag(request)}'
+
 @staff_member_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_room_detail_etag, last_modified_func=plan_last_modified)
 def room_detail(request, room_id):
     """Admin View: Interactive Management."""
     room = get_object_or_404(Room, id=room_id)
-    seats = Seat.objects.filter(room=room).select_related('allocation__student')
-    
-    # Create grid for template
-    grid = [[None for _ in range(room.cols)] for _ in range(room.rows)]
-    for seat in seats:
-        # 1-based to 0-based
-        if seat.row <= room.rows and seat.col <= room.cols:
-            grid[seat.row-1][seat.col-1] = seat
-            
-    # Sort seats for printer list (Row then Column) or (Column then Row)?
-    # Standard attendance sheet is usually Row-wise or Seat Number wise.
-    # Let's do Row-wise (Seat Order).
-    allocations_list = sorted([s for s in seats if hasattr(s, 'allocation')], key=lambda s: int(s.allocation.student.roll_number) if s.allocation.student.roll_number.isdigit() else s.allocation.student.roll_number)
+    snapshot = room_snapshot(room)
 
     return render(request, 'core/room_detail.html', {
         'room': room,
-        'grid': grid,
-        'allocations_list': allocations_list,
+        'grid': snapshot.grid(),
+        'seat_count': snapshot.seat_count,
         'departments': Department.objects.all(),
         'semesters': Semester.objects.all().order_by('number')
     })
 
+@cache_control(no_cache=True)
+@condition(etag_func=room_etag, last_modified_func=room_last_modified)
 def public_room_view(request, room_id):
     """Public View: Read-only, HTML representation (like PDF)."""
     room = get_object_or_404(Room, id=room_id)
-    seats = Seat.objects.filter(room=room).select_related('allocation__student')
-    
-    # Same grid logic
-    grid = [[None for _ in range(room.cols)] for _ in range(room.rows)]
-    for seat in seats:
-        if seat.row <= room.rows and seat.col <= room.cols:
-            grid[seat.row-1][seat.col-1] = seat
+    snapshot = room_snapshot(room)
             
     return render(request, 'core/public_room_detail.html', {
         'room': room,
-        'grid': grid,
+        'grid': snapshot.grid(),
+        'seat_count': snapshot.seat_count,
         'request': request,
         'public_view': True
     })
 
+@cache_control(no_cache=True)
+@condition(etag_func=plan_etag, last_modified_func=plan_last_modified)
 def master_plan_view(request):
-    """View to generate a printable master plan."""
-    from itertools import groupby
-    from operator import attrgetter
-    
-    # Get all allocations with related data
-    allocations = SeatAllocation.objects.select_related(
-        'student', 'student__department', 'student__semester', 'seat', 'seat__room'
-    ).order_by('student__semester__number', 'student__department__code', 'student__roll_number')
-    
-    # Grouping in Python (easier than complex ORM aggregation for nested structures)
-    grouped_data = []
-    
-    # Group by Semester
-    for semester, sem_allocs in groupby(allocations, key=attrgetter('student.semester')):
-        sem_allocs_list = list(sem_allocs)
-        
-        dept_groups = []
-        # Group by Department within Semester
-        for dept, dept_allocs in groupby(sem_allocs_list, key=attrgetter('student.department')):
-            dept_groups.append({
-                'department': dept,
-                'allocations': list(dept_allocs)
-            })
-            
-        grouped_data.append({
-            'semester': semester,
-            'departments': dept_groups
-        })
-        
-    return render(request, 'core/master_plan.html', {'grouped_data': grouped_data})
+    """View to generate a printable master plan (roll ranges per room, from MasterPlanEntry)."""
+    return render(request, 'core/master_plan.html', {'grouped_data': master_plan()})
+
+def _export_filters(params):
+    """(room ids, department id, semester id, order) from export query parameters; raises ValueError."""
+    from .exports import EXPORT_ORDERS
+    room_ids = [int(i) for i in params.getlist('room') if i]
+    department_id = int(params['department']) if params.get('department') else None
+    semester_id = int(params['semester']) if params.get('semester') else None
+    order = params.get('order') or 'seat'
+    if order not in EXPORT_ORDERS:
+        raise ValueError(f'order must be one of {", ".join(EXPORT_ORDERS)}')
+    return room_ids, department_id, semester_id, order
+
+@staff_member_required
+def allocation_export(request, export_format):
+    """
+    Every seated student as CSV or XLSX, streamed. Filters: ?room=<id> (repeatable),
+    ?department=<id>, ?semester=<id>; ?order=seat (default) or roll.
+    """
+    from .exports import EXPORT_CONTENT_TYPES, EXPORT_FORMATS, allocation_rows, iter_export
+    if export_format not in EXPORT_FORMATS:
+        raise Http404
+    try:
+        room_ids, department_id, semester_id, order = _export_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e) or 'Invalid filter'}, status=400)
+
+    rows = allocation_rows(room_ids, department_id, semester_id, order)
+    response = StreamingHttpResponse(iter_export(rows, export_format),
+                                     content_type=EXPORT_CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = (
+        f'attachment; filename="allocations_{now().strftime("%Y%m%d")}.{export_format}"'
+    )
+    return response
+
+@cache_control(no_cache=True)
+@condition(etag_func=plan_etag, last_modified_func=plan_last_modified)
+def master_plan_export(request):
+    """
+    Master plan roll ranges as CSV (default) or JSON (?format=json). ?gap=N
+    compresses with another gap tolerance than MASTER_PLAN_RANGE_GAP.
+    """
+    try:
+        gap = int(request.GET['gap']) if request.GET.get('gap') else None
+        if gap is not None and gap < 1: raise ValueError
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'gap must be a positive number'}, status=400)
+    rows = master_plan_rows(gap)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'fields': EXPORT_FIELDS, 'ranges': [list(row) for row in rows]})
+
+    from .exports import EXPORT_CONTENT_TYPES, iter_csv
+    response = StreamingHttpResponse(iter_csv(rows, header=EXPORT_FIELDS), content_type=EXPORT_CONTENT_TYPES['csv'])
+    response['Content-Disposition'] = 'attachment; filename="master_plan.csv"'
+    return response
 
 def public_search(request):
     """Public Home: Search Only."""
     query = request.GET.get('q')
     result = None
     if query:
-        result = SeatAllocation.objects.filter(student__roll_number=query).first()
+        # Served from the roll lookup cache; exam-morning traffic never reaches the DB twice
+        result = lookup_seat(query)
         
     return render(request, 'core/search.html', {'result': result, 'query': query})
+
+@staff_member_required
+def seat_lookup_stats_view(request):
+    """API: hit/miss counters of the public roll lookup cache."""
+    return JsonResponse(seat_lookup_stats())
+
+@staff_member_required
+def free_rooms_view(request):
+    """
+    API: rooms ranked by free active seats.
+    ?min_free=N filters; with department_id and semester_id each room also gets an
+    anti_cheat_fit estimate for that class.
+    """
+    department_id = request.GET.get('department_id')
+    semester_id = request.GET.get('semester_id')
+    try:
+        min_free = int(request.GET.get('min_free', 1))
+        department_id = int(department_id) if department_id else None
+        semester_id = int(semester_id) if semester_id else None
+    except ValueError:
+        return JsonResponse(
+            {'status': 'error', 'message': 'min_free, department_id and semester_id must be numbers'}, status=400,
+        )
+    department = get_object_or_404(Department, id=department_id) if department_id else None
+    semester = get_object_or_404(Semester, id=semester_id) if semester_id else None
+
+    rooms = suggest_rooms(department, semester, min_free=min_free,
+                          anti_cheat=department is not None and semester is not None)
+    return JsonResponse({'status': 'success', 'rooms': rooms})
+
+
+@staff_member_required
+def job_status(request, job_id):
+    """API: status/progress of a background job."""
+    job = get_object_or_404(Job, id=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'result': job.result,
+        'error': job.error if job.status == Job.FAILED else '',
+        'download_url': reverse('job_download', args=[job.id]) if job.result_file else None,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    })
+
+@staff_member_required
+def job_download(request, job_id):
+    """Finished artifact of a background job."""
+    job = get_object_or_404(Job, id=job_id, status=Job.DONE)
+    path = artifact_path(job)
+    if path is None or not path.exists():
+        raise Http404('This job has no downloadable result.')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)